@@ -0,0 +1,176 @@
+"""只读 JSON 查询接口（与 web.py 相同的筛选条件），供下游机器人调用，替代抓取 Streamlit 页面。
+
+GET /api/messages
+    range     24h / 7d / 30d / all（默认 all）
+    tags      逗号分隔，命中任一
+    netdisks  逗号分隔的网盘显示名（如 夸克网盘,百度网盘），命中任一
+    q         关键词，空格分隔后 AND 组合
+    cursor    上一页响应中的 next_cursor
+    limit     每页条数（1-100，默认 50）
+    full      1 时返回 description
+GET /api/health
+
+响应为紧凑 JSON，带 ETag（支持 If-None-Match 返回 304），客户端接受时 gzip 压缩。
+数据库查询在有界线程池中执行（线程数即最大占用连接数），结果经 utils.result_cache 进程内共享，
+没有新写入时同一查询只访问一次数据库。
+
+用法：python api.py（端口见 API_PORT）
+"""
+import asyncio
+import base64
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiohttp import web
+from sqlalchemy import tuple_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from config import settings
+from model import Message, engine
+from utils.message_query import LIST_COLUMNS, ListRow, apply_filters, list_rows, load_details, time_range_since
+from utils.netdisk import NETDISK_BITS, ordered_links
+from utils.result_cache import page_cache
+
+# 接口时间范围参数 → web.py 中的时间范围选项
+RANGES = {
+    '24h': '最近24小时',
+    '7d': '最近7天',
+    '30d': '最近30天',
+    'all': '全部',
+}
+MAX_LIMIT = 100
+
+_executor = ThreadPoolExecutor(max_workers=settings.API_DB_WORKERS, thread_name_prefix='api-db')
+
+
+def encode_cursor(ts: datetime, msg_id: int) -> str:
+    raw = f"{ts.isoformat()}|{msg_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    ts, msg_id = base64.urlsafe_b64decode(padded).decode('utf-8').rsplit('|', 1)
+    return datetime.fromisoformat(ts), int(msg_id)
+
+
+def _split(value: str):
+    return sorted({v.strip() for v in (value or '').split(',') if v.strip()})
+
+
+def parse_params(query) -> dict:
+    """校验并规范化查询参数；非法参数抛 HTTPBadRequest"""
+    time_range = RANGES.get(query.get('range', 'all'))
+    if time_range is None:
+        raise web.HTTPBadRequest(text=f"range 可选值: {', '.join(RANGES)}")
+    netdisks = _split(query.get('netdisks', ''))
+    unknown = [n for n in netdisks if n not in NETDISK_BITS]
+    if unknown:
+        raise web.HTTPBadRequest(text=f"未知网盘类型: {', '.join(unknown)}")
+    try:
+        limit = max(1, min(MAX_LIMIT, int(query.get('limit', 50))))
+        cursor = decode_cursor(query['cursor']) if query.get('cursor') else None
+    except (ValueError, UnicodeDecodeError):
+        raise web.HTTPBadRequest(text="limit 或 cursor 无效")
+    return {
+        'time_range': time_range,
+        'tags': _split(query.get('tags', '')),
+        'netdisks': netdisks,
+        'search': ' '.join((query.get('q') or '').split()),
+        'cursor': cursor,
+        'limit': limit,
+        'full': query.get('full') == '1',
+    }
+
+
+def _load_page(params: dict):
+    with Session(engine) as session:
+        query = apply_filters(
+            session.query(*LIST_COLUMNS),
+            time_range_since(params['time_range']),
+            params['tags'],
+            params['netdisks'],
+            params['search'],
+        )
+        if params['cursor'] is not None:
+            query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(*params['cursor']))
+        return list_rows(query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(params['limit'] + 1))
+
+
+def _load_details(ids):
+    with Session(engine) as session:
+        return load_details(session, ids)
+
+
+def fetch_page(params: dict):
+    """在线程池中执行：按规范化参数共享缓存，返回 (ListRow 列表, {id: (description, links)})；
+    列表多取一条用于判断是否有下一页
+    """
+    # 相对时间范围的起点随时间推移，按分钟归入缓存键（与 web.py 一致）
+    bucket = datetime.now().strftime('%Y%m%d%H%M') if time_range_since(params['time_range']) else ''
+    key = ('api', params['time_range'], tuple(params['tags']), tuple(params['netdisks']),
+           params['search'], bucket, params['cursor'], params['limit'])
+    rows = page_cache.get(key, engine, lambda: _load_page(params))
+    ids = tuple(sorted(r.id for r in rows[:params['limit']]))
+    details = page_cache.get(('details', ids), engine, lambda: _load_details(ids)) if ids else {}
+    return rows, details
+
+
+def _item(row: ListRow, details: dict, full: bool) -> dict:
+    description, links = details.get(row.id, (None, None))
+    item = {
+        'id': row.id,
+        'title': row.title,
+        'timestamp': row.timestamp.isoformat(timespec='seconds'),
+        'links': ordered_links(links or {}),
+        'tags': row.tags or [],
+    }
+    if full:
+        item['description'] = description
+    return item
+
+
+def render_body(rows, details: dict, params: dict) -> bytes:
+    limit = params['limit']
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].timestamp, page[-1].id) if len(rows) > limit else None
+    payload = {'items': [_item(r, details, params['full']) for r in page], 'next_cursor': next_cursor}
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+async def handle_messages(request: web.Request) -> web.Response:
+    params = parse_params(request.query)
+    loop = asyncio.get_running_loop()
+    try:
+        rows, details = await loop.run_in_executor(_executor, fetch_page, params)
+    except OperationalError:
+        engine.dispose()
+        raise web.HTTPServiceUnavailable(text="数据库暂不可用")
+    body = render_body(rows, details, params)
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=5'}
+    if etag in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+    resp = web.Response(body=body, content_type='application/json', charset='utf-8', headers=headers)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        resp.enable_compression(web.ContentCoding.gzip)
+    return resp
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({'ok': True, 'netdisks': list(NETDISK_BITS), 'cache': page_cache.stats()})
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get('/api/messages', handle_messages)
+    app.router.add_get('/api/health', handle_health)
+    return app
+
+
+if __name__ == "__main__":
+    print(f"🌐 JSON 接口监听 {settings.API_HOST}:{settings.API_PORT}（数据库线程 {settings.API_DB_WORKERS}）")
+    web.run_app(create_app(), host=settings.API_HOST, port=settings.API_PORT, access_log=None)
@@ -10,8 +10,10 @@ import os
 from datetime import datetime
 from telethon import TelegramClient
 from telethon.sessions import StringSession
-from telethon.errors import ChannelPrivateError, UsernameNotOccupiedError, FloodWaitError
 from config import settings
+from utils.backfill_scheduler import BackfillScheduler, ChannelTask
+from utils.checkpoint import Checkpoint, open_checkpoint
+from utils.ingest import message_urls
 
 # 优先使用.env中的StringSession（与Main.py保持一致）
 string_session = settings.STRING_SESSION
@@ -22,26 +24,20 @@ if not string_session:
 api_id = settings.TELEGRAM_API_ID
 api_hash = settings.TELEGRAM_API_HASH
 
-async def export_channel_messages(client, channel_url, output_file):
+def make_export_job(output_file, scheduler: BackfillScheduler):
     """
-    导出单个频道的消息到文件
+    导出单个频道的消息到文件（从 task.offset_id 断点继续，限流重试与 --resume 续传都不会重复写入）
     """
-    try:
-        # 提取频道用户名
-        channel_username = channel_url.split('/')[-1]
-        print(f"📡 开始导出频道: {channel_username}")
-        
-        # 获取频道实体
-        try:
-            entity = await client.get_entity(channel_username)
-        except (ChannelPrivateError, UsernameNotOccupiedError) as e:
-            print(f"❌ 无法访问频道 {channel_username}: {e}")
-            return 0
-        
-        message_count = 0
+    every = max(1, settings.CHECKPOINT_EVERY)
+
+    async def job(client, task: ChannelTask):
+        channel_url = task.channel
+        channel_username = task.username
+        if task.offset_id == 0:
+            print(f"📡 开始导出频道: {channel_username}")
         
         # 遍历频道消息
-        async for message in client.iter_messages(entity, limit=None):
+        async for message in client.iter_messages(task.entity, limit=None, offset_id=task.offset_id):
             if message.text:
                 # 构造消息数据
                 message_data = {
@@ -54,31 +50,27 @@ async def export_channel_messages(client, channel_url, output_file):
                     'views': getattr(message, 'views', None),
                     'forwards': getattr(message, 'forwards', None),
                     'reply_to': message.reply_to_msg_id if message.reply_to else None,
-                    'media_type': str(type(message.media).__name__) if message.media else None
+                    'media_type': str(type(message.media).__name__) if message.media else None,
+                    # entities/按钮中的链接（bench_ingest.py 回放时与正文一起提取）
+                    'urls': message_urls(message),
                 }
                 
-                # 写入文件
+                # 写入文件（整行写入，多个频道并发时不会交错）
                 output_file.write(json.dumps(message_data, ensure_ascii=False) + '\n')
-                message_count += 1
+                task.advance(message.id)
                 
                 # 每1000条消息显示进度
-                if message_count % 1000 == 0:
-                    print(f"  📊 {channel_username}: 已导出 {message_count} 条消息")
-        
-        print(f"✅ 频道 {channel_username} 导出完成: {message_count} 条消息")
-        return message_count
-        
-    except FloodWaitError as e:
-        print(f"⚠️ 频道 {channel_username} 遇到限流，等待 {e.seconds} 秒")
-        await asyncio.sleep(e.seconds)
-        return 0
-    except Exception as e:
-        print(f"❌ 导出频道 {channel_username} 时出错: {e}")
-        return 0
+                if task.count % 1000 == 0:
+                    print(f"  📊 {channel_username}: 已导出 {task.count} 条消息")
+                if task.count % every == 0:
+                    await scheduler.save_checkpoint()
+            else:
+                task.offset_id = message.id
+    return job
 
-async def main():
+async def main(resume: bool = False):
     """
-    主函数：批量导出所有频道
+    主函数：批量导出所有频道；resume 为 True 时按断点续写上次的输出文件
     """
     print("🚀 开始批量导出所有频道历史数据...")
     
@@ -93,8 +85,15 @@ async def main():
     
     print(f"📋 找到 {len(channels)} 个频道")
     
-    # 创建输出文件
-    output_filename = f"all_channels_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    # 创建输出文件（续传时沿用断点中记录的文件）
+    checkpoint = open_checkpoint('all_channels_export', resume)
+    output_filename = checkpoint.output if resume else None
+    if not output_filename or not os.path.exists(output_filename):
+        if resume and output_filename:
+            print(f"⚠️ 断点对应的输出文件 {output_filename} 不存在，从头开始")
+        resume = False
+        checkpoint = Checkpoint(checkpoint.path)
+        output_filename = f"all_channels_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     
     # 创建Telegram客户端（使用StringSession）
     client = TelegramClient(StringSession(string_session), api_id, api_hash)
@@ -103,22 +102,16 @@ async def main():
         await client.start()
         print("✅ Telegram客户端连接成功")
         
-        total_messages = 0
-        successful_channels = 0
+        output_file = checkpoint.open_output(output_filename, resume)
+        try:
+            # 多个频道并发导出，限流的频道带断点重新排队
+            scheduler = BackfillScheduler(client, concurrency=settings.BACKFILL_CONCURRENCY, checkpoint=checkpoint)
+            tasks = await scheduler.run(channels, make_export_job(output_file, scheduler))
+        finally:
+            checkpoint.close()
         
-        with open(output_filename, 'w', encoding='utf-8') as output_file:
-            for i, channel_url in enumerate(channels, 1):
-                print(f"\n[{i}/{len(channels)}] 处理频道: {channel_url}")
-                
-                message_count = await export_channel_messages(client, channel_url, output_file)
-                
-                if message_count > 0:
-                    total_messages += message_count
-                    successful_channels += 1
-                
-                # 每个频道之间稍作延迟，避免限流
-                if i < len(channels):
-                    await asyncio.sleep(2)
+        total_messages = sum(t.count for t in tasks)
+        successful_channels = sum(1 for t in tasks if t.status == 'done')
         
         print(f"\n🎉 批量导出完成!")
         print(f"📊 统计信息:")
@@ -126,6 +119,8 @@ async def main():
         print(f"  - 成功导出: {successful_channels}")
         print(f"  - 总消息数: {total_messages}")
         print(f"  - 输出文件: {output_filename}")
+        for t in scheduler.failed():
+            print(f"  ❌ {t.username}: {t.error}")
         
     except Exception as e:
         print(f"❌ 批量导出失败: {e}")
@@ -133,4 +128,6 @@ async def main():
         await client.disconnect()
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    import sys
+    # --resume：按 checkpoints/all_channels_export.json 续写上次中断的导出
+    asyncio.run(main(resume='--resume' in sys.argv))
\ No newline at end of file
@@ -0,0 +1,336 @@
+"""
+采集管线基准测试：按监控端的处理顺序回放消息语料并统计各阶段耗时。
+
+管线：utils.ingest.extract_message（与监控端同一实现：prefilter → clean_noise → extract_links
+      → parse_message，含 entities/按钮 URL）→ should_drop_by_rules → upsert（可选）
+
+用法：
+  # 生成合成语料（与 batch_export_all_channels.py 导出格式一致，流式写出，可到百万级）
+  python bench_ingest.py --generate synthetic.jsonl --count 1000000
+
+  # 回放导出的语料（不写库）
+  python bench_ingest.py --corpus exported_messages.jsonl
+
+  # 直接用内存中的合成消息回放，并用内存替身模拟链接去重写入
+  python bench_ingest.py --synthetic 200000 --db memory
+
+  # 写入本地 PostgreSQL（请使用测试库，会真实写入数据）
+  python bench_ingest.py --corpus exported_messages.jsonl --db postgres --db-url postgresql://...
+"""
+import argparse
+import datetime
+import json
+import random
+import string
+import sys
+import time
+from array import array
+from itertools import islice
+from types import SimpleNamespace
+
+from contextlib import contextmanager
+
+from utils.netdisk import canonical_url
+from utils.ingest import extract_message
+from utils.channel_rules import build_rules_cache, should_drop_by_rules
+
+STAGES = ('prefilter', 'clean_noise', 'extract_links', 'parse_message', 'rules', 'db_upsert')
+
+# === 合成语料 ===
+_NETDISK_URLS = (
+    "https://pan.quark.cn/s/{code}",
+    "https://pan.baidu.com/s/{code}?pwd=abcd",
+    "https://www.aliyundrive.com/s/{code}",
+    "https://115.com/s/{code}",
+    "https://pan.xunlei.com/s/{code}?pwd=x1y2#",
+    "https://drive.uc.cn/s/{code}?public=1",
+    "https://www.123pan.com/s/{code}",
+    "https://cloud.189.cn/t/{code}",
+)
+_WORDS = ("电影", "剧集", "纪录片", "动漫", "4K", "合集", "高清", "国语", "中字", "完结", "更新", "综艺", "原盘", "无损", "音乐", "教程")
+_TAGS = ("电影", "剧集", "动漫", "纪录片", "综艺", "音乐", "学习", "软件", "4K", "美剧", "韩剧", "日剧", "国产剧")
+
+
+def synthetic_messages(count: int, channels: int = 50, dup_ratio: float = 0.1, no_link_ratio: float = 0.15,
+                       button_ratio: float = 0.2, seed: int = 42):
+    """生成与导出语料同结构的消息字典（生成器，不占用与条数成正比的内存）。
+    dup_ratio 比例的消息复用近期链接，用于覆盖“按链接覆盖更新”的路径；
+    button_ratio 比例的链接只放在按钮 URL 中（urls 字段），覆盖 entities/按钮提取的路径。
+    """
+    rnd = random.Random(seed)
+    recent = []
+    base = datetime.datetime(2024, 1, 1)
+    alphabet = string.ascii_letters + string.digits
+    for i in range(count):
+        ch = f"bench_channel_{rnd.randrange(channels)}"
+        title = "".join(rnd.choice(_WORDS) for _ in range(rnd.randint(2, 5))) + f" {i}"
+        lines = [f"名称：{title}" if rnd.random() < 0.6 else title]
+        urls = []
+        lines.append("描述：" + "，".join(rnd.choice(_WORDS) for _ in range(rnd.randint(5, 30))))
+        if rnd.random() >= no_link_ratio:
+            if recent and rnd.random() < dup_ratio:
+                url = rnd.choice(recent)
+            else:
+                code = "".join(rnd.choice(alphabet) for _ in range(12))
+                url = rnd.choice(_NETDISK_URLS).format(code=code)
+                recent.append(url)
+                if len(recent) > 10000:
+                    del recent[:5000]
+            if rnd.random() < button_ratio:
+                urls.append(url)
+                lines.append("👉 点击下方按钮获取")
+            else:
+                lines.append(f"链接：{url}")
+        lines.append("🏷 标签：" + " ".join("#" + rnd.choice(_TAGS) for _ in range(rnd.randint(1, 4))))
+        if rnd.random() < 0.5:
+            lines.append(f"📢 频道：@{ch}")
+            lines.append(f"👥 群组：@{ch}_chat")
+        text = "\n".join(lines)
+        yield {
+            'id': i + 1,
+            'date': (base + datetime.timedelta(seconds=i * 7)).isoformat(),
+            'text': text,
+            'channel': f"https://t.me/{ch}",
+            'channel_username': ch,
+            'message_url': f"https://t.me/{ch}/{i + 1}",
+            'views': None,
+            'forwards': None,
+            'reply_to': None,
+            'media_type': None,
+            'urls': urls,
+        }
+
+
+def synthetic_rules(channels: int = 50, seed: int = 42):
+    """为一半的合成频道生成排除规则，模拟后台配置"""
+    rnd = random.Random(seed)
+    rows = []
+    for c in range(0, channels, 2):
+        rows.append(SimpleNamespace(
+            channel=f"bench_channel_{c}",
+            exclude_netdisks=rnd.sample(['百度网盘', '迅雷网盘', 'UC网盘', '115网盘'], 2),
+            exclude_keywords=rnd.sample(list(_WORDS), 3),
+            exclude_tags=rnd.sample(list(_TAGS), 2),
+        ))
+    return rows
+
+
+def write_corpus(path: str, count: int, **kwargs):
+    started = time.perf_counter()
+    with open(path, 'w', encoding='utf-8') as f:
+        for n, msg in enumerate(synthetic_messages(count, **kwargs), 1):
+            f.write(json.dumps(msg, ensure_ascii=False) + '\n')
+            if n % 100000 == 0:
+                print(f"  · 已生成 {n} 条", flush=True)
+    print(f"✅ 已生成 {count} 条合成语料: {path}（{time.perf_counter() - started:.1f}s）")
+
+
+def read_corpus(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+# === 写入阶段 ===
+class MemoryStore:
+    """链接去重写入的内存替身：{规范化链接: 消息序号}，行为与 upsert_messages_batch 一致（命中任一链接即覆盖更新）"""
+
+    def __init__(self):
+        self.by_url = {}
+        self.messages = 0
+
+    def write_batch(self, items):
+        results = []
+        for parsed, _ in items:
+            urls = [canonical_url(u) for u in (parsed.get('links') or {}).values() if u]
+            target = next((self.by_url[u] for u in urls if u in self.by_url), None)
+            if target is None:
+                self.messages += 1
+                target = self.messages
+                results.append('inserted')
+            else:
+                results.append('updated')
+            for u in urls:
+                self.by_url[u] = target
+        return results
+
+
+class PostgresStore:
+    def __init__(self, db_url: str = None):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import Session
+        from model import engine, create_tables
+        from utils.message_store import upsert_messages_batch
+        self._upsert = upsert_messages_batch
+        self._session_cls = Session
+        self.engine = create_engine(db_url, pool_pre_ping=True) if db_url else engine
+        if db_url is None:
+            create_tables()
+        else:
+            from model import Base
+            Base.metadata.create_all(self.engine)
+
+    def write_batch(self, items):
+        with self._session_cls(self.engine) as session:
+            try:
+                return self._upsert(session, items)
+            except Exception:
+                session.rollback()
+                raise
+
+
+# === 回放 ===
+def run(messages, rules_cache, store=None, batch_size: int = 200, strict_only: bool = True, limit: int = None):
+    timings = {stage: array('d') for stage in STAGES}
+    counts = {'total': 0, 'dropped_non_netdisk': 0, 'dropped_no_content': 0, 'dropped_rule': 0,
+              'inserted': 0, 'updated': 0}
+    pending = []
+    clock = time.perf_counter
+
+    def flush():
+        t = clock()
+        results = store.write_batch(pending)
+        elapsed = clock() - t
+        # 批量写入耗时按条均摊，便于与单条阶段比较
+        per_item = elapsed / len(pending)
+        for r in results:
+            counts[r] += 1
+            timings['db_upsert'].append(per_item)
+        pending.clear()
+
+    @contextmanager
+    def timer(stage):
+        t = clock()
+        try:
+            yield
+        finally:
+            timings[stage].append(clock() - t)
+
+    if limit:
+        messages = islice(messages, limit)
+    started = clock()
+    for msg in messages:
+        raw = msg.get('text') or ''
+        if not raw.strip():
+            continue
+        counts['total'] += 1
+        channel = msg.get('channel_username') or ''
+
+        # 与监控端同一处理函数，阶段耗时经 timer 记录
+        parsed, reason = extract_message(raw, msg.get('urls') or (), strict_only, timer=timer)
+        if reason is not None:
+            counts[f'dropped_{reason}'] += 1
+            continue
+        if channel:
+            parsed['channel'] = channel
+
+        with timer('rules'):
+            dropped = should_drop_by_rules(rules_cache, parsed.get('channel', ''), parsed)
+        if dropped:
+            counts['dropped_rule'] += 1
+            continue
+
+        if store is not None:
+            ts = _parse_date(msg.get('date'))
+            pending.append((parsed, ts))
+            if len(pending) >= batch_size:
+                flush()
+        if counts['total'] % 100000 == 0:
+            print(f"  · 已回放 {counts['total']} 条，{counts['total'] / (clock() - started):.0f} 条/秒", flush=True)
+    if store is not None and pending:
+        flush()
+    return timings, counts, clock() - started
+
+
+def _parse_date(value):
+    if value:
+        try:
+            return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            pass
+    return datetime.datetime.utcnow()
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def report(timings, counts, elapsed: float):
+    total = counts['total']
+    print("\n📊 基准结果")
+    print(f"  消息总数: {total}，总耗时 {elapsed:.2f}s，吞吐 {total / elapsed if elapsed else 0:.0f} 条/秒")
+    print(f"  丢弃: 非网盘 {counts['dropped_non_netdisk']} / 无内容 {counts['dropped_no_content']} / 规则 {counts['dropped_rule']}")
+    print(f"  写入: 新增 {counts['inserted']} / 覆盖更新 {counts['updated']}")
+    print(f"\n  {'阶段':<14}{'次数':>10}{'p50(µs)':>12}{'p99(µs)':>12}{'均值(µs)':>12}{'合计(s)':>10}")
+    for stage in STAGES:
+        values = sorted(timings[stage])
+        if not values:
+            continue
+        s = sum(values)
+        print(f"  {stage:<14}{len(values):>10}{_percentile(values, 0.5) * 1e6:>12.1f}"
+              f"{_percentile(values, 0.99) * 1e6:>12.1f}{s / len(values) * 1e6:>12.1f}{s:>10.2f}")
+
+
+def load_rules_from_db():
+    from sqlalchemy.orm import Session
+    from model import ChannelRule, engine
+    with Session(engine) as session:
+        return session.query(ChannelRule).filter_by(enabled=True).all()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="采集管线基准测试（语料回放）")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument('--corpus', help='batch_export_all_channels.py 导出的 JSONL 语料')
+    src.add_argument('--synthetic', type=int, help='直接回放 N 条内存生成的合成消息')
+    src.add_argument('--generate', metavar='PATH', help='只生成合成语料到 PATH（配合 --count）')
+    ap.add_argument('--count', type=int, default=100000, help='--generate 生成条数')
+    ap.add_argument('--channels', type=int, default=50, help='合成频道数')
+    ap.add_argument('--dup-ratio', type=float, default=0.1, help='合成消息复用已有链接的比例')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--limit', type=int, help='最多回放条数')
+    ap.add_argument('--rules', choices=('none', 'synthetic', 'db'), default='synthetic', help='过滤规则来源')
+    ap.add_argument('--db', choices=('none', 'memory', 'postgres'), default='none', help='写入阶段：不写 / 内存替身 / PostgreSQL')
+    ap.add_argument('--db-url', help='PostgreSQL 连接串（默认使用 DATABASE_URL）')
+    ap.add_argument('--batch-size', type=int, default=200, help='写入批大小（与监控端 WRITE_BATCH_SIZE 对应）')
+    ap.add_argument('--no-strict', action='store_true', help='关闭 STRICT_NETDISK_ONLY 预过滤')
+    args = ap.parse_args()
+
+    gen_kwargs = dict(channels=args.channels, dup_ratio=args.dup_ratio, seed=args.seed)
+    if args.generate:
+        write_corpus(args.generate, args.count, **gen_kwargs)
+        return
+
+    if args.rules == 'db':
+        rules_cache = build_rules_cache(load_rules_from_db())
+    elif args.rules == 'synthetic':
+        rules_cache = build_rules_cache(synthetic_rules(args.channels, args.seed))
+    else:
+        rules_cache = {}
+
+    store = None
+    if args.db == 'memory':
+        store = MemoryStore()
+    elif args.db == 'postgres':
+        store = PostgresStore(args.db_url)
+
+    messages = read_corpus(args.corpus) if args.corpus else synthetic_messages(args.synthetic, **gen_kwargs)
+    print(f"⏱️ 开始回放（规则 {len(rules_cache)} 条，写入阶段: {args.db}）")
+    timings, counts, elapsed = run(messages, rules_cache, store, args.batch_size, not args.no_strict, args.limit)
+    report(timings, counts, elapsed)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
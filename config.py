@@ -29,6 +29,44 @@ class Settings(BaseSettings):
     DOCKER_ENV: str = "false"
     STRICT_NETDISK_ONLY: bool = False
 
+    # 监控端异步批量写入（队列上限 / 每批条数 / 最长攒批时间毫秒）
+    WRITE_QUEUE_MAXSIZE: int = 10000
+    WRITE_BATCH_SIZE: int = 200
+    WRITE_FLUSH_INTERVAL_MS: int = 500
+
+    # 多账号分片监听：最多使用的 StringSession 账号数（0 表示 TelegramConfig 中全部）
+    MONITOR_MAX_ACCOUNTS: int = 0
+
+    # 自动加入频道（并发数 / 每分钟请求数 / 突发上限 / 失败后重试间隔小时）
+    JOIN_CONCURRENCY: int = 3
+    JOIN_RATE_PER_MIN: int = 20
+    JOIN_BURST: int = 5
+    JOIN_RETRY_HOURS: int = 6
+
+    # 历史回溯每批写入条数
+    BACKFILL_BATCH_SIZE: int = 1000
+    # 批量回溯/导出时同时处理的频道数
+    BACKFILL_CONCURRENCY: int = 4
+    # 回溯/导出断点目录与保存间隔（每处理多少条消息保存一次，配合 --resume 续传）
+    CHECKPOINT_DIR: str = "checkpoints"
+    CHECKPOINT_EVERY: int = 1000
+
+    # 断线补抓（并发频道数 / 每个频道每轮拉取条数，达到后从最后一条继续拉取，0 表示一次拉完）
+    CATCHUP_CONCURRENCY: int = 4
+    CATCHUP_MAX_MESSAGES: int = 0
+
+    # 前台列表页进程内结果缓存上限（MB，所有浏览器会话共享）
+    WEB_RESULT_CACHE_MB: int = 64
+
+    # 只读 JSON 接口（api.py）：监听地址 / 端口 / 数据库查询线程数（即最多占用的连接数）
+    API_HOST: str = "0.0.0.0"
+    API_PORT: int = 8503
+    API_DB_WORKERS: int = 8
+
+    # 监控端指标服务（Prometheus 文本格式，端口为 0 时关闭）
+    METRICS_HOST: str = "0.0.0.0"
+    METRICS_PORT: int = 9108
+
     class Config:
         env_file = ".env"  # 指定 .env 文件
         env_file_encoding = "utf-8"
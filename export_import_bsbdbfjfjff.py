@@ -1,34 +1,21 @@
 import json
 import datetime
-from datetime import timezone, timedelta
+import os
 import re
-from typing import Dict, Any, List, Optional
+from typing import List, Optional
 
 from telethon.sync import TelegramClient
 from telethon.sessions import StringSession
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, cast, String
 
 from config import settings
-from model import Message, engine, ChannelRule, create_tables
+from model import engine, ChannelRule, create_tables
+from utils.backfill import BackfillEngine
+from utils.ingest import message_urls
+from utils.checkpoint import Checkpoint, open_checkpoint
+from utils.channel_rules import build_rules_cache
 
-# 北京时间时区
-BEIJING_TZ = timezone(timedelta(hours=8))
-
-def get_beijing_time():
-    """获取当前北京时间"""
-    return datetime.datetime.now(BEIJING_TZ).replace(tzinfo=None)
-
-def to_beijing_time(dt):
-    """将 datetime 对象转换为北京时间"""
-    if dt is None:
-        return get_beijing_time()
-    if dt.tzinfo is None:
-        # 假设输入是 UTC 时间
-        dt = dt.replace(tzinfo=timezone.utc)
-    return dt.astimezone(BEIJING_TZ).replace(tzinfo=None)
-
-# ------------------------ 规则缓存与判断 ------------------------
+# ------------------------ 规则缓存 ------------------------
 RULES_CACHE = {}
 
 def load_rules_cache():
@@ -36,179 +23,20 @@ def load_rules_cache():
     try:
         with Session(engine) as session:
             rules = session.query(ChannelRule).filter_by(enabled=True).all()
-            RULES_CACHE = {
-                r.channel: {
-                    'exclude_netdisks': set((r.exclude_netdisks or [])),
-                    'exclude_keywords': [kw.lower() for kw in (r.exclude_keywords or []) if kw],
-                    'exclude_tags': set((r.exclude_tags or [])),
-                }
-                for r in rules
-            }
+            RULES_CACHE = build_rules_cache(rules)
             print(f"⚙️ 已加载规则 {len(RULES_CACHE)} 条")
     except Exception as e:
         print(f"⚠️ 加载规则失败: {e}")
 
-def should_drop_by_rules(channel: str, parsed: dict) -> bool:
-    if not channel:
-        return False
-    rule = RULES_CACHE.get(channel)
-    if not rule:
-        return False
-    links = parsed.get('links') or {}
-    if links and rule['exclude_netdisks'] and (set(links.keys()) & rule['exclude_netdisks']):
-        return True
-    kws = rule['exclude_keywords']
-    if kws:
-        title = (parsed.get('title') or '').lower()
-        desc = (parsed.get('description') or '').lower()
-        for kw in kws:
-            if kw and (kw in title or kw in desc):
-                return True
-    tags = set(parsed.get('tags') or [])
-    if tags and rule['exclude_tags'] and (tags & rule['exclude_tags']):
-        return True
-    return False
-
-# ------------------------ 文本解析（与 monitor.py 保持一致） ------------------------
-
-def parse_message(text: str) -> Dict[str, Any]:
-    lines = text.split('\n')
-    title = ''
-    description = ''
-    links = {}
-    tags = []
-    source = ''
-    channel = ''
-    group = ''
-    bot = ''
-    current_section = None
-    desc_lines = []
-
-    netdisk_map = [
-        (['quark', '夸克'], '夸克网盘'),
-        (['aliyundrive', 'aliyun', '阿里', 'alipan'], '阿里云盘'),
-        (['baidu', 'pan.baidu'], '百度网盘'),
-        (['115.com', '115网盘', '115pan'], '115网盘'),
-        (['cloud.189', '天翼', '189.cn'], '天翼云盘'),
-        (['123pan', '123.yun'], '123云盘'),
-        (['ucdisk', 'uc网盘', 'ucloud', 'drive.uc.cn'], 'UC网盘'),
-        (['xunlei', 'thunder', '迅雷'], '迅雷'),
-    ]
-
-    if lines and lines[0].strip():
-        if lines[0].startswith('名称：'):
-            title = lines[0].replace('名称：', '').strip()
-        else:
-            title = lines[0].strip()
-
-    for idx, line in enumerate(lines[1:] if title else lines):
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('🏷 标签：') or line.startswith('标签：'):
-            tags.extend([tag.strip('#') for tag in line.replace('🏷 标签：', '').replace('标签：', '').split() if tag.strip('#')])
-            continue
-        if line.startswith('描述：'):
-            current_section = 'description'
-            desc_lines.append(line.replace('描述：', '').strip())
-        elif line.startswith('链接：'):
-            current_section = 'links'
-            url = line.replace('链接：', '').strip()
-            if not url:
-                continue
-            found = False
-            for keys, name in netdisk_map:
-                if any(k in url.lower() for k in keys):
-                    links[name] = url
-                    found = True
-                    break
-            if not found:
-                links['其他'] = url
-        elif line.startswith('🎉 来自：'):
-            source = line.replace('🎉 来自：', '').strip()
-        elif line.startswith('📢 频道：'):
-            channel = line.replace('📢 频道：', '').strip()
-        elif line.startswith('👥 群组：'):
-            group = line.replace('👥 群组：', '').strip()
-        elif line.startswith('🤖 投稿：'):
-            bot = line.replace('🤖 投稿：', '').strip()
-        elif current_section == 'description':
-            desc_lines.append(line)
-        else:
-            desc_lines.append(line)
-
-    desc_text = '\n'.join(desc_lines)
-    pattern = re.compile(r'([\u4e00-\u9fa5A-Za-z0-9#]+)[：:](https?://[^\s]+)')
-    matches = pattern.findall(desc_text)
-    for key, url in matches:
-        found = False
-        for keys, name in netdisk_map:
-            if any(k in url.lower() or k in key for k in keys):
-                links[name] = url
-                found = True
-                break
-        if not found:
-            links[key.strip()] = url
-    desc_text = pattern.sub('', desc_text)
-
-    url_pattern = re.compile(r'(https?://[^\s]+)')
-    for url in url_pattern.findall(desc_text):
-        found = False
-        for keys, name in netdisk_map:
-            if any(k in url.lower() for k in keys):
-                links[name] = url
-                found = True
-                break
-        if not found:
-            links['其他'] = url
-    desc_text = url_pattern.sub('', desc_text)
-
-    tag_pattern = re.compile(r'#([\u4e00-\u9fa5A-Za-z0-9_]+)')
-    found_tags = tag_pattern.findall(desc_text)
-    if found_tags:
-        tags.extend(found_tags)
-        desc_text = tag_pattern.sub('', desc_text)
-
-    tags = list(set(tags))
-    netdisk_names = ['夸克', '迅雷', '百度', 'UC', '阿里', '天翼', '115', '123云盘']
-    netdisk_name_pattern = re.compile(r'(' + '|'.join(netdisk_names) + r')')
-    desc_text = netdisk_name_pattern.sub('', desc_text)
-
-    desc_lines_final = [line for line in desc_text.strip().split('\n') if line.strip() and not re.fullmatch(r'[.。·、,，-]+', line.strip())]
-    description = '\n'.join(desc_lines_final)
-
-    return {
-        'title': title,
-        'description': description,
-        'links': links,
-        'tags': tags,
-        'source': source,
-        'channel': channel,
-        'group_name': group,
-        'bot': bot
-    }
-
-# ------------------------ 覆盖写入（以链接为唯一），批量优化 ------------------------
-
-def build_existing_link_index(session: Session) -> Dict[str, int]:
-    link_to_id: Dict[str, int] = {}
-    q = session.query(Message.id, Message.links).filter(Message.links.isnot(None))
-    for mid, links in q.yield_per(1000):
-        try:
-            for url in (links or {}).values():
-                if url and isinstance(url, str):
-                    link_to_id[url] = mid
-        except Exception:
-            continue
-    return link_to_id
-
 # ------------------------ 导出全部历史到 txt（JSONL） ------------------------
 
 from telethon.tl.functions.channels import GetFullChannelRequest
 from telethon import functions
 from telethon.tl.types import PeerChannel, InputMessagesFilterUrl
 
-def export_history_txt(output_path: str, no_comments: bool = False, url_only: bool = False, min_id: Optional[int] = None):
+def export_history_txt(output_path: str, no_comments: bool = False, url_only: bool = False, min_id: Optional[int] = None,
+                       resume: bool = False) -> bool:
+    """导出全部历史；每 CHECKPOINT_EVERY 条保存一次断点，resume 为 True 时从断点续写。返回是否导出完整"""
     api_id = settings.TELEGRAM_API_ID
     api_hash = settings.TELEGRAM_API_HASH
     # 优先使用单独的导出会话以避免与线上监控/其他进程冲突
@@ -226,6 +54,24 @@ def export_history_txt(output_path: str, no_comments: bool = False, url_only: bo
     total = 0
     from telethon.errors.rpcerrorlist import AuthKeyDuplicatedError
 
+    # 断点：记录已写入的最大消息 id 与输出文件字节数；续传时截断到断点并从该 id 之后继续
+    ckpt = open_checkpoint(f'export_{target_channel}', resume)
+    if resume and (ckpt.output != output_path or not os.path.exists(output_path)):
+        if ckpt.output:
+            print(f"⚠️ 断点对应的输出文件为 {ckpt.output}，与 {output_path} 不一致或不存在，从头导出")
+        resume = False
+        ckpt = Checkpoint(ckpt.path)
+    saved = ckpt.channel(target_channel)
+    if resume:
+        if saved['done'] and not min_id:
+            print(f"✅ 断点显示导出已完成（{saved['count']} 条），如需重新导出请去掉 --resume")
+            return True
+        total = saved['count']
+        if saved['offset_id']:
+            min_id = max(min_id or 0, saved['offset_id'])
+    last_id = saved['offset_id'] if resume else 0
+    every = max(1, settings.CHECKPOINT_EVERY)
+
     # 提取消息中的所有 URL（正文/实体/按钮）
     url_regex = re.compile(r'(https?://[^\s]+)')
     def extract_urls_from_message(m) -> List[str]:
@@ -251,7 +97,7 @@ def export_history_txt(output_path: str, no_comments: bool = False, url_only: bo
             pass
         return list(urls)
 
-    with TelegramClient(StringSession(string_session), api_id, api_hash) as client, open(output_path, 'w', encoding='utf-8') as f:
+    with TelegramClient(StringSession(string_session), api_id, api_hash) as client, ckpt.open_output(output_path, resume) as f:
         print(f"📤 正在导出频道 @{target_channel} 的全部历史消息到 {output_path}（JSONL，一行一条）...")
         if url_only:
             print("⚡ 已启用快速筛选：仅拉取包含URL的消息（服务器端过滤）")
@@ -286,80 +132,101 @@ def export_history_txt(output_path: str, no_comments: bool = False, url_only: bo
         if url_only:
             iter_kwargs['filter'] = InputMessagesFilterUrl()
 
-        for msg in client.iter_messages(target_channel, **iter_kwargs):
-            total += 1
-            text = getattr(msg, 'message', None) or getattr(msg, 'raw_text', None) or ''
+        try:
+            for msg in client.iter_messages(target_channel, **iter_kwargs):
+                total += 1
+                text = getattr(msg, 'message', None) or getattr(msg, 'raw_text', None) or ''
 
-            # 如消息提示“评论区查看”或存在评论数量，则抓取讨论组中的对应回复并合并文本与链接
-            need_fetch_comments = False
-            if not no_comments:
-                try:
-                    if text and ("评论区" in text or "评论区查看" in text or "资源评论区查看" in text):
-                        need_fetch_comments = True
-                    replies_meta = getattr(msg, 'replies', None)
-                    if replies_meta and getattr(replies_meta, 'replies', 0) > 0:
-                        need_fetch_comments = True
-                except Exception:
-                    pass
+                # 如消息提示“评论区查看”或存在评论数量，则抓取讨论组中的对应回复并合并文本与链接
+                need_fetch_comments = False
+                if not no_comments:
+                    try:
+                        if text and ("评论区" in text or "评论区查看" in text or "资源评论区查看" in text):
+                            need_fetch_comments = True
+                        replies_meta = getattr(msg, 'replies', None)
+                        if replies_meta and getattr(replies_meta, 'replies', 0) > 0:
+                            need_fetch_comments = True
+                    except Exception:
+                        pass
 
-            combined_text = text
-            comments_appended = 0
-            if discussion is not None and need_fetch_comments:
-                comment_chunks: List[str] = []
+                combined_text = text
+                comments_appended = 0
                 comment_urls: set = set()
-                try:
-                    top_id = None
+                if discussion is not None and need_fetch_comments:
+                    comment_chunks: List[str] = []
                     try:
-                        dm = client(functions.messages.GetDiscussionMessageRequest(peer=channel_entity, msg_id=getattr(msg, 'id', None)))
-                        msgs = getattr(dm, 'messages', []) or []
-                        if msgs:
-                            # 优先选择"讨论组"同一 peer 的消息作为主题帖 id
-                            cand = None
-                            for m_ in msgs:
-                                peer = getattr(m_, 'peer_id', None)
-                                if peer is not None:
-                                    # Channel 类型讨论组
-                                    if hasattr(peer, 'channel_id') and hasattr(discussion, 'id') and peer.channel_id == getattr(discussion, 'id', None):
-                                        cand = m_
-                                        break
-                                    # Chat 类型讨论组
-                                    if hasattr(peer, 'chat_id') and hasattr(discussion, 'id') and peer.chat_id == getattr(discussion, 'id', None):
-                                        cand = m_
-                                        break
-                            if cand is None:
-                                cand = msgs[0]
-                            top_id = getattr(cand, 'id', None)
+                        top_id = None
+                        try:
+                            dm = client(functions.messages.GetDiscussionMessageRequest(peer=channel_entity, msg_id=getattr(msg, 'id', None)))
+                            msgs = getattr(dm, 'messages', []) or []
+                            if msgs:
+                                # 优先选择"讨论组"同一 peer 的消息作为主题帖 id
+                                cand = None
+                                for m_ in msgs:
+                                    peer = getattr(m_, 'peer_id', None)
+                                    if peer is not None:
+                                        # Channel 类型讨论组
+                                        if hasattr(peer, 'channel_id') and hasattr(discussion, 'id') and peer.channel_id == getattr(discussion, 'id', None):
+                                            cand = m_
+                                            break
+                                        # Chat 类型讨论组
+                                        if hasattr(peer, 'chat_id') and hasattr(discussion, 'id') and peer.chat_id == getattr(discussion, 'id', None):
+                                            cand = m_
+                                            break
+                                if cand is None:
+                                    cand = msgs[0]
+                                top_id = getattr(cand, 'id', None)
+                        except Exception as e:
+                            print(f"⚠️ 获取讨论主题失败(id={getattr(msg, 'id', None)}): {e}")
+                        if top_id:
+                            for reply in client.iter_messages(discussion, reply_to=top_id):
+                                rtext = getattr(reply, 'raw_text', '') or ''
+                                if rtext:
+                                    comment_chunks.append(rtext)
+                                for u in extract_urls_from_message(reply):
+                                    comment_urls.add(u)
+                                comments_appended += 1
+                            # 将评论内容合并到原始文本，确保下游解析到评论里的链接
+                            if comment_chunks:
+                                combined_text = (text + "\n\n" if text else "") + "\n".join(comment_chunks)
+                        else:
+                            print(f"⚠️ 跳过评论抓取，无法定位讨论主题(id={getattr(msg, 'id', None)})")
                     except Exception as e:
-                        print(f"⚠️ 获取讨论主题失败(id={getattr(msg, 'id', None)}): {e}")
-                    if top_id:
-                        for reply in client.iter_messages(discussion, reply_to=top_id):
-                            rtext = getattr(reply, 'raw_text', '') or ''
-                            if rtext:
-                                comment_chunks.append(rtext)
-                            for u in extract_urls_from_message(reply):
-                                comment_urls.add(u)
-                            comments_appended += 1
-                        # 将评论内容合并到原始文本，确保下游解析到评论里的链接
-                        if comment_chunks:
-                            combined_text = (text + "\n\n" if text else "") + "\n".join(comment_chunks)
+                        print(f"⚠️ 读取评论失败(id={getattr(msg, 'id', None)}): {e}")
+
+                dt = getattr(msg, 'date', None)
+                data = {
+                    'id': getattr(msg, 'id', None),
+                    'date': (dt.isoformat() if isinstance(dt, datetime.datetime) else None),
+                    'text': combined_text,
+                    # entities/按钮中的链接（含评论），导入时与正文一起提取
+                    'urls': message_urls(msg) + sorted(comment_urls),
+                }
+                f.write(json.dumps(data, ensure_ascii=False) + '\n')
+                last_id = getattr(msg, 'id', None) or last_id
+                if total % 200 == 0:
+                    if comments_appended:
+                        print(f"  · 已导出 {total} 条（本批含评论 {comments_appended} 条）...", flush=True)
                     else:
-                        print(f"⚠️ 跳过评论抓取，无法定位讨论主题(id={getattr(msg, 'id', None)})")
-                except Exception as e:
-                    print(f"⚠️ 读取评论失败(id={getattr(msg, 'id', None)}): {e}")
-
-            dt = getattr(msg, 'date', None)
-            data = {
-                'id': getattr(msg, 'id', None),
-                'date': (dt.isoformat() if isinstance(dt, datetime.datetime) else None),
-                'text': combined_text,
-            }
-            f.write(json.dumps(data, ensure_ascii=False) + '\n')
-            if total % 200 == 0:
-                if comments_appended:
-                    print(f"  · 已导出 {total} 条（本批含评论 {comments_appended} 条）...", flush=True)
-                else:
-                    print(f"  · 已导出 {total} 条...", flush=True)
+                        print(f"  · 已导出 {total} 条...", flush=True)
+                if total % every == 0:
+                    ckpt.update(target_channel, last_id, total)
+                    ckpt.save()
+        except AuthKeyDuplicatedError:
+            # 会话被其他进程同时使用：保存当前进度，换会话或稍后用 --resume 继续
+            ckpt.update(target_channel, last_id, total)
+            ckpt.save()
+            print(f"❌ 会话冲突（AuthKeyDuplicatedError），已保存断点（消息ID {last_id}，共 {total} 条），请使用 --resume 继续")
+            return False
+        except BaseException:
+            ckpt.update(target_channel, last_id, total)
+            ckpt.save()
+            print(f"⚠️ 导出中断，已保存断点（消息ID {last_id}，共 {total} 条），可使用 --resume 继续")
+            raise
+        ckpt.update(target_channel, last_id, total, done=True)
+        ckpt.save()
     print(f"✅ 导出完成，共 {total} 条。")
+    return True
 
 # ------------------------ 从 txt 批量导入数据库（只导入含网盘链接），链接唯一覆盖 ------------------------
 
@@ -368,110 +235,31 @@ def import_from_txt(input_path: str):
     load_rules_cache()
 
     target_channel = 'bsbdbfjfjff'
-    inserted = 0
-    updated = 0
-    skipped_non_netdisk = 0
-
-    with Session(engine) as session:
-        link_index = build_existing_link_index(session)
-        print(f"🧩 现有链接索引载入完成（{len(link_index)} 条唯一链接）")
-
-        batch_add: List[Message] = []
-        batch_ops = 0
-        BATCH_SIZE = 200
-
-        with open(input_path, 'r', encoding='utf-8') as f:
-            for line_no, line in enumerate(f, start=1):
-                line = line.strip()
-                if not line:
-                    continue
+    # 与其他回溯命令共用 BackfillEngine：链接索引只载入一次，按批解析与写入
+    bf = BackfillEngine(batch_size=settings.BACKFILL_BATCH_SIZE, rules_cache=RULES_CACHE)
+    bf.load_index()
+
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            date = None
+            if obj.get('date'):
                 try:
-                    obj = json.loads(line)
+                    date = datetime.datetime.fromisoformat(obj['date'])
                 except Exception:
-                    continue
-                text = (obj.get('text') or '').strip()
-                if not text:
-                    continue
-
-                parsed = parse_message(text)
-                parsed['channel'] = target_channel
-                # 只导入“关于网盘”的消息
-                if not parsed.get('links'):
-                    skipped_non_netdisk += 1
-                    continue
-                # 规则过滤
-                if should_drop_by_rules(target_channel, parsed):
-                    continue
-
-                ts = None
-                if obj.get('date'):
-                    try:
-                        ts = to_beijing_time(datetime.datetime.fromisoformat(obj['date']))
-                    except Exception:
-                        pass
-                if not ts:
-                    ts = get_beijing_time()
-
-                urls = set((parsed.get('links') or {}).values())
-                target_id = None
-                for u in urls:
-                    if u in link_index:
-                        target_id = link_index[u]
-                        break
-
-                if target_id:
-                    # 更新路径：加载并覆盖
-                    target = session.query(Message).get(target_id)
-                    if target is not None:
-                        target.timestamp = ts
-                        target.title = parsed.get('title')
-                        target.description = parsed.get('description')
-                        target.links = parsed.get('links')
-                        target.tags = parsed.get('tags')
-                        target.source = parsed.get('source')
-                        target.channel = parsed.get('channel')
-                        target.group_name = parsed.get('group_name')
-                        target.bot = parsed.get('bot')
-                        updated += 1
-                        # 更新索引：使用新链接集合指向同一 id
-                        for u in urls:
-                            link_index[u] = target.id
-                    else:
-                        # 异常情况：索引存在但找不到记录，走插入
-                        m = Message(timestamp=ts, created_at=ts, **parsed)
-                        batch_add.append(m)
-                        for u in urls:
-                            link_index[u] = -1  # 占位，commit后更新
-                        inserted += 1
-                else:
-                    # 插入路径
-                    m = Message(timestamp=ts, created_at=ts, **parsed)
-                    batch_add.append(m)
-                    for u in urls:
-                        link_index[u] = -1
-                    inserted += 1
-
-                batch_ops += 1
-                if batch_ops >= BATCH_SIZE:
-                    session.add_all(batch_add)
-                    session.commit()
-                    # commit 后，填充新增记录的 id 到索引
-                    for m in batch_add:
-                        for u in (m.links or {}).values():
-                            link_index[u] = m.id
-                    batch_add.clear()
-                    batch_ops = 0
-                    print(f"  · 进度：新增 {inserted}，更新 {updated}，跳过非网盘 {skipped_non_netdisk}", flush=True)
-
-        if batch_add:
-            session.add_all(batch_add)
-            session.commit()
-            for m in batch_add:
-                for u in (m.links or {}).values():
-                    link_index[u] = m.id
-            batch_add.clear()
+                    pass
+            bf.add(obj.get('text') or '', target_channel, date, obj.get('urls'))
+            if line_no % 5000 == 0:
+                print(f"  · 进度：{bf.summary(target_channel)}", flush=True)
+    bf.flush()
 
-    print(f"✅ 导入完成：新增 {inserted} 条，覆盖更新 {updated} 条，跳过非网盘 {skipped_non_netdisk} 条")
+    print(f"✅ 导入完成：{bf.summary(target_channel)}")
 
 # ------------------------ 主流程：先导出再导入 ------------------------
 
@@ -498,8 +286,11 @@ def main():
         except Exception:
             pass
 
-    export_history_txt(export_path, no_comments=no_comments, url_only=url_only, min_id=min_id)
-    if not export_only:
+    # --resume：从上次中断处续写导出文件（断点位于 checkpoints/export_bsbdbfjfjff.json）
+    resume = ('--resume' in sys.argv)
+
+    completed = export_history_txt(export_path, no_comments=no_comments, url_only=url_only, min_id=min_id, resume=resume)
+    if completed and not export_only:
             import_from_txt(export_path)
 
 if __name__ == '__main__':
@@ -9,6 +9,7 @@ import json
 from sqlalchemy.orm import Session
 from model import Message, engine, create_tables
 from config import settings
+from utils.message_store import sync_links_bulk
 
 # 北京时间时区
 BEIJING_TZ = timezone(timedelta(hours=8))
@@ -55,6 +56,7 @@ def import_from_file(file_path, channel_name='imported_data'):
         print(f"📊 总行数: {len(lines)}")
         
         with Session(engine) as session:
+            pending = []  # 待同步 message_links 的新消息
             for i, line in enumerate(lines, 1):
                 line = line.strip()
                 if not line:
@@ -88,14 +90,20 @@ def import_from_file(file_path, channel_name='imported_data'):
                 )
                 
                 session.add(message)
+                pending.append(message)
                 imported_count += 1
                 
                 # 每100条提交一次
                 if imported_count % 100 == 0:
+                    session.flush()
+                    sync_links_bulk(session, [(m.id, m.links) for m in pending])
+                    pending.clear()
                     session.commit()
                     print(f"✅ 已导入 {imported_count} 条记录...")
             
             # 最终提交
+            session.flush()
+            sync_links_bulk(session, [(m.id, m.links) for m in pending])
             session.commit()
             
     except Exception as e:
@@ -175,6 +183,8 @@ def create_sample_data():
                 )
                 
                 session.add(message)
+                session.flush()
+                sync_links_bulk(session, [(message.id, message.links)])
                 imported_count += 1
             
             session.commit()
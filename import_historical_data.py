@@ -14,72 +14,12 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 from model import Message, Base
 from config import settings
+from utils.netdisk import extract_netdisk_links_strict
+from utils.message_store import find_message_by_links, sync_message_links
 
 def extract_links_from_text(text: str) -> dict:
-    """从文本中提取网盘链接"""
-    links = {}
-    
-    # 百度网盘链接模式
-    baidu_pattern = r'https://pan\.baidu\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?'
-    baidu_matches = re.findall(baidu_pattern, text)
-    for match in baidu_matches:
-        links["百度网盘"] = match
-    
-    # 夸克网盘链接模式
-    quark_pattern = r'https://pan\.quark\.cn/s/[A-Za-z0-9_-]+'
-    quark_matches = re.findall(quark_pattern, text)
-    for match in quark_matches:
-        links["夸克网盘"] = match
-    
-    # 阿里云盘链接模式
-    aliyun_pattern = r'https://www\.aliyundrive\.com/s/[A-Za-z0-9_-]+'
-    aliyun_matches = re.findall(aliyun_pattern, text)
-    for match in aliyun_matches:
-        links["阿里云盘"] = match
-    
-    # 115网盘链接模式
-    pan115_pattern = r'https://115\.com/s/[A-Za-z0-9_-]+'
-    pan115_matches = re.findall(pan115_pattern, text)
-    for match in pan115_matches:
-        links["115网盘"] = match
-    
-    # 迅雷网盘链接模式
-    xunlei_pattern = r'https://pan\.xunlei\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?(?:#)?'
-    xunlei_matches = re.findall(xunlei_pattern, text)
-    for match in xunlei_matches:
-        links["迅雷网盘"] = match
-    
-    # UC网盘链接模式
-    uc_pattern = r'https://drive\.uc\.cn/s/[A-Za-z0-9]+(?:\?public=1)?'
-    uc_matches = re.findall(uc_pattern, text)
-    for match in uc_matches:
-        links["UC网盘"] = match
-    
-    # 123pan网盘链接模式
-    pan123pan_pattern = r'https://www\.123pan\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?'
-    pan123pan_matches = re.findall(pan123pan_pattern, text)
-    if pan123pan_matches:
-        links["123网盘"] = pan123pan_matches[0]  # 取第一个匹配
-    
-    # 123684网盘链接模式（123网盘新域名）
-    pan123684_pattern = r'https://www\.123684\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?'
-    pan123684_matches = re.findall(pan123684_pattern, text)
-    if pan123684_matches and "123网盘" not in links:
-        links["123网盘"] = pan123684_matches[0]  # 只有在没有123pan链接时才使用123684链接
-    
-    # 天翼云盘链接模式
-    tianyi_pattern = r'https://cloud\.189\.cn/t/[A-Za-z0-9]+'
-    tianyi_matches = re.findall(tianyi_pattern, text)
-    for match in tianyi_matches:
-        links["天翼云盘"] = match
-    
-    # 移动云盘链接模式
-    caiyun_pattern = r'https://caiyun\.139\.com/w/i/[A-Za-z0-9]+'
-    caiyun_matches = re.findall(caiyun_pattern, text)
-    for match in caiyun_matches:
-        links["移动云盘"] = match
-    
-    return links
+    """从文本中提取网盘链接（与监控端共用单次扫描的白名单提取器）"""
+    return extract_netdisk_links_strict(text)
 
 def extract_tags_from_text(text: str) -> list:
     """从文本中提取标签"""
@@ -145,14 +85,8 @@ def upsert_historical_message(session, parsed_data: dict) -> str:
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            # 检查是否已存在相同链接的消息
-            existing = None
-            for netdisk, link in parsed_data['links'].items():
-                existing = session.query(Message).filter(
-                    Message.links.op('->>')(netdisk) == link
-                ).first()
-                if existing:
-                    break
+            # 检查是否已存在相同链接的消息（message_links 唯一索引）
+            existing = find_message_by_links(session, parsed_data['links'])
             
             if existing:
                 # 更新现有消息
@@ -161,6 +95,7 @@ def upsert_historical_message(session, parsed_data: dict) -> str:
                 existing.tags = parsed_data['tags']
                 existing.links = parsed_data['links']
                 existing.timestamp = parsed_data['timestamp']
+                sync_message_links(session, existing.id, existing.links)
                 session.commit()
                 return 'updated'
             else:
@@ -177,6 +112,8 @@ def upsert_historical_message(session, parsed_data: dict) -> str:
                     bot=parsed_data['bot']
                 )
                 session.add(new_msg)
+                session.flush()
+                sync_message_links(session, new_msg.id, new_msg.links)
                 session.commit()
                 return 'inserted'
         except OperationalError as e:
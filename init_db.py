@@ -1,4 +1,4 @@
-from model import create_tables, Channel, engine
+from model import create_tables, Channel, Message, MessageLink, engine
 from sqlalchemy.orm import Session
 from config import settings
 
@@ -25,9 +25,25 @@ def init_channels():
         # 提交更改
         session.commit()
 
+def init_message_links():
+    # 升级后首次启动：message_links 为空而 messages 有数据时，自动重建链接去重索引
+    from utils.message_store import rebuild_message_links
+    with Session(engine) as session:
+        if session.query(MessageLink.id).first() is not None:
+            return
+        if session.query(Message.id).first() is None:
+            return
+        print("正在重建链接去重索引（message_links）...")
+        total = rebuild_message_links(session)
+        print(f"链接索引重建完成，涉及消息 {total} 条")
+
 if __name__ == "__main__":
     print("正在创建表...")
     create_tables()
+    print("正在执行结构迁移...")
+    from utils.migrations import run_migrations
+    run_migrations()
     print("正在初始化频道...")
     init_channels()
+    init_message_links()
     print("初始化完成！")
\ No newline at end of file
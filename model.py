@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ARRAY, create_engine, Boolean
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Date, DateTime, JSON, create_engine, Boolean, ForeignKey, event, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import Session, declarative_base, validates
 from datetime import datetime
 from config import settings
+from utils.netdisk import netdisk_mask
 
 Base = declarative_base()
 
+# 索引（时间倒序 / tags GIN / 标题描述 trigram / links jsonb_path_ops）由 utils/migrations.py 以 CONCURRENTLY 方式创建
 class Message(Base):
     __tablename__ = "messages"
 
@@ -12,14 +15,30 @@ class Message(Base):
     timestamp = Column(DateTime, nullable=False)
     title = Column(String)
     description = Column(String)
-    links = Column(JSON)  # 存储各种网盘链接
-    tags = Column(ARRAY(String))  # 标签数组
+    links = Column(JSONB)  # 存储各种网盘链接
+    netdisk_types = Column(SmallInteger, nullable=False, default=0, server_default=text("0"))  # 白名单网盘类型位掩码（见 utils.netdisk.NETDISK_BITS），随 links 自动计算
+    tags = Column(ARRAY(String))  # 标签数组（PostgreSQL ARRAY：支持 && / @> 走 GIN 索引）
     source = Column(String)  # 来源
     channel = Column(String)  # 频道
     group_name = Column(String)  # 群组
     bot = Column(String)  # 机器人
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    @validates('links')
+    def _sync_netdisk_types(self, key, links):
+        # 所有写入路径（构造/赋值 links）都会同步更新类型位，前台筛选无需再对 JSON 文本做 ILIKE
+        self.netdisk_types = netdisk_mask(links)
+        return links
+
+# 消息-链接子表：每个规范化链接唯一，去重走索引查找而非全表 LIKE 扫描
+class MessageLink(Base):
+    __tablename__ = "message_links"
+
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True)
+    netdisk = Column(String)  # 网盘类型（links 字典的键）
+    url = Column(String, nullable=False, unique=True)  # 规范化后的链接
+
 class Credential(Base):
     __tablename__ = "credentials"
     id = Column(Integer, primary_key=True, index=True)
@@ -31,6 +50,31 @@ class Channel(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, nullable=False)
 
+# 会话 id 与频道用户名映射：监控端启动时预载，消息归属只做字典查找
+class ChannelPeer(Base):
+    __tablename__ = "channel_peers"
+    chat_id = Column(BigInteger, primary_key=True)  # Telethon peer id（频道为 -100 前缀）
+    username = Column(String, nullable=True, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 频道加入状态：记录解析结果与 access_hash，已加入的频道重启后无需再次解析/加入
+class ChannelJoinState(Base):
+    __tablename__ = "channel_join_state"
+    username = Column(String, primary_key=True)
+    account = Column(String, nullable=True)  # 完成加入的账号（Telegram 用户 id），分片迁移后需由新账号重新加入
+    chat_id = Column(BigInteger, nullable=True)
+    access_hash = Column(BigInteger, nullable=True)
+    status = Column(String, nullable=False, default="pending")  # joined / private / invalid / failed
+    last_error = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 频道水位：已处理的最大消息 id，重启/重连后只补抓 id 更大的消息
+class ChannelWatermark(Base):
+    __tablename__ = "channel_watermarks"
+    chat_id = Column(BigInteger, primary_key=True)
+    last_message_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class TelegramConfig(Base):
     __tablename__ = "telegram_config"
     id = Column(Integer, primary_key=True, index=True)
@@ -61,6 +105,54 @@ class ChannelRule(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# 配置版本计数：后台修改频道/规则时递增并 NOTIFY，监控端据此按需重载
+class ConfigVersion(Base):
+    __tablename__ = "config_versions"
+
+    key = Column(String, primary_key=True)  # channels / rules
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 标签按天计数：消息写入/更新/删除时在同一事务内增减（见 utils/rollups.py），标签云只需一次小聚合
+class TagDailyCount(Base):
+    __tablename__ = "tag_daily_counts"
+
+    tag = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)  # 消息时间（北京时间）所在日期
+    count = Column(Integer, nullable=False, default=0)
+
+# 消息按天计数：scope 为 all（全部消息）/ listed（含白名单网盘、前台可见），供分页总数使用
+class MessageDailyCount(Base):
+    __tablename__ = "message_daily_counts"
+
+    scope = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# 网盘类型按天计数（键为 utils.netdisk.NETDISK_BITS 中的显示名），维护方式同 TagDailyCount
+class NetdiskDailyCount(Base):
+    __tablename__ = "netdisk_daily_counts"
+
+    netdisk = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# 频道按天计数，维护方式同 TagDailyCount
+class ChannelDailyCount(Base):
+    __tablename__ = "channel_daily_counts"
+
+    channel = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# 已执行的结构迁移版本（见 utils/migrations.py）
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
 # 数据库连接配置
 DATABASE_URL = settings.DATABASE_URL
 
@@ -85,6 +177,22 @@ engine = create_engine(
 # 创建所有表
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    # create_all 不会给已有表加列：代码写入依赖的结构迁移（幂等）在此补齐，建索引等耗时迁移见 utils/migrations.py
+    from utils.migrations import run_migrations
+    run_migrations(required_only=True)
+
+def _after_flush_rollups(session, flush_context):
+    # utils.rollups 依赖本模块的模型定义，在首次 flush 时才导入，避免循环导入
+    from utils.rollups import apply_rollups
+    apply_rollups(session, flush_context)
+
+def register_rollup_listeners():
+    """计数表（标签/网盘/频道等按天计数）的增量维护挂到所有 ORM 会话的 after_flush 上；幂等"""
+    if not event.contains(Session, "after_flush", _after_flush_rollups):
+        event.listen(Session, "after_flush", _after_flush_rollups)
+
+# 任何经 ORM 写入 messages 的进程（监控端、回溯、导入脚本、后台）都需要维护计数表，随引擎一起注册
+register_rollup_listeners()
 
 # 初始化数据库
 def init_db():
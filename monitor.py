@@ -1,15 +1,34 @@
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, cast, String
 from model import Message, engine, Channel, Credential, TelegramConfig, ChannelRule, create_tables
 import datetime
 from datetime import timezone, timedelta
 import json
-import re
 import sys
 import os
 from config import settings
+from utils.ingest import extract_message, message_urls
+from utils.message_store import sync_links_bulk, rebuild_message_links
+from utils.backfill import BackfillEngine
+from utils.checkpoint import open_checkpoint
+from utils.migrations import run_migrations
+from utils.write_behind import WriteBehindWriter
+from utils.channel_rules import build_rules_cache, should_drop_by_rules as _should_drop_by_rules
+from utils.reload_signal import ReloadListener, read_versions, FLAG_FILES
+from utils.channel_peers import load_chat_usernames, save_chat_usernames
+from utils.join_scheduler import JoinScheduler
+from utils.sharding import HashRing
+from utils.watermarks import WatermarkTracker
+from telethon import utils as tl_utils
+from telethon.tl.types import InputPeerChannel, PeerChannel
+from utils.metrics import (
+    REGISTRY,
+    MESSAGES_RECEIVED,
+    MESSAGES_DROPPED,
+    timed,
+    serve_metrics,
+)
 
 # 北京时间时区
 BEIJING_TZ = timezone(timedelta(hours=8))
@@ -47,95 +66,153 @@ def get_api_credentials():
     # 如果数据库中没有凭据，使用 .env 中的配置
     return settings.TELEGRAM_API_ID, settings.TELEGRAM_API_HASH
 
-def get_channels():
-    """获取频道列表，合并数据库和 .env 中的频道"""
-    channels = set()
-    
-    # 从数据库获取频道
-    with Session(engine) as session:
-        db_channels = [c.username for c in session.query(Channel).all()]
-        channels.update(db_channels)
-    
+CHANNEL_FILE = "tg名字.txt"
+_channel_file_mtime = None
+
+def sync_channel_sources(force: bool = False):
+    """把 .env 与本地文件（tg名字.txt，每行一个用户名）中的频道写入数据库。
+    启动时执行一次，之后仅在 tg名字.txt 修改时间变化时执行；返回是否有新增频道。
+    """
+    global _channel_file_mtime
+    extra = []
     # 从 .env 获取默认频道
-    if hasattr(settings, 'DEFAULT_CHANNELS'):
-        env_channels = [c.strip() for c in settings.DEFAULT_CHANNELS.split(',') if c.strip()]
-        channels.update(env_channels)
-        
-        # 将 .env 中的频道添加到数据库
-        with Session(engine) as session:
-            for username in env_channels:
-                if username not in db_channels:
-                    channel = Channel(username=username)
-                    session.add(channel)
-            session.commit()
-    
-    # 从本地文件获取频道（tg名字.txt，每行一个用户名）
+    if hasattr(settings, 'DEFAULT_CHANNELS') and force:
+        extra.extend(c.strip() for c in settings.DEFAULT_CHANNELS.split(',') if c.strip())
+    # 从本地文件获取频道
     try:
-        fname = "tg名字.txt"
-        if os.path.exists(fname):
-            with open(fname, "r", encoding="utf-8") as f:
-                file_channels = [ln.strip().lstrip('@') for ln in f if ln.strip()]
-                channels.update(file_channels)
-            with Session(engine) as session:
-                db_channels = [c.username for c in session.query(Channel).all()]
-                for username in file_channels:
-                    if username not in db_channels:
-                        session.add(Channel(username=username))
-                session.commit()
+        mtime = os.path.getmtime(CHANNEL_FILE) if os.path.exists(CHANNEL_FILE) else None
+        if mtime is not None and (force or mtime != _channel_file_mtime):
+            with open(CHANNEL_FILE, "r", encoding="utf-8") as f:
+                extra.extend(ln.strip().lstrip('@') for ln in f if ln.strip())
+        _channel_file_mtime = mtime
     except Exception as e:
-        print(f"⚠️ 读取 tg名字.txt 失败: {e}")
+        print(f"⚠️ 读取 {CHANNEL_FILE} 失败: {e}")
+    if not extra:
+        return False
+    with Session(engine) as session:
+        db_channels = {u for (u,) in session.query(Channel.username).all()}
+        missing = [u for u in dict.fromkeys(extra) if u not in db_channels]
+        for username in missing:
+            session.add(Channel(username=username))
+        session.commit()
+    return bool(missing)
 
+def get_channels():
+    """获取频道列表，合并数据库和 .env 中的频道（只读，单次查询）"""
+    channels = set()
+    with Session(engine) as session:
+        channels.update(u for (u,) in session.query(Channel.username).all())
+    if hasattr(settings, 'DEFAULT_CHANNELS'):
+        channels.update(c.strip() for c in settings.DEFAULT_CHANNELS.split(',') if c.strip())
     return list(channels)
 
-def get_string_session():
-    """从数据库获取StringSession配置"""
+def get_string_sessions():
+    """读取 StringSession 账号池：数据库 TelegramConfig 各行在前，.env 中的 STRING_SESSION 在后（去重）"""
+    sessions = []
     try:
         with Session(engine) as session:
-            config = session.query(TelegramConfig).first()
-            if config and config.string_session:
-                return config.string_session.strip()
+            for config in session.query(TelegramConfig).order_by(TelegramConfig.id).all():
+                if config.string_session and config.string_session.strip():
+                    sessions.append((f"数据库#{config.id}", config.string_session.strip()))
     except Exception as e:
         print(f"⚠️ 读取StringSession配置失败: {e}")
-    return None
+    env_string = (settings.STRING_SESSION.strip() if hasattr(settings, 'STRING_SESSION') and settings.STRING_SESSION else None)
+    if env_string and env_string not in {ss for _, ss in sessions}:
+        sessions.append((".env", env_string))
+    return sessions
 
 # Telegram API 凭证
 # 使用数据库或.env中的API配置
 api_id, api_hash = get_api_credentials()
 
-# 优先使用.env中的StringSession，其次使用数据库中的StringSession，最后才使用session文件
-from config import settings
-# 优先从数据库读取 StringSession，其次才回退到 .env
-db_string = get_string_session()
-env_string = (settings.STRING_SESSION.strip() if hasattr(settings, 'STRING_SESSION') and settings.STRING_SESSION else None)
-string_session = db_string or env_string
+# 优先从数据库读取 StringSession（可配置多个账号分片监听），其次才回退到 .env
+string_sessions = get_string_sessions()
+if settings.MONITOR_MAX_ACCOUNTS > 0:
+    string_sessions = string_sessions[:settings.MONITOR_MAX_ACCOUNTS]
 
 # 创建客户端（如果有StringSession则使用，否则使用session文件）
-if string_session:
-    client = TelegramClient(StringSession(string_session), api_id, api_hash)
-    print(f"🔑 使用{'数据库中的StringSession' if db_string else '.env中的StringSession'}进行身份验证")
+if string_sessions:
+    account_clients = [(label, TelegramClient(StringSession(ss), api_id, api_hash)) for label, ss in string_sessions]
+    print(f"🔑 使用{'数据库中的StringSession' if string_sessions[0][0] != '.env' else '.env中的StringSession'}进行身份验证")
+    if len(account_clients) > 1:
+        print(f"🧩 共 {len(account_clients)} 个账号分片监听频道")
 else:
-    client = TelegramClient('monitor_session', api_id, api_hash)
+    account_clients = [("session文件", TelegramClient('monitor_session', api_id, api_hash))]
     print("📁 使用session文件进行身份验证")
-
-# 获取频道列表
+# 主账号：回溯等单账号任务使用
+client = account_clients[0][1]
+
+# 获取频道列表（启动时把 .env / tg名字.txt 中的频道同步入库）
+try:
+    sync_channel_sources(force=True)
+except Exception as e:
+    print(f"⚠️ 同步频道来源失败: {e}")
 channel_usernames = get_channels()
 
-# 规则缓存：{channel: {exclude_netdisks:set, exclude_keywords:[lower], exclude_tags:set}}
+# 频道水位：之前的消息全部落库（或丢弃）后才推进，重连时只补抓水位之后的消息
+WATERMARKS = WatermarkTracker()
+
+def _mark_written(done, failed):
+    for chat_id, message_id in done:
+        WATERMARKS.done(chat_id, message_id)
+    for chat_id, message_id in failed:
+        WATERMARKS.fail(chat_id, message_id)
+
+# 异步批量写入：事件处理器只入队，由后台任务攒批落库
+writer = WriteBehindWriter(
+    maxsize=settings.WRITE_QUEUE_MAXSIZE,
+    batch_size=settings.WRITE_BATCH_SIZE,
+    flush_interval=settings.WRITE_FLUSH_INTERVAL_MS / 1000,
+    on_written=_mark_written,
+)
+
+# 写入队列状态（writer.stats()）与监听频道数（抓取时计算）；每批落库耗时分布见 tg_monitor_stage_seconds{stage="db_upsert"}
+REGISTRY.gauge('tg_monitor_write_queue_depth', '写入队列积压条数', lambda: writer.stats()['queue_depth'])
+REGISTRY.gauge('tg_monitor_write_queue_maxsize', '写入队列容量', lambda: writer.stats()['queue_maxsize'])
+REGISTRY.gauge('tg_monitor_write_last_batch_size', '最近一批落库的消息数', lambda: writer.stats()['last_batch_size'])
+REGISTRY.gauge('tg_monitor_write_last_flush_ms', '最近一批落库耗时（毫秒）', lambda: writer.stats()['last_flush_ms'])
+REGISTRY.gauge('tg_monitor_channels', '当前监听频道数', lambda: len(current_channels))
+
+class MonitorShard:
+    """一个监听账号：按一致性哈希分到的频道只由该账号的事件处理器接收"""
+
+    def __init__(self, label: str, client):
+        self.label = label
+        self.client = client
+        self.account = None  # 连接后填入 Telegram 用户 id
+        self.healthy = False
+        # 分到的频道：{username: peer_id}，以及可直接请求的 InputPeerChannel（免解析用户名）
+        self.channels = {}
+        self.input_peers = {}
+        self.chat_ids = set()
+        self.event_builder = None
+        # 限速并发加入频道（令牌桶 + 并发上限），加入状态持久化在 channel_join_state
+        self.join_scheduler = JoinScheduler(
+            client,
+            concurrency=settings.JOIN_CONCURRENCY,
+            rate_per_min=settings.JOIN_RATE_PER_MIN,
+            burst=settings.JOIN_BURST,
+            retry_hours=settings.JOIN_RETRY_HOURS,
+        )
+
+    def is_monitored(self, event) -> bool:
+        if not current_channels:
+            # 频道列表为空时监听全部会话（与原先 NewMessage() 行为一致），只由第一个可用账号处理避免重复
+            return self is next((s for s in SHARDS if s.healthy), None)
+        return event.chat_id in self.chat_ids
+
+SHARDS = [MonitorShard(label, c) for label, c in account_clients]
+# 一致性哈希环（只包含可用账号），账号失效/恢复时增删节点并重新分配频道
+RING = HashRing()
+REGISTRY.gauge('tg_monitor_healthy_accounts', '可用监听账号数', lambda: sum(1 for s in SHARDS if s.healthy))
+
+# 规则缓存：{channel: CompiledRule}（网盘类型位掩码 / 关键词单正则 / 标签 frozenset）
 RULES_CACHE = {}
 
 # —— 无重启控制：通过控制文件动态暂停/恢复 ——
 IS_PAUSED = False
 CONTROL_FILE = "monitor_control.json"
 
-# 新增：自动加入频道所需的导入
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import (
-    FloodWaitError,
-    UsernameInvalidError,
-    UsernameNotOccupiedError,
-    ChannelPrivateError,
-    UserAlreadyParticipantError,
-)
 import asyncio as _asyncio
 
 
@@ -160,469 +237,396 @@ def load_rules_cache():
     try:
         with Session(engine) as session:
             rules = session.query(ChannelRule).filter_by(enabled=True).all()
-            RULES_CACHE = {
-                r.channel: {
-                    'exclude_netdisks': set((r.exclude_netdisks or [])),
-                    'exclude_keywords': [kw.lower() for kw in (r.exclude_keywords or []) if kw],
-                    'exclude_tags': set((r.exclude_tags or [])),
-                }
-                for r in rules
-            }
+            RULES_CACHE = build_rules_cache(rules)
             print(f"⚙️ 已加载规则 {len(RULES_CACHE)} 条")
     except Exception as e:
         print(f"⚠️ 加载规则失败: {e}")
 
+# 会话 id → 频道用户名缓存：启动时从 channel_peers 预载，bind_channels 解析实体时补全
+CHAT_USERNAMES = {}
+
+def load_chat_username_cache():
+    try:
+        CHAT_USERNAMES.update(load_chat_usernames())
+        print(f"🗂️ 已载入频道用户名缓存 {len(CHAT_USERNAMES)} 条")
+    except Exception as e:
+        print(f"⚠️ 载入频道用户名缓存失败: {e}")
+
+async def remember_chat_usernames(mapping: dict):
+    """更新缓存，仅把新增/变更的映射写回数据库"""
+    changed = {cid: u for cid, u in mapping.items() if cid and u and CHAT_USERNAMES.get(cid) != u}
+    if not changed:
+        return
+    CHAT_USERNAMES.update(changed)
+    try:
+        await _asyncio.to_thread(save_chat_usernames, changed)
+    except Exception as e:
+        print(f"⚠️ 保存频道用户名缓存失败: {e}")
+
 async def get_channel_username(event) -> str:
+    chat_id = event.chat_id
+    # 更新自带的实体（无需请求 API）用于感知用户名变更
+    chat = getattr(event, 'chat', None)
+    if chat is not None:
+        uname = getattr(chat, 'username', None)
+        if uname and CHAT_USERNAMES.get(chat_id) != uname:
+            if chat_id in CHAT_USERNAMES:
+                print(f"✏️ 频道用户名变更: @{CHAT_USERNAMES[chat_id]} → @{uname}")
+            await remember_chat_usernames({chat_id: uname})
+    uname = CHAT_USERNAMES.get(chat_id)
+    if uname:
+        return uname
+    # 未缓存：回退到 get_chat（可能触发一次 API 请求），结果写入缓存
     try:
         chat = await event.get_chat()
         uname = getattr(chat, 'username', None)
         if uname:
+            await remember_chat_usernames({chat_id: uname})
             return uname
     except Exception:
         pass
     return ''
 
 def should_drop_by_rules(channel: str, parsed: dict) -> bool:
-    if not channel:
-        return False
-    rule = RULES_CACHE.get(channel)
-    if not rule:
-        return False
-    # 1) 网盘类型命中
-    links = parsed.get('links') or {}
-    if links and rule['exclude_netdisks'] and (set(links.keys()) & rule['exclude_netdisks']):
-        return True
-    # 2) 关键词命中（标题/描述）
-    kws = rule['exclude_keywords']
-    if kws:
-        title = (parsed.get('title') or '').lower()
-        desc = (parsed.get('description') or '').lower()
-        for kw in kws:
-            if kw and (kw in title or kw in desc):
-                return True
-    # 3) 标签命中
-    tags = set(parsed.get('tags') or [])
-    if tags and rule['exclude_tags'] and (tags & rule['exclude_tags']):
-        return True
-    return False
-
-def parse_message(text):
-    """解析消息内容，提取标题、描述、链接等信息（更健壮，支持一行多网盘名链接提取和全局标签提取）"""
-    lines = text.split('\n')
-    title = ''
-    description = ''
-    links = {}
-    tags = []
-    source = ''
-    channel = ''
-    group = ''
-    bot = ''
-    current_section = None
-    desc_lines = []
-
-    # 网盘关键字与显示名映射
-    netdisk_map = [
-        (['quark', '夸克'], '夸克网盘'),
-        (['aliyundrive', 'aliyun', '阿里', 'alipan'], '阿里云盘'),
-        (['baidu', 'pan.baidu'], '百度网盘'),
-        (['115.com', '115网盘', '115pan'], '115网盘'),
-        (['cloud.189', '天翼', '189.cn'], '天翼云盘'),
-        (['123pan', '123.yun'], '123云盘'),
-        (['ucdisk', 'uc网盘', 'ucloud', 'drive.uc.cn'], 'UC网盘'),
-        (['xunlei', 'thunder', '迅雷'], '迅雷'),
-    ]
-
-    # 1. 标题提取：优先"名称："，否则第一行直接当title
-    if lines and lines[0].strip():
-        if lines[0].startswith('名称：'):
-            title = lines[0].replace('名称：', '').strip()
-        else:
-            title = lines[0].strip()
-
-    # 2. 遍历其余行，提取描述、链接、标签等
-    for idx, line in enumerate(lines[1:] if title else lines):
-        line = line.strip()
-        if not line:
-            continue
-        # 兼容多种标签前缀
-        if line.startswith('🏷 标签：') or line.startswith('标签：'):
-            tags.extend([tag.strip('#') for tag in line.replace('🏷 标签：', '').replace('标签：', '').split() if tag.strip('#')])
-            continue
-        if line.startswith('描述：'):
-            current_section = 'description'
-            desc_lines.append(line.replace('描述：', '').strip())
-        elif line.startswith('链接：'):
-            current_section = 'links'
-            url = line.replace('链接：', '').strip()
-            if not url:
-                continue  # 跳过空链接
-            # 智能识别网盘名
-            found = False
-            for keys, name in netdisk_map:
-                if any(k in url.lower() for k in keys):
-                    links[name] = url
-                    found = True
-                    break
-            if not found:
-                links['其他'] = url
-        elif line.startswith('🎉 来自：'):
-            source = line.replace('🎉 来自：', '').strip()
-        elif line.startswith('📢 频道：'):
-            channel = line.replace('📢 频道：', '').strip()
-        elif line.startswith('👥 群组：'):
-            group = line.replace('👥 群组：', '').strip()
-        elif line.startswith('🤖 投稿：'):
-            bot = line.replace('🤖 投稿：', '').strip()
-        elif current_section == 'description':
-            desc_lines.append(line)
-        else:
-            desc_lines.append(line)
-
-    # 3. 全局正则提取所有"网盘名：链接"对，并从描述中移除
-    desc_text = '\n'.join(desc_lines)
-    # 支持"网盘名：链接"对，允许多个，支持中文冒号和英文冒号
-    pattern = re.compile(r'([\u4e00-\u9fa5A-Za-z0-9#]+)[：:](https?://[^\s]+)')
-    matches = pattern.findall(desc_text)
-    for key, url in matches:
-        # 智能识别网盘名
-        found = False
-        for keys, name in netdisk_map:
-            if any(k in url.lower() or k in key for k in keys):
-                links[name] = url
-                found = True
-                break
-        if not found:
-            links[key.strip()] = url
-    # 从描述中移除所有"网盘名：链接"对
-    desc_text = pattern.sub('', desc_text)
-    # 4. 额外全局提取裸链接（http/https），也归类到links
-    url_pattern = re.compile(r'(https?://[^\s]+)')
-    for url in url_pattern.findall(desc_text):
-        found = False
-        for keys, name in netdisk_map:
-            if any(k in url.lower() for k in keys):
-                links[name] = url
-                found = True
-                break
-        if not found:
-            links['其他'] = url
-    # 从描述中移除裸链接
-    desc_text = url_pattern.sub('', desc_text)
-    # 5. 全局正则提取所有#标签，并从描述中移除
-    tag_pattern = re.compile(r'#([\u4e00-\u9fa5A-Za-z0-9_]+)')
-    found_tags = tag_pattern.findall(desc_text)
-    if found_tags:
-        tags.extend(found_tags)
-        desc_text = tag_pattern.sub('', desc_text)
-    # 去重
-    tags = list(set(tags))
-    # 移除所有网盘名关键词
-    netdisk_names = ['夸克', '迅雷', '百度', 'UC', '阿里', '天翼', '115', '123云盘']
-    netdisk_name_pattern = re.compile(r'(' + '|'.join(netdisk_names) + r')')
-    desc_text = netdisk_name_pattern.sub('', desc_text)
-    # 6. 最终description，去除无意义符号行
-    desc_lines_final = [line for line in desc_text.strip().split('\n') if line.strip() and not re.fullmatch(r'[.。·、,，-]+', line.strip())]
-    description = '\n'.join(desc_lines_final)
-
-    return {
-        'title': title,
-        'description': description,
-        'links': links,
-        'tags': tags,
-        'source': source,
-        'channel': channel,
-        'group_name': group,
-        'bot': bot
-    }
+    return _should_drop_by_rules(RULES_CACHE, channel, parsed)
 
 # 动态绑定：替换静态装饰器，函数改名为 on_new_message
 # @client.on(events.NewMessage(chats=channel_usernames))
-def upsert_message_by_links(session: Session, parsed_data: dict, timestamp: datetime.datetime):
-    """基于链接去重的写入逻辑：
-    - 若 parsed_data 中包含 links，则以链接为唯一键：
-      1) 数据库中存在任意相同链接：覆盖并更新该条消息
-      2) 不存在：插入新消息
-    - 若不包含 links：沿用原有逻辑（插入新消息）
-    返回："updated" 或 "inserted"
-    """
-    links = parsed_data.get('links') or {}
-    urls = set(links.values()) if links else set()
-
-    # 只在存在链接时执行覆盖更新逻辑
-    if urls:
-        # 先在数据库层用 LIKE 限定候选集，再在 Python 层精确比对，避免误伤
-        like_filters = [cast(Message.links, String).like(f"%{u}%") for u in urls]
-        candidates = session.query(Message).filter(
-            Message.links.isnot(None),
-            or_(*like_filters)
-        ).order_by(Message.timestamp.desc()).all()
-
-        target = None
-        for msg in candidates:
-            try:
-                msg_links = (msg.links or {}).values()
-                # 精确匹配：完全相同的链接才算同一条
-                if any(u == v for u in urls for v in msg_links):
-                    target = msg
-                    break
-            except Exception:
-                continue
-
-        if target:
-            # 覆盖更新该条消息
-            target.timestamp = timestamp
-            target.title = parsed_data.get('title')
-            target.description = parsed_data.get('description')
-            target.links = parsed_data.get('links')
-            target.tags = parsed_data.get('tags')
-            target.source = parsed_data.get('source')
-            target.channel = parsed_data.get('channel')
-            target.group_name = parsed_data.get('group_name')
-            target.bot = parsed_data.get('bot')
-            session.commit()
-            print(f"♻️ 已覆盖更新现有消息(id={target.id})，按链接去重")
-            return "updated"
-
-    # 无链接或未命中：插入新消息
-    new_message = Message(timestamp=timestamp, created_at=timestamp, **parsed_data)
-    session.add(new_message)
-    session.commit()
-    print("✅ 新消息已保存（无重复链接）")
-    return "inserted"
-
-# === 严格网盘链接白名单提取与频道署名清洗 ===
-STRICT_NETDISK_PATTERNS = {
-    "百度网盘": r"https://pan\.baidu\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?",
-    "夸克网盘": r"https://pan\.quark\.cn/s/[A-Za-z0-9_-]+",
-    "阿里云盘": r"https://www\.aliyundrive\.com/s/[A-Za-z0-9_-]+",
-    "115网盘": r"https://115\.com/s/[A-Za-z0-9_-]+",
-    "迅雷网盘": r"https://pan\.xunlei\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?(?:#)?",
-    "UC网盘": r"https://drive\.uc\.cn/s/[A-Za-z0-9]+(?:\?public=1)?",
-    "123网盘": r"https://www\.123pan\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?|https://www\.123684\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?",
-    "天翼云盘": r"https://cloud\.189\.cn/t/[A-Za-z0-9]+",
-    "移动云盘": r"https://caiyun\.139\.com/w/i/[A-Za-z0-9]+",
-}
-
-ALLOWED_NETDISK_NAMES = set(STRICT_NETDISK_PATTERNS.keys())
-
-def extract_netdisk_links_strict(text: str) -> dict:
-    links = {}
-    for name, pattern in STRICT_NETDISK_PATTERNS.items():
-        matches = re.findall(pattern, text)
-        if matches:
-            # 123网盘有两个域名，若命中多个，取第一个
-            links[name] = matches[0] if isinstance(matches, list) else matches
-    return links
-
-# 去除尾部或独立行中的频道/群组/推广署名等噪声
-_NOISE_LINES = re.compile(r"^(?:[\uD800-\uDBFF\uDC00-\uDFFF\U00010000-\U0010ffff\W]{0,3})\s*(?:来自|来 自|频道|频 道|群组|群 组|投稿|搜资源)\s*[:：].*$", re.IGNORECASE)
-_HANDLE = re.compile(r"@\w+")
-
-def clean_channel_noise(text: str) -> str:
-    lines = [ln for ln in (text or '').split('\n')]
-    cleaned = []
-    for ln in lines:
-        lns = ln.strip()
-        if not lns:
-            continue
-        # 过滤典型署名行
-        if _NOISE_LINES.match(lns):
-            continue
-        # 去掉散落的 @handle
-        lns = _HANDLE.sub('', lns)
-        # 清理多余空白
-        lns = re.sub(r"\s{2,}", " ", lns).strip()
-        if lns:
-            cleaned.append(lns)
-    return '\n'.join(cleaned)
+# 基于链接去重的写入见 utils/message_store.upsert_message_by_links（message_links 唯一索引）
+
+def _msg_ref(event, channel: str = None) -> str:
+    """日志中标识一条消息：频道 + 消息 id"""
+    channel = channel or CHAT_USERNAMES.get(event.chat_id) or event.chat_id
+    return f"@{channel} #{event.id}"
+
+async def _drop(reason: str, event, channel: str = None):
+    MESSAGES_DROPPED.inc(reason, channel if channel is not None else CHAT_USERNAMES.get(event.chat_id, ''))
+    # 丢弃的消息同样经过写入队列：排在它之前的消息落库后才推进频道水位
+    await writer.put_dropped((event.chat_id, event.id))
 
 async def on_new_message(event):
+    await process_message(event)
+
+async def process_message(event, timestamp=None):
+    """实时消息与断线补抓共用的处理管线；event 可以是 NewMessage 事件或 iter_messages 返回的 Message"""
+    WATERMARKS.begin(event.chat_id, event.id)
+    try:
+        await _process_message(event, timestamp)
+    except BaseException:
+        # 未能交给写入队列：水位不越过这条消息，重启后补抓会重新处理
+        WATERMARKS.fail(event.chat_id, event.id)
+        raise
+
+async def _process_message(event, timestamp=None):
+    MESSAGES_RECEIVED.inc(CHAT_USERNAMES.get(event.chat_id, ''))
     # 无重启暂停：如被暂停则直接忽略消息
     if IS_PAUSED:
+        await _drop('paused', event)
         return
     # 先过滤“回复类”消息（对某条消息的评论/回复），这些往往不是我们要采集的原始推送
     try:
-        msg_obj = getattr(event, 'message', None)
+        msg_obj = event.message if isinstance(event, events.NewMessage.Event) else event
         if msg_obj:
             if getattr(msg_obj, 'is_reply', False):
-                print("🧹 已忽略回复消息（不入库）")
+                print(f"🧹 已忽略回复消息（不入库） {_msg_ref(event)}")
+                await _drop('reply', event)
                 return
             # 兼容不同Telethon版本的回复头字段
             if getattr(msg_obj, 'reply_to', None) is not None:
-                print("🧹 已忽略回复消息（不入库）")
+                print(f"🧹 已忽略回复消息（不入库） {_msg_ref(event)}")
+                await _drop('reply', event)
                 return
             if getattr(msg_obj, 'reply_to_msg_id', None) is not None:
-                print("🧹 已忽略回复消息（不入库）")
+                print(f"🧹 已忽略回复消息（不入库） {_msg_ref(event)}")
+                await _drop('reply', event)
                 return
             # 忽略服务类系统消息（置顶、入群等动作）
             if getattr(msg_obj, 'action', None) is not None:
-                print("🧹 已忽略服务类系统消息（不入库）")
+                print(f"🧹 已忽略服务类系统消息（不入库） {_msg_ref(event)}")
+                await _drop('service', event)
                 return
     except Exception as e:
         print(f"⚠️ 检查是否为回复/服务消息时出错: {e}")
     
     # 忽略空文本/纯媒体消息
     if not (event.raw_text and event.raw_text.strip()):
-        print("🧹 已忽略空文本/纯媒体消息（不入库）")
+        print(f"🧹 已忽略空文本/纯媒体消息（不入库） {_msg_ref(event)}")
+        await _drop('empty', event)
         return
 
     raw_message = event.raw_text
-    # 清洗频道署名、推广信息
-    message = clean_channel_noise(raw_message)
-    # 在处理新消息处，统一使用北京时间
-    timestamp = get_beijing_time()
-    
-    # 解析消息
-    parsed_data = parse_message(message)
-
-    # 使用严格白名单正则重新提取网盘链接
-    strict_links = extract_netdisk_links_strict(message)
 
-    # 额外：从 entities 与按钮中提取 URL 并按白名单归类
+    # 先收集 entities 与按钮中的 URL，便于在任何正则之前做白名单域名预过滤
+    extra_urls = []
     try:
-        extra = {}
-        msg_obj = getattr(event, 'message', None)
+        msg_obj = event.message if isinstance(event, events.NewMessage.Event) else event
         if msg_obj is not None:
-            ents = getattr(msg_obj, 'entities', None)
-            if ents:
-                for ent in ents:
-                    url = getattr(ent, 'url', None)
-                    if url:
-                        for name, pattern in STRICT_NETDISK_PATTERNS.items():
-                            if re.search(pattern, url):
-                                m = re.search(pattern, url)
-                                if m:
-                                    extra[name] = m.group(0)
-            btns = getattr(msg_obj, 'buttons', None)
-            if btns:
-                for row in btns:
-                    for button in row:
-                        burl = getattr(button, 'url', None)
-                        if burl:
-                            for name, pattern in STRICT_NETDISK_PATTERNS.items():
-                                if re.search(pattern, burl):
-                                    m = re.search(pattern, burl)
-                                    if m:
-                                        extra[name] = m.group(0)
-        if extra:
-            strict_links.update(extra)
+            extra_urls = message_urls(msg_obj)
     except Exception as e:
         print(f"⚠️ 提取按钮/实体链接时出错: {e}")
 
-    if not strict_links and getattr(settings, 'STRICT_NETDISK_ONLY', False):
-        print("🚫 非白名单网盘消息（STRICT_NETDISK_ONLY=true），已忽略")
+    # 预过滤 → 清洗 → 严格链接提取 → 解析（与回溯、bench_ingest.py 共用 utils.ingest）
+    strict_only = getattr(settings, 'STRICT_NETDISK_ONLY', False)
+    parsed_data, reason = extract_message(raw_message, extra_urls, strict_only, timer=timed)
+    if reason == 'non_netdisk':
+        print(f"🚫 非白名单网盘消息（STRICT_NETDISK_ONLY=true），已忽略 {_msg_ref(event)}")
+        await _drop('non_netdisk', event)
         return
-    parsed_data['links'] = (strict_links or None)
-
-    # 若解析后无标题、无描述、无链接、无标签，则忽略
-    if not any([parsed_data.get('title'), parsed_data.get('description'), parsed_data.get('links'), parsed_data.get('tags')]):
-        print("🧹 已忽略无有效内容的消息（不入库）")
+    if reason == 'no_content':
+        print(f"🧹 已忽略无有效内容的消息（不入库） {_msg_ref(event)}")
+        await _drop('no_content', event)
         return
+    # 在处理新消息处，统一使用北京时间（补抓的消息沿用其发布时间）
+    if timestamp is None:
+        timestamp = get_beijing_time()
 
     # 识别频道用户名（优先用事件实体）
-    ch_username = await get_channel_username(event)
+    with timed('channel_username'):
+        ch_username = await get_channel_username(event)
     if ch_username:
         parsed_data['channel'] = ch_username
 
     # 规则判断：命中则丢弃不入库
-    if should_drop_by_rules(parsed_data.get('channel', ''), parsed_data):
-        print(f"🚫 按规则忽略消息 @ {parsed_data.get('channel','')} | 标题: {parsed_data.get('title','')}")
+    with timed('rules'):
+        dropped = should_drop_by_rules(parsed_data.get('channel', ''), parsed_data)
+    if dropped:
+        print(f"🚫 按规则忽略消息 {_msg_ref(event, parsed_data.get('channel'))} | 标题: {parsed_data.get('title','')}")
+        await _drop('rule', event, parsed_data.get('channel', ''))
         return
     
-    # 基于链接唯一性的写入
-    with Session(engine) as session:
-        result = upsert_message_by_links(session, parsed_data, timestamp)
-    
-    print(f"[{timestamp}] 消息已写入数据库（{'覆盖更新' if result=='updated' else '新增'}）")
+    # 基于链接唯一性的写入：入队后由 writer 批量落库，不在事件循环中同步访问数据库
+    with timed('enqueue'):
+        await writer.put(parsed_data, timestamp, (event.chat_id, event.id))
+    print(f"[{timestamp}] 消息 {_msg_ref(event, parsed_data.get('channel'))} 已加入写入队列（积压 {writer.queue_depth}）")
 
 # 动态事件绑定所需的全局变量与方法
-current_event_builder = None
 current_channels = []
+_ring_changed = False
+_bind_lock = _asyncio.Lock()
+
+def set_shard_health(shard: MonitorShard, healthy: bool):
+    """更新账号可用状态并调整哈希环，下次 bind_channels 时重新分配频道"""
+    global _ring_changed
+    if shard.healthy == healthy:
+        return
+    shard.healthy = healthy
+    if healthy:
+        RING.add(shard.label)
+    else:
+        RING.remove(shard.label)
+    _ring_changed = True
+
+_background_tasks = set()
+
+def _spawn(coro):
+    task = _asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def _run_migrations_in_background():
+    # 建索引、回填等耗时迁移使用 CONCURRENTLY / 分批短事务，放在后台线程执行，不阻塞监听与写入；
+    # 重写整表的维护迁移不在这里执行（见 utils/migrations.py --maintenance）
+    try:
+        n = await _asyncio.to_thread(run_migrations)
+        if n:
+            print(f"🛠️ 后台结构迁移完成，本次执行 {n} 个")
+    except Exception as e:
+        print(f"⚠️ 后台结构迁移失败: {e}")
+
+def _input_peer(chat_id, access_hash):
+    if not chat_id or not access_hash:
+        return None
+    real_id, peer_type = tl_utils.resolve_id(chat_id)
+    if peer_type is not PeerChannel:
+        return None
+    return InputPeerChannel(channel_id=real_id, access_hash=access_hash)
+
+async def catch_up_channels(shard: MonitorShard, usernames):
+    """补抓断线/重启期间的消息：每个频道只取 id 大于水位的消息（min_id），多频道并发，
+    按时间正序走与实时消息相同的处理管线。没有水位的频道（首次监听）不回溯历史。
+    """
+    sem = _asyncio.Semaphore(max(1, settings.CATCHUP_CONCURRENCY))
+    limit = settings.CATCHUP_MAX_MESSAGES or None
+
+    async def _one(uname):
+        chat_id = shard.channels.get(uname)
+        last_id = WATERMARKS.get(chat_id) if chat_id else None
+        if last_id is None:
+            return 0
+        peer = shard.input_peers.get(uname) or uname
+        n = 0
+        # 补抓期间占住水位起点：实时消息先落库也不会把水位推过尚未拉取的补抓区间；
+        # 补抓出错时保留占位，本进程内水位停在缺口之前
+        hold_id = WATERMARKS.hold(chat_id, last_id)
+        cursor = last_id
+        ok = False
+        async with sem:
+            try:
+                while True:
+                    # 从旧到新拉取：每轮最多 limit 条，未拉取的是 cursor 之后较新的消息
+                    got = 0
+                    async for msg in shard.client.iter_messages(peer, min_id=cursor, reverse=True, limit=limit):
+                        await process_message(msg, to_beijing_time(getattr(msg, 'date', None)))
+                        cursor = max(cursor, msg.id)
+                        got += 1
+                    n += got
+                    if not limit or got < limit:
+                        break
+                    # 本轮达到上限：占位移到已拉取的最后一条之后（水位不越过未拉取的部分），接着拉取
+                    next_hold = WATERMARKS.hold(chat_id, cursor)
+                    WATERMARKS.release(chat_id, hold_id)
+                    hold_id = next_hold
+                    print(f"🧷 [{shard.label}] @{uname} 已补抓 {n} 条，继续拉取消息 {cursor} 之后较新的消息")
+                ok = True
+            except Exception as e:
+                print(f"⚠️ [{shard.label}] 补抓 @{uname} 失败（已补抓到消息 {cursor}）: {e}")
+            finally:
+                WATERMARKS.release(chat_id, hold_id, ok)
+        if n:
+            print(f"🧷 [{shard.label}] @{uname} 补抓 {n} 条（水位 {last_id} 之后）")
+        return n
+
+    counts = await _asyncio.gather(*(_one(u) for u in usernames))
+    total = sum(counts)
+    if total:
+        print(f"🧷 [{shard.label}] 断线补抓完成：{sum(1 for c in counts if c)} 个频道，共 {total} 条")
+    return total
 
 async def bind_channels():
-    """根据数据库与.env动态更新监听频道集合，并重绑事件处理器"""
-    global current_event_builder, current_channels
+    """根据数据库与.env动态更新监听频道集合，并按一致性哈希分配到各账号：
+    每个账号只加入新分到的频道、移除不再属于自己的频道，事件处理器只注册一次
+    """
+    async with _bind_lock:
+        await _bind_channels()
+
+# 最近一次绑定时各账号分到的频道：与实际已绑定的频道比较，找出加入失败/被推迟、需要重试的频道
+_last_assignment = {}
+
+def _join_retry_due() -> bool:
+    now = datetime.datetime.utcnow()
+    for s in SHARDS:
+        if not s.healthy:
+            continue
+        unbound = set(_last_assignment.get(s.label, ())) - set(s.channels)
+        if unbound and (s.join_scheduler.next_retry is None or now >= s.join_scheduler.next_retry):
+            return True
+    return False
+
+async def _bind_channels():
+    global _ring_changed
     try:
         new_channels = get_channels()
     except Exception as e:
         print(f"⚠️ 获取频道列表失败: {e}")
         return
-    # 若频道无变化则跳过
-    if set(new_channels) == set(current_channels):
+    new_set = set(new_channels)
+    old_set = set(current_channels)
+    # 若频道与账号均无变化，且没有到了重试时间的未加入频道，则跳过
+    if (not _ring_changed and all(s.event_builder is not None for s in SHARDS if s.healthy)
+            and new_set == old_set and not _join_retry_due()):
         return
-
-    # 在绑定事件前，尝试自动加入公开频道（若已加入会抛出 UserAlreadyParticipantError，直接忽略）
-    async def _ensure_join_all(chs):
-        for uname in chs:
-            u = (uname or '').lstrip('@').strip()
-            if not u:
-                continue
+    _ring_changed = False
+    added = sorted(new_set - old_set)
+    removed = sorted(old_set - new_set)
+
+    assignment = RING.assign(sorted(new_set))
+    _last_assignment.clear()
+    _last_assignment.update(assignment)
+
+    async def _rebind(shard: MonitorShard):
+        desired = set(assignment.get(shard.label, [])) if shard.healthy else set()
+        to_join = sorted(desired - set(shard.channels))
+        for uname in set(shard.channels) - desired:
+            shard.channels.pop(uname, None)
+            shard.input_peers.pop(uname, None)
+        # 在绑定事件前，限速并发加入新分到的公开频道（已加入的频道按 channel_join_state 跳过）
+        if to_join:
             try:
-                entity = await client.get_entity(u)
-                try:
-                    await client(JoinChannelRequest(entity))
-                    print(f"📥 已尝试加入频道 @{u}")
-                except UserAlreadyParticipantError:
-                    # 已经在频道中，忽略
-                    pass
-                except ChannelPrivateError:
-                    print(f"🚫 无法加入私有频道 @{u}（需要邀请链接）")
-                except FloodWaitError as fe:
-                    wait_s = getattr(fe, 'seconds', 5)
-                    print(f"⏳ 频率限制，等待 {wait_s}s 后继续加入 @{u}")
-                    await _asyncio.sleep(wait_s + 1)
-                except Exception as e:
-                    print(f"⚠️ 加入频道 @{u} 失败: {e}")
-            except (UsernameInvalidError, UsernameNotOccupiedError):
-                print(f"❓ 无效或不存在的频道用户名: @{u}")
+                joined = await shard.join_scheduler.join_all(to_join)
+                shard.channels.update({uname: info['chat_id'] for uname, info in joined.items()})
+                for uname, info in joined.items():
+                    peer = _input_peer(info['chat_id'], info.get('access_hash'))
+                    if peer is not None:
+                        shard.input_peers[uname] = peer
+                await remember_chat_usernames({info['chat_id']: info['username'] for info in joined.values()})
             except Exception as e:
-                print(f"⚠️ 解析频道实体失败 @{u}: {e}")
+                print(f"⚠️ [{shard.label}] 自动加入频道过程中发生错误: {e}")
+        shard.chat_ids = set(shard.channels.values())
+        # 新分到的频道（启动、账号恢复、从失效账号迁入）补抓水位之后的消息
+        gap = [u for u in to_join if u in shard.channels]
+        if gap and shard.healthy:
+            _spawn(catch_up_channels(shard, gap))
+        # 事件处理器只注册一次，之后仅更新过滤集合
+        if shard.healthy and shard.event_builder is None:
+            from telethon import events as _events
+            ev = _events.NewMessage(func=shard.is_monitored)
+            shard.client.add_event_handler(on_new_message, ev)
+            shard.event_builder = ev
 
-    try:
-        await _ensure_join_all(new_channels)
-    except Exception as e:
-        print(f"⚠️ 自动加入频道过程中发生错误: {e}")
-
-    # 先移除旧事件绑定
-    if current_event_builder is not None:
-        try:
-            client.remove_event_handler(on_new_message, current_event_builder)
-        except Exception as e:
-            print(f"⚠️ 移除旧事件处理器失败: {e}")
-    # 绑定新事件
-    from telethon import events as _events
-    ev = _events.NewMessage(chats=new_channels) if new_channels else _events.NewMessage()
-    client.add_event_handler(on_new_message, ev)
-    current_event_builder = ev
     current_channels[:] = list(new_channels)
-    print(f"🎯 更新监听频道为 {len(new_channels)} 个：{new_channels}")
-
-# 周期刷新监听列表
+    # 各账号并发加入，所有账号共用同一条解析与写入管线
+    await _asyncio.gather(*(_rebind(s) for s in SHARDS))
+
+    if added:
+        print(f"➕ 新增监听频道 {len(added)} 个：{added}")
+    if removed:
+        print(f"➖ 移除监听频道 {len(removed)} 个：{removed}")
+    if len(SHARDS) > 1:
+        dist = "，".join(f"{s.label}: {len(s.channels)}" for s in SHARDS if s.healthy)
+        print(f"🧩 频道分配：{dist}")
+    print(f"🎯 当前监听频道 {len(current_channels)} 个")
+
+# 刷新监听列表：后台通过 NOTIFY 即时通知，版本号低频轮询兜底
 import asyncio as _asyncio
-async def channels_watcher(poll_sec: int = 1):
-    FLAG_CH = "channels_refresh.flag"
-    FLAG_RULES = "rules_refresh.flag"
+async def channels_watcher(poll_sec: int = 1, fallback_sec: int = 30):
+    listener = ReloadListener()
+    listener.start()
+    try:
+        versions = read_versions()
+    except Exception as e:
+        print(f"⚠️ 读取配置版本失败: {e}")
+        versions = {}
+    loop = _asyncio.get_running_loop()
+    next_check = loop.time() + fallback_sec
     while True:
         try:
             # 动态读取控制文件（暂停/恢复）
             load_control_state()
+            kinds = listener.drain()
+            recheck = False
+            # 同机部署时后台写入的标记文件
+            for kind, flag in FLAG_FILES.items():
+                if os.path.exists(flag):
+                    kinds.add(kind)
+                    try:
+                        os.remove(flag)
+                    except Exception:
+                        pass
+            # 低频兜底：比对版本号（通知丢失 / 监听连接断开时）与 tg名字.txt 修改时间
+            if loop.time() >= next_check:
+                next_check = loop.time() + fallback_sec
+                recheck = True
+                if not listener.active:
+                    listener.start()
+                try:
+                    latest = read_versions()
+                    kinds.update(k for k, v in latest.items() if v != versions.get(k))
+                    versions = latest
+                except Exception as e:
+                    print(f"⚠️ 读取配置版本失败: {e}")
+                if sync_channel_sources():
+                    kinds.add('channels')
             # 频道刷新
-            if os.path.exists(FLAG_CH):
+            if 'channels' in kinds:
                 await bind_channels()
-                try:
-                    os.remove(FLAG_CH)
-                except Exception:
-                    pass
                 print("🔄 收到后台刷新信号，已立即更新监听频道")
-            else:
+            elif recheck:
+                # 兜底比对频道集合（直接改库等未发通知的变更），无变化时不做任何操作
                 await bind_channels()
             # 规则刷新
-            if os.path.exists(FLAG_RULES):
+            if 'rules' in kinds:
                 load_rules_cache()
-                try:
-                    os.remove(FLAG_RULES)
-                except Exception:
-                    pass
                 print("🔄 收到规则刷新信号，已立即更新过滤规则")
         except Exception as e:
             print(f"⚠️ 刷新任务时出错: {e}")
@@ -636,25 +640,93 @@ print("📡 正在动态绑定监听频道...")
 # 现：先 bind_channels 再启动 watcher
 print(f"📡 准备监听 Telegram 频道：{channel_usernames}")
 
+async def connect_shard(shard: MonitorShard, interactive: bool = False) -> bool:
+    """连接账号并标记可用；主账号允许交互式登录（session 文件模式），其他账号需已授权"""
+    try:
+        if interactive:
+            await shard.client.start()
+        else:
+            await shard.client.connect()
+            if not await shard.client.is_user_authorized():
+                print(f"❌ [{shard.label}] StringSession 未授权或已失效，跳过该账号")
+                return False
+        me = await shard.client.get_me()
+        shard.account = str(me.id)
+        shard.join_scheduler.account = shard.account
+        print(f"👤 [{shard.label}] 当前用户: {me.first_name} (@{me.username if me.username else 'N/A'})")
+        set_shard_health(shard, True)
+        return True
+    except Exception as e:
+        print(f"❌ [{shard.label}] 连接失败: {e}")
+        return False
+
+async def run_shard(shard: MonitorShard, retry_sec: int = 30, max_retry_sec: int = 600):
+    """守护单个账号：断开后把其频道重新分配给其他账号，并按退避间隔尝试重连"""
+    delay = retry_sec
+    while True:
+        if shard.healthy:
+            try:
+                await shard.client.run_until_disconnected()
+            except Exception as e:
+                print(f"⚠️ [{shard.label}] 连接异常断开: {e}")
+            print(f"🔌 [{shard.label}] 已断开，重新分配其监听频道")
+            set_shard_health(shard, False)
+            await bind_channels()
+        await _asyncio.sleep(delay)
+        if await connect_shard(shard):
+            delay = retry_sec
+            await bind_channels()
+        else:
+            delay = min(max_retry_sec, delay * 2)
+
 async def start_monitoring():
     """启动监控"""
     try:
         print("🔗 正在连接到Telegram...")
-        await client.start()
-        print("✅ Telegram连接成功！")
+        # 主账号保持原有行为（允许交互式登录），其余账号并发连接
+        if not await connect_shard(SHARDS[0], interactive=True):
+            raise RuntimeError("主账号连接失败")
+        if len(SHARDS) > 1:
+            await _asyncio.gather(*(connect_shard(s) for s in SHARDS[1:]))
+        print(f"✅ Telegram连接成功！可用账号 {sum(1 for s in SHARDS if s.healthy)}/{len(SHARDS)}")
         _check_db_connectivity()
+        create_tables()
+        _spawn(_run_migrations_in_background())
+        load_chat_username_cache()
+        try:
+            print(f"🧷 已载入频道水位 {WATERMARKS.load()} 条")
+        except Exception as e:
+            print(f"⚠️ 载入频道水位失败: {e}")
+        watermark_task = _asyncio.get_running_loop().create_task(WATERMARKS.run())
         
-        # 获取用户信息
-        me = await client.get_me()
-        print(f"👤 当前用户: {me.first_name} (@{me.username if me.username else 'N/A'})")
-        
+        # 启动异步批量写入任务
+        writer.start()
+
+        # Prometheus 文本格式指标（METRICS_PORT=0 时关闭）
+        if settings.METRICS_PORT:
+            try:
+                await serve_metrics(settings.METRICS_HOST, settings.METRICS_PORT)
+                print(f"📈 指标地址: http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics")
+            except Exception as e:
+                print(f"⚠️ 启动指标服务失败: {e}")
+
         # 动态绑定频道并启动后台刷新任务
         await bind_channels()
         load_rules_cache()
-        client.loop.create_task(channels_watcher())
+        watcher = _asyncio.get_running_loop().create_task(channels_watcher())
         print("🎯 频道监听已启动（后台自动感知新增频道/规则）")
         
-        await client.run_until_disconnected()
+        try:
+            await _asyncio.gather(*(run_shard(s) for s in SHARDS))
+        finally:
+            watcher.cancel()
+            # 退出前把队列中剩余的消息落库，再写回水位
+            await writer.close()
+            watermark_task.cancel()
+            try:
+                await watermark_task
+            except _asyncio.CancelledError:
+                pass
         
     except Exception as e:
         print(f"❌ 连接失败: {e}")
@@ -663,49 +735,57 @@ async def start_monitoring():
         print("   2. 检查StringSession是否有效")
         print("   3. 检查API凭据是否正确")
 
-async def backfill_channel(channel_username: str):
-    """回溯抓取指定频道的历史消息，仅存入“包含网盘链接”的消息，并按链接唯一性覆盖更新。"""
+async def backfill_channel(channel_username: str, resume: bool = False):
+    """回溯抓取指定频道的历史消息，仅存入“包含网盘链接”的消息，并按链接唯一性覆盖更新。
+    每 CHECKPOINT_EVERY 条落库并保存断点，resume 为 True 时从上次中断处继续。"""
     uname = channel_username.lstrip('@') if channel_username else ''
     if not uname:
         print("❌ 请提供有效的频道用户名，例如：--backfill bsbdbfjfjff")
         return
 
-    print(f"⏪ 开始回溯抓取频道: {uname}")
+    ckpt = open_checkpoint(f'backfill_{uname}', resume)
+    saved = ckpt.channel(uname)
+    if saved['done']:
+        print(f"✅ 断点显示 {uname} 已回溯完成（{saved['count']} 条），如需重新回溯请去掉 --resume")
+        return
+    offset_id, count = saved['offset_id'], saved['count']
+
+    print(f"⏪ 开始回溯抓取频道: {uname}" + (f"（从消息ID {offset_id} 继续）" if offset_id else ""))
     await client.start()
+    create_tables()
+    load_rules_cache()
+
+    # 一次载入链接索引，按批解析与写入
+    bf = BackfillEngine(batch_size=settings.BACKFILL_BATCH_SIZE, rules_cache=RULES_CACHE)
+    every = max(1, settings.CHECKPOINT_EVERY)
+
+    async def save_checkpoint(done: bool = False):
+        # 先落库再记断点：断点只会落后于已写入的消息；flush 失败时异常直接抛出，不更新断点
+        await bf.flush_async()
+        ckpt.update(uname, offset_id, count, done)
+        ckpt.save()
 
-    inserted, updated, skipped = 0, 0, 0
     try:
-        async for msg in client.iter_messages(uname, limit=None):
+        await _asyncio.to_thread(bf.load_index)
+        async for msg in client.iter_messages(uname, limit=None, offset_id=offset_id):
             text = getattr(msg, 'message', None) or getattr(msg, 'raw_text', None)
-            if not text or not text.strip():
-                continue
-            # 清洗 + 严格链接提取
-            message = clean_channel_noise(text)
-            strict_links = extract_netdisk_links_strict(message)
-            if not strict_links:
-                skipped += 1
-                continue
-            parsed = parse_message(message)
-            parsed['links'] = strict_links
-            parsed['channel'] = uname
-            if should_drop_by_rules(uname, parsed):
-                continue
-            ts = to_beijing_time(getattr(msg, 'date', None)) or get_beijing_time()
-            with Session(engine) as session:
-                r = upsert_message_by_links(session, parsed, ts)
-                if r == 'updated':
-                    updated += 1
-                else:
-                    inserted += 1
-        print(f"⏪ 回溯完成：新增 {inserted} 条，更新 {updated} 条，跳过非白名单网盘 {skipped} 条")
+            await bf.add_async(text, uname, getattr(msg, 'date', None), message_urls(msg))
+            offset_id, count = msg.id, count + 1
+            if count % every == 0:
+                await save_checkpoint()
+        await save_checkpoint(done=True)
+        print(f"⏪ 回溯完成：{bf.summary(uname)}")
     except Exception as e:
         print(f"❌ 回溯抓取失败：{e}")
+        try:
+            await save_checkpoint()
+            print(f"💾 已保存断点（消息ID {offset_id}），可使用 --resume 继续")
+        except Exception as se:
+            print(f"⚠️ 保存断点失败: {se}")
 
 if __name__ == "__main__":
     if "--fix-tags" in sys.argv:
-        # 检查并修复tags字段脏数据
-        from sqlalchemy import update
-        from sqlalchemy.orm import Session
+        # 检查并修复tags字段脏数据（经 ORM 赋值，flush 时同步维护标签计数表）
         with Session(engine) as session:
             msgs = session.query(Message).all()
             fixed = 0
@@ -715,8 +795,8 @@ if __name__ == "__main__":
                     try:
                         import ast
                         tags_fixed = ast.literal_eval(msg.tags)
-                        if isinstance(msg.tags, list):
-                            session.execute(update(Message).where(Message.id==msg.id).values(tags=tags_fixed))
+                        if isinstance(tags_fixed, list):
+                            msg.tags = tags_fixed
                             fixed += 1
                     except Exception as e:
                         print(f"ID={msg.id} tags修复失败: {e}")
@@ -725,7 +805,6 @@ if __name__ == "__main__":
     elif "--dedup-links" in sys.argv:
         # 定期去重：只保留每个网盘链接最新的消息
         from sqlalchemy.orm import Session
-        from sqlalchemy import delete
         with Session(engine) as session:
             all_msgs = session.query(Message).order_by(Message.timestamp.desc()).all()
             link_to_id = {}  # {url: 最新消息id}
@@ -739,19 +818,38 @@ if __name__ == "__main__":
                     else:
                         link_to_id[url] = msg.id
             if id_to_delete:
-                session.execute(delete(Message).where(Message.id.in_(id_to_delete)))
+                # 逐个 ORM 删除，按天计数表（标签/网盘/频道）在同一事务内同步扣减
+                for msg in all_msgs:
+                    if msg.id in id_to_delete:
+                        session.delete(msg)
+                session.flush()
+                # 被删消息的 message_links 随外键级联删除，保留的消息重新认领其链接
+                kept_ids = set(link_to_id.values()) - id_to_delete
+                sync_links_bulk(session, [(m.id, m.links) for m in reversed(all_msgs) if m.id in kept_ids])
                 session.commit()
                 print(f"已删除重复网盘链接的旧消息条目: {len(id_to_delete)}")
             else:
                 print("没有需要删除的重复网盘链接消息。")
+    elif "--rebuild-links" in sys.argv:
+        # 由 messages.links 重建 message_links 去重索引（首次升级或数据修复时执行）
+        create_tables()
+        with Session(engine) as session:
+            total = rebuild_message_links(session)
+        print(f"已重建链接索引，涉及消息 {total} 条")
+    elif "--rebuild-rollups" in sys.argv:
+        # 由 messages 全量重建按天计数表（标签云等统计），首次上线或数据修复时执行
+        from utils.rollups import rebuild_rollups
+        create_tables()
+        for table, rows in rebuild_rollups().items():
+            print(f"已重建 {table}：{rows} 行")
     elif "--backfill" in sys.argv:
         import asyncio
         idx = sys.argv.index("--backfill")
         ch = sys.argv[idx+1] if len(sys.argv) > idx+1 else None
         if not ch:
-            print("用法: python monitor.py --backfill <channel_username>")
+            print("用法: python monitor.py --backfill <channel_username> [--resume]")
         else:
-            asyncio.run(backfill_channel(ch))
+            asyncio.run(backfill_channel(ch, resume="--resume" in sys.argv))
     else:
         import asyncio
         asyncio.run(start_monitoring())
\ No newline at end of file
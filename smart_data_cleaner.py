@@ -23,6 +23,7 @@ from sqlalchemy.orm import Session
 
 from model import Message, engine
 from import_historical_data import extract_links_from_text, extract_tags_from_text
+from utils.message_store import find_message_by_links, sync_message_links, sync_links_bulk
 
 BEIJING_TZ = timezone(timedelta(hours=8))
 
@@ -293,14 +294,7 @@ def import_first_n(rows: List[Dict[str, Any]], n: int = 10) -> List[int]:
                 ca = parse_timestamp(row.get('created_at'))
 
                 # 去重：任一网盘链接存在则跳过该条
-                exists = None
-                for netdisk, link in (row.get('links') or {}).items():
-                    q = session.query(Message).filter(
-                        Message.links.op('->>')(netdisk) == link
-                    ).first()
-                    if q:
-                        exists = q
-                        break
+                exists = find_message_by_links(session, row.get('links') or {})
                 if exists:
                     continue
 
@@ -318,6 +312,7 @@ def import_first_n(rows: List[Dict[str, Any]], n: int = 10) -> List[int]:
                 )
                 session.add(msg)
                 session.flush()  # 先获取自增 ID
+                sync_message_links(session, msg.id, msg.links)
                 inserted_ids.append(msg.id)
                 inserted += 1
             except Exception as e:
@@ -386,24 +381,8 @@ def query_and_print_by_ids(ids: List[int]):
 
 
 def find_existing_by_links(session: Session, links: Dict[str, str]) -> Optional[Message]:
-    if not links:
-        return None
-    # 逐个网盘键查询，任一匹配即认为存在
-    for netdisk, link in links.items():
-        if not link:
-            continue
-        try:
-            m = (
-                session.query(Message)
-                .filter(Message.links.op('->>')(netdisk) == link)
-                .first()
-            )
-            if m:
-                return m
-        except Exception:
-            # 某些数据库适配器可能不支持 ->> 操作，忽略异常继续
-            continue
-    return None
+    # 任一链接命中 message_links 唯一索引即认为存在
+    return find_message_by_links(session, links)
 
 
 def upsert_row(session: Session, row: Dict[str, Any]) -> Tuple[str, int]:
@@ -430,6 +409,7 @@ def upsert_row(session: Session, row: Dict[str, Any]) -> Tuple[str, int]:
         existing.created_at = ca
         session.add(existing)
         session.flush()
+        sync_message_links(session, existing.id, existing.links)
         return ('updated', int(existing.id or 0))
 
     # 插入
@@ -447,6 +427,7 @@ def upsert_row(session: Session, row: Dict[str, Any]) -> Tuple[str, int]:
     )
     session.add(msg)
     session.flush()
+    sync_message_links(session, msg.id, msg.links)
     return ('inserted', int(msg.id or 0))
 
 
@@ -550,6 +531,7 @@ def import_jsonl_insert_only(path: str, commit_every: int = 500) -> Dict[str, in
         raise FileNotFoundError(f'文件不存在: {path}')
     inserted = skipped = processed = 0
     with Session(engine) as session:
+        pending: List[Message] = []  # 待同步 message_links 的新消息
         with open(path, 'r', encoding='utf-8', errors='ignore') as f:
             for line in f:
                 processed += 1
@@ -578,12 +560,18 @@ def import_jsonl_insert_only(path: str, commit_every: int = 500) -> Dict[str, in
                         created_at=ca,
                     )
                     session.add(msg)
+                    pending.append(msg)
                     inserted += 1
                     if inserted % commit_every == 0:
+                        session.flush()
+                        sync_links_bulk(session, [(m.id, m.links) for m in pending])
+                        pending.clear()
                         session.commit()
                 except Exception as e:
                     skipped += 1
                     print(f"❌ 插入失败: {e}")
+            session.flush()
+            sync_links_bulk(session, [(m.id, m.links) for m in pending])
             session.commit()
     print(f"\n===== JSONL 导入完成（仅插入） =====")
     print(f"读取行数: {processed}")
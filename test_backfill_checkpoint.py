@@ -0,0 +1,52 @@
+import asyncio
+import datetime
+
+from utils.backfill import BackfillEngine
+from utils.backfill_scheduler import BackfillScheduler, ChannelTask
+from utils.checkpoint import Checkpoint
+
+
+def _failing_write(batch):
+    raise RuntimeError("db down")
+
+
+def _engine_with_pending():
+    bf = BackfillEngine(batch_size=10)
+    bf.pending.append(({'title': 't', 'links': {'夸克网盘': 'https://pan.quark.cn/s/abc'}, 'channel': 'ch'},
+                       datetime.datetime(2024, 1, 1)))
+    return bf
+
+
+def test_flush_keeps_batch_when_write_fails(monkeypatch):
+    bf = _engine_with_pending()
+    monkeypatch.setattr(bf, '_write', _failing_write)
+    try:
+        asyncio.run(bf.flush_async())
+    except RuntimeError:
+        pass
+    assert len(bf.pending) == 1
+
+    written = []
+    monkeypatch.setattr(bf, '_write', written.extend)
+    bf.flush()
+    assert len(written) == 1 and bf.pending == []
+
+
+def test_checkpoint_not_advanced_when_flush_fails(monkeypatch, tmp_path):
+    path = tmp_path / 'backfill.json'
+    ckpt = Checkpoint(str(path))
+    ckpt.update('ch', 100, 5)
+    ckpt.save()
+
+    bf = _engine_with_pending()
+    monkeypatch.setattr(bf, '_write', _failing_write)
+    scheduler = BackfillScheduler(client=None, checkpoint=ckpt, flush=bf.flush_async)
+    task = ChannelTask('ch')
+    task.offset_id, task.count = 100, 5
+    task.advance(90)
+    scheduler.tasks.append(task)
+
+    asyncio.run(scheduler.save_checkpoint())
+
+    assert Checkpoint.load(str(path)).channel('ch')['offset_id'] == 100
+    assert len(bf.pending) == 1
@@ -0,0 +1,118 @@
+import asyncio
+import datetime
+from datetime import timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from model import engine
+from utils.channel_rules import should_drop_by_rules
+from utils.ingest import extract_message
+from utils.message_store import build_existing_link_index, upsert_messages_batch
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def _to_beijing(dt) -> datetime.datetime:
+    if dt is None:
+        return datetime.datetime.now(BEIJING_TZ).replace(tzinfo=None)
+    if dt.tzinfo is None:
+        # 假设输入是 UTC 时间
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(BEIJING_TZ).replace(tzinfo=None)
+
+
+class BackfillEngine:
+    """历史回溯共用的批量写入引擎：
+    - 启动时一次载入链接索引（{规范化链接: message_id}），之后查重只查内存
+    - 处理管线与实时监听一致（utils.ingest）：白名单域名预过滤 → 清洗 → 严格链接提取 → 解析 → 规则
+    - 攒满 batch_size 条后整批 upsert（一次事务），多个频道可共用同一引擎
+    """
+
+    def __init__(self, batch_size: int = 1000, rules_cache: Optional[dict] = None):
+        self.batch_size = max(1, batch_size)
+        self.rules_cache = rules_cache or {}
+        self.link_index: Optional[Dict[str, int]] = None
+        self.pending: List[Tuple[dict, datetime.datetime]] = []
+        # {channel: {'inserted','updated','skipped','dropped'}}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._alock: Optional[asyncio.Lock] = None
+
+    def load_index(self):
+        with Session(engine) as session:
+            self.link_index = build_existing_link_index(session)
+        print(f"🗂️ 已载入链接索引 {len(self.link_index)} 条")
+
+    def channel_stats(self, channel: str) -> Dict[str, int]:
+        st = self.stats.get(channel)
+        if st is None:
+            st = self.stats[channel] = {'inserted': 0, 'updated': 0, 'skipped': 0, 'dropped': 0}
+        return st
+
+    def prepare(self, text: str, channel: str, date=None, urls=None) -> Optional[Tuple[dict, datetime.datetime]]:
+        """单条消息走处理管线，返回待写入的 (parsed, timestamp)；不入库时返回 None"""
+        st = self.channel_stats(channel)
+        if not text or not text.strip():
+            return None
+        # 与实时监听同一管线（utils.ingest）；回溯始终只保留白名单网盘消息
+        parsed, _ = extract_message(text, urls or (), strict_only=True)
+        if parsed is None:
+            st['skipped'] += 1
+            return None
+        parsed['channel'] = channel
+        if should_drop_by_rules(self.rules_cache, channel, parsed):
+            st['dropped'] += 1
+            return None
+        return parsed, _to_beijing(date)
+
+    def add(self, text: str, channel: str, date=None, urls=None):
+        """同步用法：攒满一批后立即写入"""
+        item = self.prepare(text, channel, date, urls)
+        if item is not None:
+            self.pending.append(item)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        # 写入成功后才移出待写队列：失败时整批保留，下次 flush 重试，断点不会越过未落库的消息
+        batch = list(self.pending)
+        self._write(batch)
+        del self.pending[:len(batch)]
+
+    async def add_async(self, text: str, channel: str, date=None, urls=None):
+        """异步用法：写入在线程中执行，不阻塞 Telethon 事件循环"""
+        item = self.prepare(text, channel, date, urls)
+        if item is not None:
+            self.pending.append(item)
+            if len(self.pending) >= self.batch_size:
+                await self.flush_async()
+
+    async def flush_async(self):
+        if self._alock is None:
+            self._alock = asyncio.Lock()
+        # 多个频道共用索引，写入串行执行；写入期间新加入的消息排在本批之后，留给下一次 flush
+        async with self._alock:
+            batch = list(self.pending)
+            await asyncio.to_thread(self._write, batch)
+            del self.pending[:len(batch)]
+
+    def _write(self, batch: List[Tuple[dict, datetime.datetime]]):
+        if not batch:
+            return
+        if self.link_index is None:
+            self.load_index()
+        with Session(engine) as session:
+            try:
+                results = upsert_messages_batch(session, batch, link_index=self.link_index)
+            except Exception:
+                session.rollback()
+                raise
+        for (parsed, _), r in zip(batch, results):
+            self.channel_stats(parsed.get('channel') or '')[r] += 1
+
+    def summary(self, channel: str = None) -> str:
+        if channel is not None:
+            st = self.channel_stats(channel)
+        else:
+            st = {k: sum(s[k] for s in self.stats.values()) for k in ('inserted', 'updated', 'skipped', 'dropped')}
+        return f"新增 {st['inserted']} 条，更新 {st['updated']} 条，跳过非白名单网盘 {st['skipped']} 条，规则忽略 {st['dropped']} 条"
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telethon.errors import (
+    ChannelPrivateError,
+    FloodWaitError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
+
+# 各阶段对应的 API 请求类型：限流按请求类型分别计时
+RESOLVE_REQUEST = 'ResolveUsernameRequest'
+HISTORY_REQUEST = 'GetHistoryRequest'
+
+
+class ChannelTask:
+    """单个频道的回溯进度；FloodWait 重试时从 offset_id 继续，已处理的消息不会重复"""
+    __slots__ = ('channel', 'username', 'entity', 'offset_id', 'count', 'attempts', 'status', 'error', 'started', 'finished')
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.username = channel.rstrip('/').split('/')[-1].lstrip('@').strip()
+        self.entity = None
+        # 已处理到的最小消息 id（iter_messages 从新到旧遍历）；0 表示从最新开始
+        self.offset_id = 0
+        self.count = 0
+        self.attempts = 0
+        self.status = 'pending'
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def request_type(self) -> str:
+        return RESOLVE_REQUEST if self.entity is None else HISTORY_REQUEST
+
+    def advance(self, message_id: int):
+        """job 每处理完一条消息调用一次，记录断点"""
+        self.offset_id = message_id
+        self.count += 1
+
+
+# job(client, task)：从 task.offset_id 开始遍历 task.entity 的历史消息，每条处理后调用 task.advance(msg.id)
+BackfillJob = Callable[[object, ChannelTask], Awaitable[None]]
+
+
+class BackfillScheduler:
+    """单个客户端上并发回溯多个频道：
+    - concurrency 个 worker 同时处理不同频道
+    - FloodWait 按请求类型（解析用户名 / 拉取历史）分别记录截止时间，只有同类请求等待，
+      被限流的频道带着断点重新排队，而不是直接跳过
+    - 定期打印每个频道的进度
+    - 传入 checkpoint 时按断点恢复各频道进度，已完成的频道不再处理；
+      job 写库而非写文件时需传入 flush，保存断点前先把已处理的消息落库
+    """
+
+    def __init__(self, client, concurrency: int = 4, report_interval: float = 30.0, checkpoint=None,
+                 flush: Optional[Callable[[], Awaitable[None]]] = None):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.report_interval = report_interval
+        self.checkpoint = checkpoint
+        self.flush = flush
+        # {请求类型: 可再次请求的 monotonic 时间}
+        self.flood_until: Dict[str, float] = {}
+        self.tasks: List[ChannelTask] = []
+
+    def _blocked_for(self, request_type: str) -> float:
+        return max(0.0, self.flood_until.get(request_type, 0.0) - time.monotonic())
+
+    def _flood(self, fe: FloodWaitError, task: ChannelTask):
+        request = getattr(fe, 'request', None)
+        request_type = type(request).__name__ if request is not None else task.request_type
+        wait_s = getattr(fe, 'seconds', 5) or 5
+        self.flood_until[request_type] = max(self.flood_until.get(request_type, 0.0), time.monotonic() + wait_s + 1)
+        print(f"⏳ {request_type} 频率限制 {wait_s}s，{task.username} 已处理 {task.count} 条，稍后从断点继续")
+
+    async def run(self, channels: Iterable[str], job: BackfillJob) -> List[ChannelTask]:
+        seen = set()
+        for ch in channels:
+            task = ChannelTask(ch)
+            if not task.username or task.username in seen:
+                continue
+            seen.add(task.username)
+            if self.checkpoint is not None:
+                saved = self.checkpoint.channel(task.username)
+                task.offset_id, task.count = saved['offset_id'], saved['count']
+                if saved['done']:
+                    task.status = 'done'
+            self.tasks.append(task)
+        if not self.tasks:
+            return []
+        queue = deque(t for t in self.tasks if t.status != 'done')
+        skipped = len(self.tasks) - len(queue)
+        if skipped:
+            print(f"⏭️ 断点中已完成 {skipped} 个频道，跳过")
+        if not queue:
+            return self.tasks
+        print(f"🚦 开始并发回溯 {len(queue)} 个频道（并发 {self.concurrency}）")
+
+        async def worker():
+            while queue:
+                # 优先取当前请求类型未被限流的频道
+                task = None
+                for _ in range(len(queue)):
+                    candidate = queue.popleft()
+                    if self._blocked_for(candidate.request_type) <= 0:
+                        task = candidate
+                        break
+                    queue.append(candidate)
+                if task is None:
+                    await asyncio.sleep(min(self._blocked_for(t.request_type) for t in queue) if queue else 0)
+                    continue
+                if await self._run_task(task, job):
+                    queue.append(task)
+
+        reporter = asyncio.create_task(self._report_loop())
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(queue)))))
+        finally:
+            reporter.cancel()
+            await self.save_checkpoint()
+        return self.tasks
+
+    async def save_checkpoint(self):
+        """记录所有频道的断点。进度在 flush 之前同步取得，断点只会落后于实际写入、不会超前
+        （超前会在续传时漏掉消息）；job 每 CHECKPOINT_EVERY 条调用一次。
+        """
+        if self.checkpoint is None:
+            return
+        snap = self.checkpoint.snapshot(self.tasks)
+        if self.flush is not None:
+            try:
+                await self.flush()
+            except Exception as e:
+                # 未落库的消息仍留在待写队列中，不保存越过它们的断点
+                print(f"⚠️ 写入失败，断点未保存: {e}")
+                return
+        try:
+            self.checkpoint.save(snap)
+        except Exception as e:
+            print(f"⚠️ 保存断点失败: {e}")
+
+    async def _run_task(self, task: ChannelTask, job: BackfillJob) -> bool:
+        """处理一个频道；返回 True 表示被限流、需要重新排队"""
+        task.attempts += 1
+        task.status = 'running'
+        if task.started is None:
+            task.started = time.monotonic()
+        try:
+            if task.entity is None:
+                task.entity = await self.client.get_entity(task.username)
+            await job(self.client, task)
+            task.status = 'done'
+        except FloodWaitError as fe:
+            self._flood(fe, task)
+            task.status = 'flood_wait'
+            return True
+        except (ChannelPrivateError, UsernameInvalidError, UsernameNotOccupiedError) as e:
+            print(f"❌ 无法访问频道 {task.username}: {e}")
+            task.status, task.error = 'failed', type(e).__name__
+        except Exception as e:
+            print(f"❌ 频道 {task.username} 回溯失败（已处理 {task.count} 条）: {e}")
+            task.status, task.error = 'failed', str(e)[:200]
+        task.finished = time.monotonic()
+        if task.status == 'done':
+            print(f"✅ {task.username} 完成：{task.count} 条，耗时 {task.finished - task.started:.0f}s")
+            await self.save_checkpoint()
+        return False
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    def report(self):
+        counts: Dict[str, int] = {}
+        for t in self.tasks:
+            counts[t.status] = counts.get(t.status, 0) + 1
+        summary = '，'.join(f"{k} {v}" for k, v in sorted(counts.items()))
+        print(f"📊 回溯进度（{summary}）")
+        for t in self.tasks:
+            if t.status in ('running', 'flood_wait'):
+                wait = self._blocked_for(t.request_type)
+                suffix = f"，限流剩余 {wait:.0f}s" if wait > 0 else ''
+                print(f"  - {t.username}: {t.status} 已处理 {t.count} 条，断点 {t.offset_id}{suffix}")
+
+    def failed(self) -> List[ChannelTask]:
+        return [t for t in self.tasks if t.status == 'failed']
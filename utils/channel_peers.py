@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from model import ChannelPeer, engine
+
+
+def load_chat_usernames() -> Dict[int, str]:
+    """载入 {chat_id: username}"""
+    with Session(engine) as session:
+        rows = session.query(ChannelPeer.chat_id, ChannelPeer.username).filter(ChannelPeer.username.isnot(None)).all()
+    return {int(cid): uname for cid, uname in rows if uname}
+
+
+def save_chat_usernames(mapping: Dict[int, str]):
+    """批量写入/更新 chat_id 对应的用户名（用户名变更时覆盖）"""
+    rows = [{'chat_id': int(cid), 'username': uname, 'updated_at': datetime.utcnow()} for cid, uname in mapping.items() if cid]
+    if not rows:
+        return
+    with Session(engine) as session:
+        stmt = pg_insert(ChannelPeer).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChannelPeer.chat_id],
+            set_={'username': stmt.excluded.username, 'updated_at': stmt.excluded.updated_at},
+        )
+        session.execute(stmt)
+        session.commit()
@@ -0,0 +1,96 @@
+import re
+from typing import Dict, Iterable, Optional
+
+from utils.netdisk import NETDISK_BITS
+
+# 网盘类型 → 位（白名单网盘与 messages.netdisk_types 一致，其他名称在规则编译时追加），按位与判断是否命中排除的网盘类型
+_NETDISK_BITS: Dict[str, int] = dict(NETDISK_BITS)
+
+
+def _netdisk_bit(name: str) -> int:
+    bit = _NETDISK_BITS.get(name)
+    if bit is None:
+        bit = _NETDISK_BITS[name] = 1 << len(_NETDISK_BITS)
+    return bit
+
+
+def _keyword_pattern(keywords) -> str:
+    """把关键词编译成前缀树形式的单个正则：公共前缀只比较一次，每个位置的匹配代价与关键词数量基本无关。
+    只需判断“是否包含任一关键词”，因此某关键词是另一关键词的前缀时只保留较短者。
+    """
+    trie: dict = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        if '' in node:
+            return ''
+        leaves, branches = [], []
+        for ch in sorted(node):
+            rest = build(node[ch])
+            if rest:
+                branches.append(re.escape(ch) + rest)
+            else:
+                leaves.append(re.escape(ch))
+        parts = branches
+        if len(leaves) == 1:
+            parts.append(leaves[0])
+        elif leaves:
+            parts.append('[' + ''.join(leaves) + ']')
+        return parts[0] if len(parts) == 1 else '(?:' + '|'.join(parts) + ')'
+
+    return build(trie)
+
+
+class CompiledRule:
+    """单个频道的已编译规则"""
+    __slots__ = ('netdisk_mask', 'keyword_re', 'tags')
+
+    def __init__(self, exclude_netdisks=None, exclude_keywords=None, exclude_tags=None):
+        mask = 0
+        for name in exclude_netdisks or []:
+            if name:
+                mask |= _netdisk_bit(name)
+        self.netdisk_mask = mask
+        keywords = {kw.lower() for kw in (exclude_keywords or []) if kw}
+        self.keyword_re: Optional[re.Pattern] = re.compile(_keyword_pattern(keywords)) if keywords else None
+        self.tags = frozenset(t for t in (exclude_tags or []) if t)
+
+
+def build_rules_cache(rules: Iterable) -> Dict[str, CompiledRule]:
+    """由启用的 ChannelRule 行构建 {channel: CompiledRule}"""
+    return {
+        r.channel: CompiledRule(r.exclude_netdisks, r.exclude_keywords, r.exclude_tags)
+        for r in rules
+    }
+
+
+def should_drop_by_rules(rules_cache: Dict[str, CompiledRule], channel: str, parsed: dict) -> bool:
+    if not channel:
+        return False
+    rule = rules_cache.get(channel)
+    if not rule:
+        return False
+    # 1) 网盘类型命中
+    if rule.netdisk_mask:
+        links = parsed.get('links') or {}
+        mask = 0
+        for name in links:
+            mask |= _NETDISK_BITS.get(name, 0)
+        if mask & rule.netdisk_mask:
+            return True
+    # 2) 关键词命中（标题/描述）
+    if rule.keyword_re is not None:
+        title = (parsed.get('title') or '').lower()
+        desc = (parsed.get('description') or '').lower()
+        if rule.keyword_re.search(title) or rule.keyword_re.search(desc):
+            return True
+    # 3) 标签命中
+    if rule.tags:
+        tags = parsed.get('tags')
+        if tags and not rule.tags.isdisjoint(tags):
+            return True
+    return False
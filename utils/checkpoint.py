@@ -0,0 +1,95 @@
+import copy
+import datetime
+import json
+import os
+from typing import Iterable, Optional
+
+from config import settings
+
+
+def checkpoint_path(name: str) -> str:
+    return os.path.join(settings.CHECKPOINT_DIR, f"{name}.json")
+
+
+class Checkpoint:
+    """回溯/导出断点：每个频道记录已处理到的消息 id，导出时另记录输出文件已落盘的字节数。
+    断点文件先写临时文件再 os.replace，进程中途退出也不会留下半个 JSON。
+    """
+
+    def __init__(self, path: str, data: Optional[dict] = None):
+        self.path = path
+        self.data = data or {'output': None, 'bytes': 0, 'channels': {}}
+        self.output_file = None
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Checkpoint']:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(path, json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ 断点文件无法读取，将从头开始: {path} ({e})")
+            return None
+
+    @property
+    def output(self) -> Optional[str]:
+        return self.data.get('output')
+
+    def channel(self, name: str) -> dict:
+        return self.data['channels'].get(name) or {'offset_id': 0, 'count': 0, 'done': False}
+
+    def update(self, name: str, offset_id: int, count: int, done: bool = False):
+        self.data['channels'][name] = {'offset_id': offset_id, 'count': count, 'done': done}
+
+    def open_output(self, path: str, resume: bool):
+        """打开导出文件：续传时截断到断点记录的字节数（丢弃断点之后写入的行），否则新建"""
+        self.data['output'] = path
+        if resume and os.path.exists(path):
+            os.truncate(path, self.data.get('bytes') or 0)
+            self.output_file = open(path, 'a', encoding='utf-8')
+        else:
+            self.data['bytes'] = 0
+            self.output_file = open(path, 'w', encoding='utf-8')
+        return self.output_file
+
+    def snapshot(self, tasks: Iterable = ()) -> dict:
+        """同步记录当前各频道进度与输出文件大小；两者在同一时刻取得，保证一致"""
+        for t in tasks:
+            self.update(t.username, t.offset_id, t.count, t.status == 'done')
+        if self.output_file is not None:
+            self.output_file.flush()
+            self.data['bytes'] = os.fstat(self.output_file.fileno()).st_size
+        self.data['updated_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+        return copy.deepcopy(self.data)
+
+    def save(self, snap: Optional[dict] = None):
+        if snap is None:
+            snap = self.snapshot()
+        if self.output_file is not None:
+            os.fsync(self.output_file.fileno())
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        if self.output_file is not None:
+            self.output_file.close()
+            self.output_file = None
+
+
+def open_checkpoint(name: str, resume: bool) -> Checkpoint:
+    """--resume 时载入已有断点，否则新建（覆盖旧断点）"""
+    path = checkpoint_path(name)
+    if resume:
+        ckpt = Checkpoint.load(path)
+        if ckpt is not None:
+            done = sum(1 for c in ckpt.data['channels'].values() if c.get('done'))
+            print(f"♻️ 从断点继续：{path}（已完成频道 {done}/{len(ckpt.data['channels'])}）")
+            return ckpt
+        print(f"ℹ️ 未找到断点文件 {path}，从头开始")
+    return Checkpoint(path)
@@ -0,0 +1,63 @@
+"""前台分页总数：尽量不做全表 count。
+
+- 只有时间范围（可加单个网盘类型）时：整天取按天计数表，起始日不足一天的部分走 (timestamp) 索引精确计数，结果精确
+- 其他组合筛选：先取规划器估算行数（EXPLAIN，不执行查询）；估算足够小时再做有上限的精确计数，否则返回估算值
+"""
+import json
+from datetime import datetime, time, timedelta
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+
+from model import Message, MessageDailyCount, NetdiskDailyCount
+from utils.netdisk import NETDISK_BITS
+
+# 估算行数不超过该值时才做精确计数（计数本身也以此为上限）
+EXACT_COUNT_LIMIT = 5000
+
+
+def rollup_count(session: Session, since: Optional[datetime] = None, netdisk: Optional[str] = None) -> int:
+    """前台可见消息数（可限定单个网盘类型），精确值"""
+    if netdisk:
+        model, key = NetdiskDailyCount, NetdiskDailyCount.netdisk == netdisk
+    else:
+        model, key = MessageDailyCount, MessageDailyCount.scope == 'listed'
+    q = session.query(func.coalesce(func.sum(model.count), 0)).filter(key)
+    if since is None:
+        return int(q.scalar())
+    next_day = since.date() + timedelta(days=1)
+    full_days = int(q.filter(model.day >= next_day).scalar())
+    partial = (
+        session.query(func.count(Message.id))
+        .filter(Message.netdisk_types != 0)
+        .filter(Message.timestamp >= since, Message.timestamp < datetime.combine(next_day, time()))
+    )
+    if netdisk:
+        partial = partial.filter(Message.netdisk_types.op('&')(NETDISK_BITS.get(netdisk, 0)) != 0)
+    return full_days + int(partial.scalar())
+
+
+def planner_estimate(session: Session, query: Query) -> int:
+    """规划器估算的结果行数（EXPLAIN，不执行查询）"""
+    compiled = query.statement.compile(dialect=session.get_bind().dialect)
+    plan = session.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_messages(session: Session, query: Query, since: Optional[datetime] = None, tags: Sequence[str] = (),
+                   netdisks: Sequence[str] = (), search: str = '') -> Tuple[int, bool]:
+    """query 为已应用全部筛选条件的查询（不含排序/分页），返回 (条数, 是否精确)"""
+    netdisks = list(netdisks or [])
+    if not tags and not (search or '').strip() and len(netdisks) <= 1:
+        return rollup_count(session, since, netdisks[0] if netdisks else None), True
+    query = query.with_entities(Message.id).order_by(None)
+    estimate = planner_estimate(session, query)
+    if estimate <= EXACT_COUNT_LIMIT:
+        bounded = query.limit(EXACT_COUNT_LIMIT + 1).subquery()
+        exact = session.query(func.count()).select_from(bounded).scalar()
+        if exact <= EXACT_COUNT_LIMIT:
+            return int(exact), True
+    return estimate, False
@@ -0,0 +1,65 @@
+"""采集管线：实时监听/断线补抓（monitor.py）、历史回溯（utils/backfill.py）与基准测试（bench_ingest.py）共用。
+
+白名单域名预过滤 → 清洗频道署名 → 严格链接提取（正文 + entities/按钮 URL）→ 解析 → 空内容判断；
+频道规则依赖频道用户名，由调用方在之后用 utils.channel_rules.should_drop_by_rules 判断。
+"""
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Iterable, List, Optional, Tuple
+
+from utils.message_parser import parse_message
+from utils.netdisk import (
+    clean_channel_noise,
+    extract_netdisk_links_from_urls,
+    extract_netdisk_links_strict,
+    has_netdisk_host,
+)
+
+# timer(阶段名) 返回计时用的上下文管理器，如 utils.metrics.timed
+Timer = Callable[[str], ContextManager]
+
+
+def _no_timer(stage: str) -> ContextManager:
+    return nullcontext()
+
+
+def message_urls(msg) -> List[str]:
+    """Telethon 消息的 entities 与按钮中的 URL（链接常放在按钮或文字链接里，不出现在正文中）"""
+    urls = []
+    ents = getattr(msg, 'entities', None)
+    if ents:
+        urls.extend(getattr(ent, 'url', None) for ent in ents)
+    btns = getattr(msg, 'buttons', None)
+    if btns:
+        for row in btns:
+            urls.extend(getattr(button, 'url', None) for button in row)
+    return [u for u in urls if u]
+
+
+def extract_message(raw: str, extra_urls: Iterable[str] = (), strict_only: bool = True,
+                    timer: Timer = _no_timer) -> Tuple[Optional[dict], Optional[str]]:
+    """单条消息走采集管线：返回 (parsed, None)，不入库时返回 (None, 丢弃原因 non_netdisk / no_content)"""
+    urls = [u for u in extra_urls if u]
+    with timer('prefilter'):
+        no_host = strict_only and not has_netdisk_host(raw) and not has_netdisk_host("\n".join(urls))
+    if no_host:
+        return None, 'non_netdisk'
+
+    with timer('clean_noise'):
+        message = clean_channel_noise(raw)
+
+    with timer('extract_links'):
+        links = extract_netdisk_links_strict(message)
+        extra = extract_netdisk_links_from_urls(urls)
+        if extra:
+            links.update(extra)
+    if not links and strict_only:
+        return None, 'non_netdisk'
+
+    with timer('parse_message'):
+        parsed = parse_message(message)
+    parsed['links'] = links or None
+
+    # 若解析后无标题、无描述、无链接、无标签，则忽略
+    if not any([parsed.get('title'), parsed.get('description'), parsed.get('links'), parsed.get('tags')]):
+        return None, 'no_content'
+    return parsed, None
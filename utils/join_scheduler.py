@@ -0,0 +1,205 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from telethon import utils as tl_utils
+from telethon.errors import (
+    ChannelPrivateError,
+    FloodWaitError,
+    UserAlreadyParticipantError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
+from telethon.tl.functions.channels import JoinChannelRequest
+
+from model import ChannelJoinState, engine
+
+# 终态：在重试间隔内不再请求
+_TERMINAL = ("private", "invalid", "failed")
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为突发上限"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class JoinScheduler:
+    """限速并发加入频道：
+    - 当前账号已加入（表中有 chat_id/access_hash）的频道直接跳过，不发任何请求
+    - 私有/无效/失败的频道在 retry_hours 内不重试
+    - 其余频道由 concurrency 个 worker 处理，每次 API 请求先取令牌；
+      FloodWait 时所有 worker 暂停到截止时间，该频道重新排队
+    """
+
+    def __init__(self, client, concurrency: int = 3, rate_per_min: int = 20, burst: int = 5, retry_hours: int = 6,
+                 account: Optional[str] = None):
+        self.client = client
+        # 加入状态按账号区分：频道迁移到其他账号后需由新账号重新加入
+        self.account = account
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self.retry_after = timedelta(hours=retry_hours)
+        self._flood_until = 0.0
+        # 上次 join_all 中未能解析的频道最早可重试的时间（UTC）；None 表示没有待重试的频道
+        self.next_retry: Optional[datetime] = None
+
+    async def join_all(self, usernames: Iterable[str]) -> Dict[str, dict]:
+        """返回 {username: {'chat_id':..., 'access_hash':..., 'username': 实体当前用户名}}（仅包含已解析的频道）"""
+        names = {}
+        for uname in usernames:
+            u = (uname or '').lstrip('@').strip()
+            if u:
+                names[uname] = u
+        if not names:
+            return {}
+        states = await asyncio.to_thread(_load_states, list(names.values()))
+
+        result: Dict[str, dict] = {}
+        queue: asyncio.Queue = asyncio.Queue()
+        now = datetime.utcnow()
+        retry_times = []
+        skipped = 0
+        for uname, u in names.items():
+            st = states.get(u)
+            if st and st['status'] == 'joined' and st['chat_id'] and st['account'] == self.account:
+                result[uname] = {'chat_id': st['chat_id'], 'access_hash': st['access_hash'], 'username': u}
+                skipped += 1
+            elif st and st['status'] in _TERMINAL and st['updated_at'] and now - st['updated_at'] < self.retry_after:
+                if st['chat_id']:
+                    access_hash = st['access_hash'] if st['account'] == self.account else None
+                    result[uname] = {'chat_id': st['chat_id'], 'access_hash': access_hash, 'username': u}
+                else:
+                    retry_times.append(st['updated_at'] + self.retry_after)
+                skipped += 1
+            else:
+                queue.put_nowait((uname, u))
+        if skipped:
+            print(f"⏭️ 跳过 {skipped} 个已加入或近期失败的频道")
+        pending = queue.qsize()
+        if not pending:
+            self.next_retry = min(retry_times) if retry_times else None
+            return result
+        print(f"📥 开始加入 {pending} 个频道（并发 {self.concurrency}）")
+
+        async def worker():
+            while True:
+                try:
+                    uname, u = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                info = await self._join_one(u)
+                if info is None:
+                    # 触发频率限制：重新排队，等待截止时间后继续
+                    queue.put_nowait((uname, u))
+                    continue
+                if info.get('chat_id'):
+                    result[uname] = {
+                        'chat_id': info['chat_id'],
+                        'access_hash': info.get('access_hash'),
+                        'username': info.get('entity_username') or u,
+                    }
+                else:
+                    retry_times.append(datetime.utcnow() + self.retry_after)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, pending))))
+        self.next_retry = min(retry_times) if retry_times else None
+        return result
+
+    async def _wait_turn(self):
+        delay = self._flood_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+
+    def _flood(self, fe: FloodWaitError, u: str):
+        wait_s = getattr(fe, 'seconds', 5) or 5
+        self._flood_until = max(self._flood_until, time.monotonic() + wait_s + 1)
+        print(f"⏳ 频率限制，全部加入任务暂停 {wait_s}s（@{u} 稍后重试）")
+
+    async def _join_one(self, u: str) -> Optional[dict]:
+        """处理单个频道并持久化状态；FloodWait 时返回 None"""
+        chat_id = access_hash = None
+        entity_username = None
+        try:
+            await self._wait_turn()
+            entity = await self.client.get_entity(u)
+            chat_id = tl_utils.get_peer_id(entity)
+            access_hash = getattr(entity, 'access_hash', None)
+            entity_username = getattr(entity, 'username', None)
+            try:
+                await self._wait_turn()
+                await self.client(JoinChannelRequest(entity))
+                print(f"📥 已尝试加入频道 @{u}")
+                status, err = 'joined', None
+            except UserAlreadyParticipantError:
+                # 已经在频道中
+                status, err = 'joined', None
+            except ChannelPrivateError:
+                print(f"🚫 无法加入私有频道 @{u}（需要邀请链接）")
+                status, err = 'private', 'ChannelPrivateError'
+        except FloodWaitError as fe:
+            self._flood(fe, u)
+            return None
+        except (UsernameInvalidError, UsernameNotOccupiedError) as e:
+            print(f"❓ 无效或不存在的频道用户名: @{u}")
+            status, err = 'invalid', type(e).__name__
+        except ChannelPrivateError:
+            print(f"🚫 无法加入私有频道 @{u}（需要邀请链接）")
+            status, err = 'private', 'ChannelPrivateError'
+        except Exception as e:
+            print(f"⚠️ 加入频道 @{u} 失败: {e}")
+            status, err = 'failed', str(e)[:500]
+        try:
+            await asyncio.to_thread(_save_state, u, self.account, chat_id, access_hash, status, err)
+        except Exception as e:
+            print(f"⚠️ 保存频道加入状态失败 @{u}: {e}")
+        return {'chat_id': chat_id, 'access_hash': access_hash, 'entity_username': entity_username, 'status': status}
+
+
+def _load_states(usernames) -> Dict[str, dict]:
+    with Session(engine) as session:
+        rows = session.query(ChannelJoinState).filter(ChannelJoinState.username.in_(usernames)).all()
+        return {
+            r.username: {'account': r.account, 'chat_id': r.chat_id, 'access_hash': r.access_hash, 'status': r.status, 'updated_at': r.updated_at}
+            for r in rows
+        }
+
+
+def _save_state(username, account, chat_id, access_hash, status, last_error):
+    values = {
+        'username': username,
+        'account': account,
+        'chat_id': chat_id,
+        'access_hash': access_hash,
+        'status': status,
+        'last_error': last_error,
+        'updated_at': datetime.utcnow(),
+    }
+    with Session(engine) as session:
+        stmt = pg_insert(ChannelJoinState).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChannelJoinState.username],
+            set_={k: stmt.excluded[k] for k in values if k != 'username'},
+        )
+        session.execute(stmt)
+        session.commit()
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from model import Message
+from utils.netdisk import NETDISK_BITS
+
+# 前台时间范围选项 → 回溯天数（“全部”不限）
+TIME_RANGE_DAYS = {
+    "最近24小时": 1,
+    "最近7天": 7,
+    "最近30天": 30,
+}
+
+
+def time_range_since(time_range: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    days = TIME_RANGE_DAYS.get(time_range)
+    if days is None:
+        return None
+    return (now or datetime.now()) - timedelta(days=days)
+
+
+def netdisk_filter_mask(netdisks: Iterable[str]) -> int:
+    mask = 0
+    for nd in netdisks or []:
+        mask |= NETDISK_BITS.get(nd, 0)
+    return mask
+
+
+def apply_filters(query, since: Optional[datetime] = None, tags: Iterable[str] = (),
+                  netdisks: Iterable[str] = (), search: str = ''):
+    """前台列表的筛选条件（列表、计数、增量轮询共用）：
+    只列出含白名单网盘的消息；标签命中任一；关键词按空格拆分后 AND 组合、每个词 OR 匹配多个字段；网盘类型命中任一
+    """
+    if since is not None:
+        query = query.filter(Message.timestamp >= since)
+    # 仅展示包含白名单网盘链接的消息（netdisk_types 写入时计算，走部分索引）
+    query = query.filter(Message.netdisk_types != 0)
+    # 标签过滤（tags && ARRAY[...]，命中任一标签；可走 tags GIN 索引）
+    tags = list(tags or [])
+    if tags:
+        query = query.filter(Message.tags.overlap(tags))
+    for kw in (search or '').split():
+        pattern = f"%{kw}%"
+        query = query.filter(
+            or_(
+                Message.title.ilike(pattern),
+                Message.description.ilike(pattern),
+                Message.channel.ilike(pattern),
+                Message.source.ilike(pattern),
+            )
+        )
+    # 网盘类型：按位筛选（命中任一所选网盘）
+    if netdisks:
+        query = query.filter(Message.netdisk_types.op('&')(netdisk_filter_mask(netdisks)) != 0)
+    return query
+
+
+class ListRow(NamedTuple):
+    """列表页一行：只含标题行所需的列（只读，可在会话之间共享）"""
+    id: int
+    title: Optional[str]
+    timestamp: datetime
+    netdisk_types: int
+    tags: Optional[List[str]]
+
+
+# 列表查询只取这些列；description / links 可能很长，由 load_details 对实际展示的行批量读取
+LIST_COLUMNS = (Message.id, Message.title, Message.timestamp, Message.netdisk_types, Message.tags)
+
+
+def list_rows(query) -> List[ListRow]:
+    """query 须以 session.query(*LIST_COLUMNS) 构建"""
+    return [ListRow(mid, title, ts, mask or 0, list(tags or [])) for mid, title, ts, mask, tags in query.all()]
+
+
+def load_details(session: Session, ids: Iterable[int]) -> Dict[int, Tuple[Optional[str], Optional[dict]]]:
+    """按主键一次取回多条消息的 (description, links)"""
+    ids = sorted(set(ids))
+    if not ids:
+        return {}
+    rows = session.query(Message.id, Message.description, Message.links).filter(Message.id.in_(ids)).all()
+    return {mid: (description, links) for mid, description, links in rows}
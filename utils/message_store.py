@@ -0,0 +1,217 @@
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from model import Message, MessageLink
+from utils.netdisk import canonical_url, MAX_INDEXED_URL_LEN
+
+# 可由解析结果覆盖的消息字段
+MESSAGE_FIELDS = ('title', 'description', 'links', 'tags', 'source', 'channel', 'group_name', 'bot')
+# 单条 INSERT 的最大行数（PostgreSQL 绑定参数上限 65535）
+_INSERT_CHUNK = 5000
+
+
+def link_rows(message_id: int, links: Optional[dict]) -> List[dict]:
+    """将 links 字典展开为 message_links 行（按规范化链接去重）"""
+    rows = {}
+    for netdisk, url in (links or {}).items():
+        if not url or not isinstance(url, str):
+            continue
+        cu = canonical_url(url)
+        if not cu or len(cu) > MAX_INDEXED_URL_LEN:
+            continue
+        rows[cu] = {'message_id': message_id, 'netdisk': netdisk, 'url': cu}
+    return list(rows.values())
+
+
+def sync_links_bulk(session: Session, items: Iterable[Tuple[int, Optional[dict]]]):
+    """批量同步 message_links：删除各消息已不存在的链接，并以 ON CONFLICT 把链接指向最新的消息。
+    items 为 (message_id, links) 序列，后出现者优先。不提交事务。
+    """
+    by_url: Dict[str, dict] = {}
+    message_ids = set()
+    for message_id, links in items:
+        if not message_id:
+            continue
+        message_ids.add(message_id)
+        for r in link_rows(message_id, links):
+            by_url[r['url']] = r
+    if not message_ids:
+        return
+    # 本批消息不再持有的链接：一次 DELETE（仍被本批持有的链接会在下方 upsert 中改指向新主人）
+    q = session.query(MessageLink).filter(MessageLink.message_id.in_(message_ids))
+    if by_url:
+        q = q.filter(MessageLink.url.notin_(list(by_url.keys())))
+    q.delete(synchronize_session=False)
+    rows = list(by_url.values())
+    for i in range(0, len(rows), _INSERT_CHUNK):
+        stmt = pg_insert(MessageLink).values(rows[i:i + _INSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MessageLink.url],
+            set_={'message_id': stmt.excluded.message_id, 'netdisk': stmt.excluded.netdisk},
+        )
+        session.execute(stmt)
+
+
+def sync_message_links(session: Session, message_id: int, links: Optional[dict]):
+    sync_links_bulk(session, [(message_id, links)])
+
+
+def find_message_id_by_links(session: Session, links: Optional[dict]) -> Optional[int]:
+    """按链接索引查找已存在的消息 id（多条命中时取时间最新的一条）"""
+    urls = [r['url'] for r in link_rows(0, links)]
+    if not urls:
+        return None
+    row = (
+        session.query(MessageLink.message_id)
+        .join(Message, Message.id == MessageLink.message_id)
+        .filter(MessageLink.url.in_(urls))
+        .order_by(Message.timestamp.desc())
+        .first()
+    )
+    return row[0] if row else None
+
+
+def find_message_by_links(session: Session, links: Optional[dict]) -> Optional[Message]:
+    mid = find_message_id_by_links(session, links)
+    return session.get(Message, mid) if mid else None
+
+
+def build_existing_link_index(session: Session) -> Dict[str, int]:
+    """从 message_links 载入 {规范化链接: message_id}，供批量导入在内存中去重"""
+    link_to_id: Dict[str, int] = {}
+    q = session.query(MessageLink.url, MessageLink.message_id)
+    for url, mid in q.yield_per(5000):
+        link_to_id[url] = mid
+    return link_to_id
+
+
+def _canonical_urls(links: Optional[dict]) -> List[str]:
+    return [r['url'] for r in link_rows(0, links)]
+
+
+def upsert_messages_batch(session: Session, items: List[Tuple[dict, datetime.datetime]],
+                          link_index: Optional[Dict[str, int]] = None) -> List[str]:
+    """批量版链接去重写入，见 _upsert_batch；返回与 items 一一对应的 "updated" / "inserted"。"""
+    return _upsert_batch(session, items, link_index)[0]
+
+
+def _upsert_batch(session: Session, items: List[Tuple[dict, datetime.datetime]],
+                  link_index: Optional[Dict[str, int]] = None) -> Tuple[List[str], List[int]]:
+    """批量版链接去重写入：一次索引查找 + 多行 INSERT，整批在同一事务内提交。
+    items 为 (parsed_data, timestamp) 序列；批内链接相同的消息按先后顺序合并到同一条。
+    传入 link_index（build_existing_link_index 的结果）时改为查内存索引，只按主键取命中的消息，
+    未命中的链接每批补查一次 message_links，并在提交后回写索引；适合回溯等长时间批量写入。
+    返回 (结果, 消息 id)，均与 items 一一对应；结果为 "updated" / "inserted"。
+    """
+    all_urls = {u for parsed, _ in items for u in _canonical_urls(parsed.get('links'))}
+
+    # 1) 一次查询取出批内所有链接对应的现有消息
+    by_url: Dict[str, Message] = {}
+    if link_index is not None:
+        # 索引载入后其他进程（监控端等）写入的链接不在内存中：未命中的链接按批到 message_links 补查一次
+        misses = [u for u in all_urls if u not in link_index]
+        if misses:
+            q = session.query(MessageLink.url, MessageLink.message_id).filter(MessageLink.url.in_(misses))
+            for url, mid in q:
+                link_index[url] = mid
+        ids = {link_index[u] for u in all_urls if u in link_index}
+        if ids:
+            found = {m.id: m for m in session.query(Message).filter(Message.id.in_(list(ids))).all()}
+            for u in all_urls:
+                mid = link_index.get(u)
+                if mid is None:
+                    continue
+                if mid in found:
+                    by_url[u] = found[mid]
+                else:
+                    # 消息已被删除，索引项作废
+                    link_index.pop(u, None)
+    elif all_urls:
+        rows = (
+            session.query(MessageLink.url, Message)
+            .join(Message, Message.id == MessageLink.message_id)
+            .filter(MessageLink.url.in_(list(all_urls)))
+            .all()
+        )
+        for url, msg in rows:
+            by_url[url] = msg
+
+    results: List[str] = []
+    targets: List[Message] = []
+    touched: Dict[int, Message] = {}
+    added: List[Message] = []
+    for parsed, timestamp in items:
+        urls = _canonical_urls(parsed.get('links'))
+        # 多条命中时取时间最新的一条（与单条写入一致）
+        candidates = [by_url[u] for u in urls if u in by_url]
+        target = max(candidates, key=lambda m: m.timestamp or datetime.datetime.min) if candidates else None
+        if target is not None:
+            target.timestamp = timestamp
+            for field in MESSAGE_FIELDS:
+                if field in parsed:
+                    setattr(target, field, parsed.get(field))
+            results.append("updated")
+        else:
+            target = Message(timestamp=timestamp, created_at=timestamp, **parsed)
+            session.add(target)
+            added.append(target)
+            results.append("inserted")
+        targets.append(target)
+        touched[id(target)] = target
+        for u in urls:
+            by_url[u] = target
+
+    # 2) 多行 INSERT 取回自增 id，再同批同步 message_links
+    session.flush()
+    touched_rows = [(m.id, m.links) for m in touched.values()]
+    ids = [m.id for m in targets]
+    sync_links_bulk(session, touched_rows)
+    session.commit()
+    if link_index is not None:
+        for mid, links in touched_rows:
+            for u in _canonical_urls(links):
+                link_index[u] = mid
+    return results, ids
+
+
+def upsert_message_by_links(session: Session, parsed_data: dict, timestamp: datetime.datetime):
+    """基于链接去重的写入逻辑：
+    - 若 parsed_data 中包含 links，则以链接为唯一键（message_links 唯一索引）：
+      1) 数据库中存在任意相同链接：覆盖并更新该条消息
+      2) 不存在：插入新消息
+    - 若不包含 links：插入新消息
+    返回："updated" 或 "inserted"
+    """
+    results, ids = _upsert_batch(session, [(parsed_data, timestamp)])
+    result = results[0]
+    channel = parsed_data.get('channel') or ''
+    if result == "updated":
+        print(f"♻️ 已覆盖更新现有消息(id={ids[0]}) @ {channel}，按链接去重")
+    else:
+        print(f"✅ 新消息已保存(id={ids[0]}) @ {channel}（无重复链接）")
+    return result
+
+
+def rebuild_message_links(session: Session, batch_size: int = 5000) -> int:
+    """由 messages.links 全量重建 message_links。
+    按 (timestamp, id) 升序分批写入，同一链接最终指向时间最新的消息；每批独立提交。
+    """
+    total = 0
+    last = None
+    while True:
+        q = session.query(Message.id, Message.timestamp, Message.links).filter(Message.links.isnot(None))
+        if last is not None:
+            q = q.filter(tuple_(Message.timestamp, Message.id) > tuple_(*last))
+        rows = q.order_by(Message.timestamp.asc(), Message.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        sync_links_bulk(session, [(mid, links) for mid, _, links in rows if isinstance(links, dict) and links])
+        session.commit()
+        total += len(rows)
+        last = (rows[-1][1], rows[-1][0])
+        print(f"  · 已重建 {total} 条消息的链接索引...", flush=True)
+    return total
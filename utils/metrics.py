@@ -0,0 +1,170 @@
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 默认耗时分桶（秒）：覆盖微秒级正则到秒级数据库写入
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        key = tuple(str(v) for v in labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+        for key, v in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {v:g}')
+        return lines
+
+
+class Gauge:
+    """取值在抓取时由回调计算"""
+
+    def __init__(self, name: str, doc: str, fn: Callable[[], float]):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} gauge', f'{self.name} {value:g}']
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {labels: [各桶计数..., 总数, 求和]}
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels):
+        key = tuple(str(v) for v in labels)
+        row = self._values.get(key)
+        if row is None:
+            row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        for key, row in sorted(self._values.items()):
+            acc = 0
+            for bound, n in zip(self.buckets, row):
+                acc += n
+                le = 'le="%g"' % bound
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {acc}')
+            acc += row[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {acc}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {acc}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {row[-1]:g}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, doc: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        m = Counter(name, doc, labelnames)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, doc: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, doc, labelnames, buckets)
+        self._metrics.append(m)
+        return m
+
+    def gauge(self, name: str, doc: str, fn: Callable[[], float]) -> Gauge:
+        m = Gauge(name, doc, fn)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# === 监控端采集管线指标 ===
+STAGE_SECONDS = REGISTRY.histogram(
+    'tg_monitor_stage_seconds', '各处理阶段耗时（秒）', ('stage',)
+)
+MESSAGES_RECEIVED = REGISTRY.counter(
+    'tg_monitor_messages_received_total', '收到的新消息数', ('channel',)
+)
+MESSAGES_DROPPED = REGISTRY.counter(
+    'tg_monitor_messages_dropped_total', '未入库的消息数（按原因、频道）', ('reason', 'channel')
+)
+MESSAGES_WRITTEN = REGISTRY.counter(
+    'tg_monitor_messages_written_total', '已落库的消息数（inserted / updated，按频道）', ('result', 'channel')
+)
+WRITE_FAILED = REGISTRY.counter(
+    'tg_monitor_write_failed_total', '写入失败被丢弃的消息数', ('channel',)
+)
+
+
+@contextmanager
+def timed(stage: str, histogram: Histogram = STAGE_SECONDS):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, stage)
+
+
+async def serve_metrics(host: str, port: int, registry: Registry = REGISTRY) -> Optional[asyncio.AbstractServer]:
+    """在当前事件循环上提供 Prometheus 文本格式的 /metrics"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # 读掉请求头
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+            if path in ('/metrics', '/'):
+                body = registry.render().encode('utf-8')
+                status, ctype = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                body, status, ctype = b'not found\n', '404 Not Found', 'text/plain'
+            head = f'HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
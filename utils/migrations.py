@@ -0,0 +1,331 @@
+"""messages 等表的版本化迁移。
+
+create_all 只会建新表，无法给已有表补索引或改列类型，因此结构变更在这里按版本号顺序登记，
+已执行的版本记录在 schema_migrations 表中。索引一律 CREATE INDEX CONCURRENTLY（不阻塞监控端写入），
+需在 autocommit 连接上执行；上次中断留下的无效索引会先删除再重建。
+required=True 的迁移是代码写入所依赖的结构（如新增列），必须幂等；监控端启动时先同步执行这部分，
+其余（建索引、回填数据）在后台线程执行。
+maintenance=True 的迁移会重写整表或长时间持有阻塞写入的锁，自动执行时一律跳过（依赖它的迁移也跳过），
+需停写或低峰期手工执行：python -m utils.migrations --maintenance
+
+用法：python -m utils.migrations [--status | --maintenance | --explain-search 关键词]
+"""
+import json
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from model import Base, engine
+from utils.netdisk import netdisk_mask
+from utils.rollups import rebuild_rollups_on
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    # 普通迁移在事务内执行；concurrent=True 的迁移逐条在 autocommit 连接上执行
+    statements: List[str]
+    concurrent: bool = False
+    # 返回 False 时跳过 statements（仍记为已执行），用于“已是目标状态”的判断
+    precheck: Optional[Callable[[Connection], bool]] = None
+    # 在 statements 之后执行的数据迁移（autocommit 连接，自行分批）
+    run: Optional[Callable[[Connection], None]] = None
+    required: bool = False
+    # 阻塞写入的维护迁移，只在 --maintenance 时执行
+    maintenance: bool = False
+    # 依赖的迁移版本：未执行时本迁移也跳过
+    depends: Tuple[int, ...] = ()
+
+
+# 迁移互斥锁：多个容器同时启动时只有一个执行迁移
+_ADVISORY_LOCK_ID = 7_305_114_001
+
+
+def _links_is_json(conn: Connection) -> bool:
+    data_type = conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'messages' AND column_name = 'links' AND table_schema = current_schema()"
+    )).scalar()
+    return data_type == 'json'
+
+
+def _convert_links_jsonb(conn: Connection, batch_size: int = 5000):
+    """links json → jsonb 的在线转换（不整表重写、不长时间锁表）：
+    影子列 links_jsonb 由触发器同步新写入，历史行按 id 分批复制，最后在一个短事务内删旧列、改名。
+    中断后重跑会从头检查，已复制的行不再更新。
+    """
+    last_id, copied = 0, 0
+    while True:
+        ids = conn.execute(
+            text("SELECT id FROM messages WHERE id > :last ORDER BY id LIMIT :n"),
+            {"last": last_id, "n": batch_size},
+        ).scalars().all()
+        if not ids:
+            break
+        result = conn.execute(
+            text(
+                "UPDATE messages SET links_jsonb = links::jsonb "
+                "WHERE id BETWEEN :lo AND :hi AND links IS NOT NULL AND links_jsonb IS NULL"
+            ),
+            {"lo": ids[0], "hi": ids[-1]},
+        )
+        last_id = ids[-1]
+        copied += result.rowcount
+        print(f"  · links 复制至 id={last_id}（累计 {copied} 条）", flush=True)
+    # 删列与改名只改系统表，持锁时间很短；等锁超时（lock_timeout）则整体回滚，下次启动重试
+    conn.execute(text("BEGIN"))
+    try:
+        conn.execute(text("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text("DROP TRIGGER IF EXISTS messages_links_jsonb_sync ON messages"))
+        conn.execute(text("ALTER TABLE messages DROP COLUMN links"))
+        conn.execute(text("ALTER TABLE messages RENAME COLUMN links_jsonb TO links"))
+        conn.execute(text("DROP FUNCTION IF EXISTS messages_links_jsonb_sync()"))
+        conn.execute(text("COMMIT"))
+    except Exception:
+        conn.execute(text("ROLLBACK"))
+        raise
+
+
+def _backfill_netdisk_types(conn: Connection, batch_size: int = 5000):
+    """按 id 分批回填历史消息的 netdisk_types，每批一个短事务，不长时间锁表"""
+    last_id, updated = 0, 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, links FROM messages WHERE id > :last AND links IS NOT NULL ORDER BY id LIMIT :n"),
+            {"last": last_id, "n": batch_size},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        # 掩码为 0 的也要写回：重新计算时旧值可能非 0
+        pairs = [(mid, netdisk_mask(links)) for mid, links in rows]
+        if pairs:
+            result = conn.execute(
+                text(
+                    "UPDATE messages SET netdisk_types = u.mask "
+                    "FROM unnest(CAST(:ids AS integer[]), CAST(:masks AS smallint[])) AS u(id, mask) "
+                    "WHERE messages.id = u.id AND messages.netdisk_types <> u.mask"
+                ),
+                {"ids": [p[0] for p in pairs], "masks": [p[1] for p in pairs]},
+            )
+            updated += result.rowcount
+        print(f"  · netdisk_types 回填至 id={last_id}（累计 {updated} 条）", flush=True)
+
+
+def _index(name: str, definition: str) -> str:
+    return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "enable pg_trgm", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    ], concurrent=True),
+    # ALTER COLUMN TYPE 会重写整表并全程阻塞写入，改为影子列在线转换（见 _convert_links_jsonb）；已是 jsonb 时直接记为已执行
+    Migration(2, "messages.links json -> jsonb", [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS links_jsonb JSONB",
+        "CREATE OR REPLACE FUNCTION messages_links_jsonb_sync() RETURNS trigger AS $$ "
+        "BEGIN NEW.links_jsonb := NEW.links::jsonb; RETURN NEW; END $$ LANGUAGE plpgsql",
+        "DROP TRIGGER IF EXISTS messages_links_jsonb_sync ON messages",
+        "CREATE TRIGGER messages_links_jsonb_sync BEFORE INSERT OR UPDATE OF links ON messages "
+        "FOR EACH ROW EXECUTE PROCEDURE messages_links_jsonb_sync()",
+    ], concurrent=True, precheck=_links_is_json, run=_convert_links_jsonb),
+    Migration(3, "messages indexes", [
+        # 列表页按时间倒序（id 作为同一时间戳内的次序）
+        _index("ix_messages_timestamp_desc", "messages (timestamp DESC, id DESC)"),
+        # 标签筛选 tags @> ARRAY[...]
+        _index("ix_messages_tags_gin", "messages USING gin (tags)"),
+        # 标题/描述 ILIKE '%关键词%'
+        _index("ix_messages_title_trgm", "messages USING gin (title gin_trgm_ops)"),
+        _index("ix_messages_description_trgm", "messages USING gin (description gin_trgm_ops)"),
+    ], concurrent=True),
+    # 网盘类型位掩码：写入时由 Message.links 计算，前台按位筛选，替代对 links 文本的 ILIKE
+    Migration(4, "messages.netdisk_types", [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS netdisk_types SMALLINT NOT NULL DEFAULT 0",
+    ], required=True),
+    # 5 为占位：早期版本在此按旧规则回填，现由迁移 12 按新规则统一回填
+    Migration(5, "backfill messages.netdisk_types", []),
+    Migration(6, "messages listed index", [
+        # 首页只列出含白名单网盘的消息：部分索引按时间倒序直接取页
+        _index("ix_messages_listed_ts", "messages (timestamp DESC, id DESC) WHERE netdisk_types <> 0"),
+    ], concurrent=True),
+    # 计数表由 create_all 建出；7、8 只是占位（早期版本在此各重建一次），统一由迁移 13 初始化
+    Migration(7, "tag_daily_counts", []),
+    Migration(8, "netdisk/channel daily counts", []),
+    # 9 为占位：早期版本在此初始化计数表，现由迁移 13 在 netdisk_types 重新回填后统一重建
+    Migration(9, "backfill daily counts", []),
+    # jsonb_path_ops 只能建在 jsonb 列上，依赖迁移 2（此前已随迁移 3 建好的库上 IF NOT EXISTS 直接跳过）
+    Migration(10, "messages links index", [
+        # 链接包含查询 links @> '{...}'
+        _index("ix_messages_links_gin", "messages USING gin (links jsonb_path_ops)"),
+    ], concurrent=True, depends=(2,)),
+    # 加入状态按账号区分（多账号分片）：channel_join_state 早于该列建表的库需补列
+    Migration(11, "channel_join_state.account", [
+        "ALTER TABLE channel_join_state ADD COLUMN IF NOT EXISTS account VARCHAR",
+    ], required=True),
+    # 按 links 键名（并核对链接域名）回填 netdisk_types，只执行一次；已按旧规则回填过的库在此重新计算
+    Migration(12, "recompute messages.netdisk_types", [], concurrent=True, run=_backfill_netdisk_types),
+    # 用现有消息初始化全部计数表（依赖迁移 12 的 netdisk_types），之后由写入路径增量维护；
+    # 逐天短事务重建，只与同一天的写入互斥，可在监控端运行时执行
+    Migration(13, "rebuild daily counts", [], concurrent=True, run=rebuild_rollups_on),
+    # 关键词搜索为 title/description/channel/source 四列 ILIKE 的 OR：每个分支都有索引才能走 BitmapOr，否则整体顺序扫描
+    Migration(14, "messages channel/source trgm indexes", [
+        _index("ix_messages_channel_trgm", "messages USING gin (channel gin_trgm_ops)"),
+        _index("ix_messages_source_trgm", "messages USING gin (source gin_trgm_ops)"),
+    ], concurrent=True),
+]
+
+
+def _drop_invalid_indexes(conn: Connection):
+    """CREATE INDEX CONCURRENTLY 中断后会留下 indisvalid = false 的索引，IF NOT EXISTS 会误认为已存在"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE NOT i.indisvalid AND n.nspname = current_schema()"
+    )).scalars().all()
+    for name in names:
+        print(f"🧹 删除上次未完成的无效索引 {name}")
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+def _applied_versions(conn: Connection) -> set:
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+
+
+def _record(conn: Connection, m: Migration):
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t) ON CONFLICT (version) DO NOTHING"),
+        {"v": m.version, "n": m.name, "t": datetime.utcnow()},
+    )
+
+
+def pending_migrations() -> List[Migration]:
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = _applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def _apply(conn: Connection, m: Migration):
+    print(f"🛠️ 执行迁移 {m.version}: {m.name}")
+    if m.precheck is not None and not m.precheck(conn):
+        _record(conn, m)
+        return
+    if m.concurrent:
+        _drop_invalid_indexes(conn)
+        for stmt in m.statements:
+            conn.execute(text(stmt))
+        if m.run is not None:
+            m.run(conn)
+        _record(conn, m)
+    else:
+        conn.execute(text("BEGIN"))
+        try:
+            for stmt in m.statements:
+                conn.execute(text(stmt))
+            if m.run is not None:
+                m.run(conn)
+            _record(conn, m)
+            conn.execute(text("COMMIT"))
+        except Exception:
+            conn.execute(text("ROLLBACK"))
+            raise
+
+
+def _skip_maintenance(conn: Connection, m: Migration) -> bool:
+    """自动执行时遇到维护迁移：已是目标状态（precheck 为 False）则直接记为已执行，否则跳过并提示"""
+    if m.precheck is not None and not m.precheck(conn):
+        _record(conn, m)
+        return False
+    print(f"⏸️ 迁移 {m.version}（{m.name}）会阻塞写入，已跳过；请在维护窗口执行 python -m utils.migrations --maintenance")
+    return True
+
+
+def run_migrations(required_only: bool = False, maintenance: bool = False) -> int:
+    """按版本顺序执行未执行的迁移，返回本次执行的数量。
+    required_only=True 时只执行代码依赖的结构迁移（幂等，不取迁移锁，可与后台的完整迁移并行）；
+    create_tables() 每次都会执行这一步。maintenance=False（默认，监控端/初始化脚本）时跳过维护迁移及依赖它们的迁移。
+    """
+    Base.metadata.create_all(bind=engine)
+    done = 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # 引擎默认 60s 语句超时，建索引可能远超此值；等锁最多 10s，避免 DDL 排队阻塞线上写入
+        conn.execute(text("SET statement_timeout = 0"))
+        conn.execute(text("SET lock_timeout = '10s'"))
+        if required_only:
+            applied = _applied_versions(conn)
+            for m in MIGRATIONS:
+                if m.required and m.version not in applied:
+                    _apply(conn, m)
+                    done += 1
+            return done
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _ADVISORY_LOCK_ID}).scalar():
+            print("⏭️ 其他进程正在执行迁移，跳过")
+            return 0
+        try:
+            applied = _applied_versions(conn)
+            skipped = set()
+            for m in MIGRATIONS:
+                if m.version in applied:
+                    continue
+                if any(dep in skipped for dep in m.depends):
+                    skipped.add(m.version)
+                    continue
+                if m.maintenance and not maintenance:
+                    if _skip_maintenance(conn, m):
+                        skipped.add(m.version)
+                    else:
+                        applied.add(m.version)
+                    continue
+                _apply(conn, m)
+                applied.add(m.version)
+                done += 1
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _ADVISORY_LOCK_ID})
+    return done
+
+
+_SEARCH_INDEXES = ("ix_messages_title_trgm", "ix_messages_description_trgm",
+                   "ix_messages_channel_trgm", "ix_messages_source_trgm")
+
+
+def explain_search(keyword: str):
+    """EXPLAIN 前台关键词搜索，检查四个 trgm 索引是否都被用上（BitmapOr 需要每个分支都有索引）"""
+    from sqlalchemy.orm import Session
+    from model import Message
+    from utils.message_query import apply_filters
+
+    with Session(engine) as session:
+        compiled = apply_filters(session.query(Message.id), None, [], [], keyword).statement.compile(engine)
+        plan = session.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params).scalar()
+    used = set()
+
+    def walk(node):
+        if node.get("Index Name"):
+            used.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    print(json.dumps(plan[0]["Plan"], ensure_ascii=False, indent=2))
+    missing = [name for name in _SEARCH_INDEXES if name not in used]
+    if missing:
+        print(f"⚠️ 关键词搜索未使用索引: {', '.join(missing)}")
+    else:
+        print("✅ 关键词搜索使用了全部 trgm 索引")
+
+
+if __name__ == "__main__":
+    if "--explain-search" in sys.argv:
+        i = sys.argv.index("--explain-search")
+        explain_search(sys.argv[i + 1] if i + 1 < len(sys.argv) else "test")
+    elif "--status" in sys.argv:
+        pending = pending_migrations()
+        for m in MIGRATIONS:
+            suffix = "（维护迁移，需 --maintenance）" if m.maintenance and m in pending else ""
+            print(f"{'⏳' if m in pending else '✅'} {m.version}: {m.name}{suffix}")
+    else:
+        n = run_migrations(maintenance="--maintenance" in sys.argv)
+        print(f"迁移完成，本次执行 {n} 个")
@@ -0,0 +1,160 @@
+import re
+
+# === 严格网盘链接白名单（各采集/导入入口共用） ===
+# 键为内部分组名（正则命名分组只接受标识符），值为（显示名, 正则）
+_NETDISK_SPECS = [
+    ("baidu", "百度网盘", r"https://pan\.baidu\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?"),
+    ("quark", "夸克网盘", r"https://pan\.quark\.cn/s/[A-Za-z0-9_-]+"),
+    ("aliyun", "阿里云盘", r"https://www\.aliyundrive\.com/s/[A-Za-z0-9_-]+"),
+    ("pan115", "115网盘", r"https://115\.com/s/[A-Za-z0-9_-]+"),
+    ("xunlei", "迅雷网盘", r"https://pan\.xunlei\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?(?:#)?"),
+    ("uc", "UC网盘", r"https://drive\.uc\.cn/s/[A-Za-z0-9]+(?:\?public=1)?"),
+    ("pan123", "123网盘", r"https://www\.123pan\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?|https://www\.123684\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?"),
+    ("tianyi", "天翼云盘", r"https://cloud\.189\.cn/t/[A-Za-z0-9]+"),
+    ("caiyun", "移动云盘", r"https://caiyun\.139\.com/w/i/[A-Za-z0-9]+"),
+]
+
+STRICT_NETDISK_PATTERNS = {name: pattern for _, name, pattern in _NETDISK_SPECS}
+ALLOWED_NETDISK_NAMES = set(STRICT_NETDISK_PATTERNS.keys())
+
+# 网盘类型位：messages.netdisk_types 按位记录消息包含哪些白名单网盘（位与表顺序绑定，只能在末尾追加）
+NETDISK_BITS = {name: 1 << i for i, (_, name, _) in enumerate(_NETDISK_SPECS)}
+
+# 所有白名单合并为一个带命名分组的正则，一次扫描取出全部链接
+_GROUP_TO_NAME = {group: name for group, name, _ in _NETDISK_SPECS}
+_NETDISK_RE = re.compile("|".join(f"(?P<{group}>{pattern})" for group, _, pattern in _NETDISK_SPECS))
+
+# 廉价的字面量预过滤：文本中不含任何白名单域名时直接返回，不进入正则
+NETDISK_HOSTS = (
+    "pan.baidu.com",
+    "pan.quark.cn",
+    "www.aliyundrive.com",
+    "115.com",
+    "pan.xunlei.com",
+    "drive.uc.cn",
+    "www.123pan.com",
+    "www.123684.com",
+    "cloud.189.cn",
+    "caiyun.139.com",
+)
+
+
+def has_netdisk_host(text: str) -> bool:
+    if not text or "https://" not in text:
+        return False
+    return any(host in text for host in NETDISK_HOSTS)
+
+
+def _scan(text: str, keep_first: bool) -> dict:
+    found = {}
+    for m in _NETDISK_RE.finditer(text):
+        name = _GROUP_TO_NAME[m.lastgroup]
+        if keep_first and name in found:
+            continue
+        found[name] = m.group(0)
+    # 保持与白名单表一致的键顺序（前台按该顺序展示网盘标签）
+    return {name: found[name] for name in STRICT_NETDISK_PATTERNS if name in found}
+
+
+def extract_netdisk_links_strict(text: str) -> dict:
+    """按白名单提取网盘链接：{网盘名: 链接}，同类网盘取正文中第一个"""
+    if not has_netdisk_host(text):
+        return {}
+    return _scan(text, keep_first=True)
+
+
+def extract_netdisk_links_from_urls(urls) -> dict:
+    """从 entities/按钮等独立 URL 列表中提取白名单链接，同类网盘以后出现者为准"""
+    text = "\n".join(u for u in urls if u)
+    if not has_netdisk_host(text):
+        return {}
+    return _scan(text, keep_first=False)
+
+
+# 旧解析器（utils/message_parser.py）使用的网盘名 → 白名单显示名
+NETDISK_KEY_ALIASES = {
+    "123云盘": "123网盘",
+    "迅雷": "迅雷网盘",
+}
+
+# 各网盘的域名（比严格白名单宽：不限协议、含新旧域名），用于核对历史数据中键名与链接是否一致
+NETDISK_KEY_HOSTS = {
+    "百度网盘": ("pan.baidu.com",),
+    "夸克网盘": ("pan.quark.cn",),
+    "阿里云盘": ("aliyundrive.com", "alipan.com"),
+    "115网盘": ("115.com", "115cdn.com", "anxia.com"),
+    "迅雷网盘": ("pan.xunlei.com",),
+    "UC网盘": ("drive.uc.cn", "fast.uc.cn"),
+    "123网盘": ("123pan.com", "123pan.cn", "123684.com", "123865.com", "123912.com"),
+    "天翼云盘": ("cloud.189.cn",),
+    "移动云盘": ("caiyun.139.com", "yun.139.com"),
+}
+
+
+def netdisk_mask(links) -> int:
+    """links 字典 → 网盘类型位掩码。按提取器已分配的键名归类（不再用严格正则重新解析链接），
+    但链接须属于该网盘的域名：旧关键词解析器写入的键名可能与链接不符，这类键不计入"""
+    mask = 0
+    if not isinstance(links, dict):
+        return 0
+    for key, url in links.items():
+        if not isinstance(key, str) or not isinstance(url, str):
+            continue
+        name = key.strip()
+        name = NETDISK_KEY_ALIASES.get(name, name)
+        url = url.lower()
+        if any(host in url for host in NETDISK_KEY_HOSTS.get(name, ())):
+            mask |= NETDISK_BITS[name]
+    return mask
+
+
+def netdisk_names(mask: int) -> list:
+    return [name for name, bit in NETDISK_BITS.items() if mask & bit]
+
+
+def ordered_links(links) -> dict:
+    """按白名单表顺序排列 links（jsonb 不保留键顺序），非白名单键排在最后"""
+    if not isinstance(links, dict):
+        return {}
+    order = {name: i for i, name in enumerate(NETDISK_BITS)}
+    return dict(sorted(links.items(), key=lambda kv: order.get(kv[0], len(order))))
+
+
+# === 频道署名清洗 ===
+# 去除尾部或独立行中的频道/群组/推广署名等噪声
+_NOISE_LINES = re.compile(r"^(?:[\uD800-\uDBFF\uDC00-\uDFFF\U00010000-\U0010ffff\W]{0,3})\s*(?:来自|来 自|频道|频 道|群组|群 组|投稿|搜资源)\s*[:：].*$", re.IGNORECASE)
+_HANDLE = re.compile(r"@\w+")
+_MULTI_SPACE = re.compile(r"\s{2,}")
+
+
+def clean_channel_noise(text: str) -> str:
+    cleaned = []
+    for ln in (text or '').split('\n'):
+        lns = ln.strip()
+        if not lns:
+            continue
+        # 过滤典型署名行
+        if _NOISE_LINES.match(lns):
+            continue
+        # 去掉散落的 @handle
+        lns = _HANDLE.sub('', lns)
+        # 清理多余空白
+        lns = _MULTI_SPACE.sub(" ", lns).strip()
+        if lns:
+            cleaned.append(lns)
+    return '\n'.join(cleaned)
+
+
+# === 链接规范化（去重索引 message_links 使用） ===
+_SCHEME_HOST = re.compile(r"^(https?)://([^/?#\s]+)(.*)$", re.IGNORECASE | re.DOTALL)
+# btree 唯一索引单键有长度上限，超长 URL 不进入去重索引
+MAX_INDEXED_URL_LEN = 2000
+
+
+def canonical_url(url: str) -> str:
+    """规范化链接：去空白与尾部 '#'，协议与域名转小写（分享码大小写敏感，路径保持原样）"""
+    u = (url or '').strip().rstrip('#')
+    m = _SCHEME_HOST.match(u)
+    if m:
+        u = f"{m.group(1).lower()}://{m.group(2).lower()}{m.group(3)}"
+    return u
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from model import ConfigVersion, engine
+
+# PostgreSQL LISTEN/NOTIFY 通道名
+NOTIFY_CHANNEL = "tg_monitor_reload"
+
+# 同机部署时的本地刷新标记文件（数据库通知不可用时的兜底）
+FLAG_FILES = {
+    "channels": "channels_refresh.flag",
+    "rules": "rules_refresh.flag",
+}
+
+
+def request_reload(kind: str):
+    """通知监控端重载 channels / rules：递增版本号并 NOTIFY（随事务提交送达），同时写本地标记文件"""
+    flag = FLAG_FILES.get(kind)
+    if flag:
+        try:
+            with open(flag, "w") as f:
+                f.write("refresh")
+        except Exception as e:
+            print(f"⚠️ 写入刷新标记失败: {e}")
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        stmt = pg_insert(ConfigVersion).values(key=kind, version=1, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ConfigVersion.key],
+            set_={"version": ConfigVersion.version + 1, "updated_at": now},
+        )
+        conn.execute(stmt)
+        conn.execute(text("SELECT pg_notify(:channel, :kind)"), {"channel": NOTIFY_CHANNEL, "kind": kind})
+
+
+def read_versions() -> Dict[str, int]:
+    """读取全部版本号（单表几行，用于低频兜底轮询）"""
+    with engine.connect() as conn:
+        return {k: int(v or 0) for k, v in conn.execute(select(ConfigVersion.key, ConfigVersion.version))}
+
+
+class ReloadListener:
+    """在事件循环上监听 NOTIFY：独立的 psycopg2 连接（autocommit + LISTEN），可读时取出通知。
+    连接失败或断开时返回 False / 自动失效，调用方继续依赖版本号兜底轮询。
+    """
+
+    def __init__(self, channel: str = NOTIFY_CHANNEL):
+        self.channel = channel
+        self._conn = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[str] = set()
+
+    @property
+    def active(self) -> bool:
+        return self._conn is not None
+
+    def start(self) -> bool:
+        if self._conn is not None:
+            return True
+        try:
+            raw = engine.raw_connection()
+            conn = raw.dbapi_connection
+            # 脱离连接池，由监听器独占
+            raw.detach()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_reader(conn.fileno(), self._on_readable)
+            self._conn = conn
+            return True
+        except Exception as e:
+            print(f"⚠️ 启动数据库变更通知监听失败，改用低频轮询: {e}")
+            return False
+
+    def stop(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            if self._loop is not None:
+                self._loop.remove_reader(conn.fileno())
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+            while self._conn.notifies:
+                n = self._conn.notifies.pop(0)
+                self._pending.add(n.payload or "")
+        except Exception as e:
+            print(f"⚠️ 数据库变更通知连接已断开: {e}")
+            self.stop()
+
+    def drain(self) -> Set[str]:
+        pending, self._pending = self._pending, set()
+        return pending
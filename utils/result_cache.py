@@ -0,0 +1,119 @@
+"""前台列表页的进程内结果缓存：所有浏览器会话共享。
+
+缓存只读的查询结果（ListRow 列表、详情字典），键为筛选条件签名 + 分页游标等；
+messages 的写入水位（max(id) 与 pg_stat 中的增删改计数）变化时整体失效，没有新写入时同一视图的所有会话、每次自动刷新都直接命中缓存。按 LRU 淘汰，总大小受 max_bytes 限制。
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import text
+
+from config import settings
+
+
+def _size(value) -> int:
+    # 粗略估算：文本按 UTF-8 字节，另加容器/对象的固定开销
+    if value is None or isinstance(value, (int, float, bool, datetime)):
+        return 32
+    if isinstance(value, str):
+        return 50 + len(value.encode('utf-8'))
+    if isinstance(value, dict):
+        return 100 + sum(_size(k) + _size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 60 + sum(_size(v) for v in value)
+    return 100
+
+
+# 写入水位：新增消息改变 max(id)；编辑/删除只体现在统计计数中（统计在提交后约 1s 内可见）
+_WATERMARK_SQL = text(
+    "SELECT (SELECT max(id) FROM messages), "
+    "(SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables WHERE relid = 'messages'::regclass)"
+)
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, watermark_ttl: float = 1.0):
+        self.max_bytes = max_bytes
+        # 同一进程内最多每 watermark_ttl 秒查询一次水位
+        self.watermark_ttl = watermark_ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._bytes = 0
+        self._watermark: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # 每个键一把加载锁：缓存失效瞬间同一视图的并发请求只查一次库
+        self._loading: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def refresh_watermark(self, engine) -> Optional[tuple]:
+        """按需查询写入水位，变化时清空缓存"""
+        now = time.monotonic()
+        with self._lock:
+            if self._watermark is not None and now - self._checked_at < self.watermark_ttl:
+                return self._watermark
+        with engine.connect() as conn:
+            mark = tuple(conn.execute(_WATERMARK_SQL).one())
+        with self._lock:
+            self._checked_at = now
+            if mark != self._watermark:
+                self._clear()
+                self._watermark = mark
+        return mark
+
+    def get(self, key: Hashable, engine, loader: Callable[[], Any]) -> Any:
+        mark = self.refresh_watermark(engine)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+            try:
+                rows = loader()
+                self._put(key, rows, mark)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return rows
+
+    def _put(self, key: Hashable, rows: Any, mark: Optional[tuple]):
+        size = _size(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # 加载期间水位已变化：结果可能已过期，不写入
+            if mark != self._watermark:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (rows, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+# 进程级单例：Streamlit 每次重跑 web.py 脚本，但模块只导入一次
+page_cache = ResultCache(settings.WEB_RESULT_CACHE_MB * 1024 * 1024)
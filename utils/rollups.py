@@ -0,0 +1,177 @@
+"""按天计数表的增量维护。
+
+Message 的插入 / 更新 / 删除在 ORM flush 时换算成各计数表的增量，在同一事务内 upsert，
+前台统计只读计数表的小聚合，不再把 tags 等列全量取回 Python 计数。
+计数表：消息总数 / 标签 / 网盘类型 / 频道，均按消息时间（北京时间）所在日期分桶。
+以 SQL 直接增删 messages 的路径（不经过 ORM 对象）需自行调用 rebuild_rollups 或手工修正。
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from model import ChannelDailyCount, Message, MessageDailyCount, NetdiskDailyCount, TagDailyCount, engine
+from utils.netdisk import NETDISK_BITS, netdisk_names
+
+
+class Rollup(NamedTuple):
+    model: type
+    key_column: str
+    # 由消息状态 {'timestamp', 'tags', ...} 取出计数键（同一消息内去重）
+    keys: Callable[[dict], Iterable[str]]
+    # 重建一天：从 messages 中 timestamp ∈ [:start, :end) 的消息聚合出 (key, day, count)
+    rebuild_sql: str
+
+
+ROLLUPS: List[Rollup] = [
+    Rollup(
+        MessageDailyCount, 'scope',
+        lambda st: ('all', 'listed') if st['netdisk_types'] else ('all',),
+        "SELECT s.scope, m.timestamp::date, count(*) FROM messages m "
+        "JOIN (VALUES ('all'), ('listed')) AS s(scope) ON s.scope = 'all' OR m.netdisk_types <> 0 "
+        "WHERE m.timestamp >= :start AND m.timestamp < :end GROUP BY 1, 2",
+    ),
+    Rollup(
+        TagDailyCount, 'tag',
+        lambda st: {t for t in (st['tags'] if isinstance(st['tags'], (list, tuple)) else []) if t},
+        "SELECT t.tag, m.timestamp::date, count(DISTINCT m.id) "
+        "FROM messages m CROSS JOIN LATERAL unnest(m.tags) AS t(tag) "
+        "WHERE m.timestamp >= :start AND m.timestamp < :end AND t.tag IS NOT NULL AND t.tag <> '' GROUP BY 1, 2",
+    ),
+    Rollup(
+        NetdiskDailyCount, 'netdisk',
+        lambda st: netdisk_names(st['netdisk_types'] or 0),
+        "SELECT n.name, m.timestamp::date, count(*) FROM messages m "
+        "JOIN (VALUES " + ", ".join(f"('{name}', {bit})" for name, bit in NETDISK_BITS.items()) + ") AS n(name, bit) "
+        "ON m.netdisk_types & n.bit <> 0 WHERE m.timestamp >= :start AND m.timestamp < :end GROUP BY 1, 2",
+    ),
+    Rollup(
+        ChannelDailyCount, 'channel',
+        lambda st: {st['channel']} if st['channel'] else (),
+        "SELECT channel, timestamp::date, count(*) FROM messages "
+        "WHERE timestamp >= :start AND timestamp < :end AND channel IS NOT NULL AND channel <> '' GROUP BY 1, 2",
+    ),
+]
+
+# 按天重建与写入路径互斥用的 advisory 锁命名空间（第二个键为日期序数）
+_DAY_LOCK_KEY = 7305
+
+# 计数依赖的 Message 字段；这些字段未变化的更新不产生增量
+_TRACKED = ('timestamp', 'tags', 'channel', 'netdisk_types')
+
+
+def _old_state(obj) -> dict:
+    state = inspect(obj)
+    old = {}
+    for name in _TRACKED:
+        hist = state.attrs[name].history
+        if hist.deleted:
+            old[name] = hist.deleted[0]
+        elif hist.unchanged:
+            old[name] = hist.unchanged[0]
+        else:
+            old[name] = None
+    return old
+
+
+def _new_state(obj) -> dict:
+    return {name: getattr(obj, name) for name in _TRACKED}
+
+
+def _changed(obj) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in _TRACKED)
+
+
+def _add(deltas: Dict[Tuple[int, str, object], int], st: dict, sign: int):
+    ts = st['timestamp']
+    if ts is None:
+        return
+    day = ts.date()
+    for i, rollup in enumerate(ROLLUPS):
+        for key in rollup.keys(st):
+            deltas[(i, key, day)] += sign
+
+
+def apply_rollups(session: Session, flush_context):
+    """after_flush 监听（由 model.register_rollup_listeners 注册）"""
+    # after_flush 时 new/dirty/deleted 与属性历史仍是 flush 前的状态
+    deltas: Dict[Tuple[int, str, object], int] = Counter()
+    for obj in session.new:
+        if isinstance(obj, Message):
+            _add(deltas, _new_state(obj), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Message) and _changed(obj):
+            _add(deltas, _old_state(obj), -1)
+            _add(deltas, _new_state(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Message):
+            _add(deltas, _old_state(obj), -1)
+    if not deltas:
+        return
+    conn = session.connection()
+    # 与按天重建互斥：只等待正在重建的那一天
+    _lock_days(conn, {day for _, _, day in deltas}, shared=True)
+    for i, rollup in enumerate(ROLLUPS):
+        # 固定顺序 upsert，避免并发写入者互相死锁
+        rows = sorted(
+            (key, day, n) for (ri, key, day), n in deltas.items() if ri == i and n
+        )
+        if not rows:
+            continue
+        model = rollup.model
+        stmt = pg_insert(model).values([{rollup.key_column: k, 'day': d, 'count': n} for k, d, n in rows])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rollup.key_column, 'day'],
+            set_={'count': model.count + stmt.excluded.count},
+        )
+        conn.execute(stmt)
+
+
+def _lock_days(conn: Connection, days, shared: bool):
+    """按天的事务级 advisory 锁：写入路径取共享锁，重建某天时取排他锁，只互斥同一天"""
+    fn = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    for day in sorted(days):
+        conn.execute(text(f"SELECT {fn}(:k, :d)"), {"k": _DAY_LOCK_KEY, "d": day.toordinal()})
+
+
+def rebuild_rollups_on(conn: Connection) -> Dict[str, int]:
+    """由 messages 全量重建所有计数表，返回各表写入行数。conn 须为 autocommit 连接。
+    逐天一个短事务：取该天的排他 advisory 锁（写入路径在 upsert 计数前取同一天的共享锁），
+    删除并重算该天的计数。已 flush 未提交的写入会等重建提交后再叠加自己的增量，不会重复或丢失；
+    其他日期的写入不受影响，不对计数表加表锁。
+    """
+    result = {rollup.model.__tablename__: 0 for rollup in ROLLUPS}
+    bounds = conn.execute(text("SELECT min(timestamp)::date, max(timestamp)::date FROM messages")).one()
+    days = set()
+    if bounds[0] is not None:
+        days.update(bounds[0] + timedelta(days=i) for i in range((bounds[1] - bounds[0]).days + 1))
+    for rollup in ROLLUPS:
+        # 计数表中已无对应消息的日期也要清掉
+        days.update(conn.execute(text(f"SELECT DISTINCT day FROM {rollup.model.__tablename__}")).scalars().all())
+    for day in sorted(days):
+        start = datetime.combine(day, time())
+        params = {"start": start, "end": start + timedelta(days=1)}
+        conn.execute(text("BEGIN"))
+        try:
+            _lock_days(conn, [day], shared=False)
+            for rollup in ROLLUPS:
+                table = rollup.model.__tablename__
+                conn.execute(text(f"DELETE FROM {table} WHERE day = :day"), {"day": day})
+                res = conn.execute(text(f"INSERT INTO {table} ({rollup.key_column}, day, count) {rollup.rebuild_sql}"), params)
+                result[table] += res.rowcount
+            conn.execute(text("COMMIT"))
+        except Exception:
+            conn.execute(text("ROLLBACK"))
+            raise
+    return result
+
+
+def rebuild_rollups() -> Dict[str, int]:
+    """首次上线或数据修复时执行：python monitor.py --rebuild-rollups（可在监控端运行时执行）"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        return rebuild_rollups_on(conn)
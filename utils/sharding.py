@@ -0,0 +1,58 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环：每个节点放置 replicas 个虚拟节点。
+    增删节点时只有落在该节点区间内的键会迁移，其余键的归属保持不变。
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return set(self._nodes)
+
+    def add(self, node: str):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.replicas):
+            h = _hash(f"{node}#{i}")
+            if h in self._owners:
+                continue
+            self._owners[h] = node
+            bisect.insort(self._keys, h)
+
+    def remove(self, node: str):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        self._keys = [h for h in self._keys if self._owners[h] != node]
+        self._owners = {h: n for h, n in self._owners.items() if n != node}
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[self._keys[idx]]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """返回 {node: [key...]}"""
+        out: Dict[str, List[str]] = {n: [] for n in self._nodes}
+        for key in keys:
+            node = self.get(key)
+            if node is not None:
+                out[node].append(key)
+        return out
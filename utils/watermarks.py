@@ -0,0 +1,141 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from model import ChannelWatermark, engine
+
+
+class WatermarkTracker:
+    """频道水位：各频道“该 id 及之前的消息都已落库或确认丢弃”的最大消息 id，定期批量写回数据库（只增不减）。
+
+    消息开始处理时 begin，写入成功（或按规则丢弃）后 done，写入失败时 fail。水位只推进到
+    “最小未完成 id”之前：仍在写入队列中的旧消息、写入失败的消息都会挡住水位，
+    崩溃或重启后补抓会从它们开始重新处理（写入按链接 upsert，重复处理无副作用）。
+    补抓期间用 hold 占住起点，避免实时消息先落库把水位推过尚未拉取的补抓区间。
+    """
+
+    def __init__(self):
+        self.marks: Dict[int, int] = {}
+        self._dirty: Dict[int, int] = {}
+        # {chat_id: Counter(处理中的消息 id)}
+        self._pending: Dict[int, Counter] = {}
+        # {chat_id: 已完成但因前面有未完成消息而暂不能计入水位的 id}
+        self._done: Dict[int, Set[int]] = {}
+        # {chat_id: 写入失败的 id}（本进程内不再推进到其之后）
+        self._failed: Dict[int, Set[int]] = {}
+
+    def load(self):
+        with Session(engine) as session:
+            rows = session.query(ChannelWatermark.chat_id, ChannelWatermark.last_message_id).all()
+        for chat_id, last_id in rows:
+            self.marks[int(chat_id)] = max(self.marks.get(int(chat_id), 0), int(last_id or 0))
+        return len(rows)
+
+    def get(self, chat_id: int) -> Optional[int]:
+        return self.marks.get(chat_id)
+
+    def begin(self, chat_id: Optional[int], message_id: Optional[int]):
+        if not chat_id or not message_id:
+            return
+        self._pending.setdefault(chat_id, Counter())[message_id] += 1
+
+    def hold(self, chat_id: Optional[int], after_id: int) -> Optional[int]:
+        """补抓开始前调用：水位不越过 after_id，直到 release；返回占位 id"""
+        if not chat_id:
+            return None
+        self.begin(chat_id, after_id + 1)
+        return after_id + 1
+
+    def release(self, chat_id: Optional[int], hold_id: Optional[int], ok: bool = True):
+        """补抓结束；ok=False（补抓中途失败）时保留占位，本进程内水位不再越过缺口"""
+        if hold_id is None:
+            return
+        if ok:
+            self._finish(chat_id, hold_id, record=False)
+        else:
+            self.fail(chat_id, hold_id)
+
+    def done(self, chat_id: Optional[int], message_id: Optional[int]):
+        if not chat_id or not message_id:
+            return
+        failed = self._failed.get(chat_id)
+        if failed:
+            failed.discard(message_id)
+        self._finish(chat_id, message_id, record=True)
+
+    def fail(self, chat_id: Optional[int], message_id: Optional[int]):
+        if not chat_id or not message_id:
+            return
+        pending = self._pending.get(chat_id)
+        if pending and pending[message_id] > 0:
+            self._release_pending(pending, message_id)
+        self._failed.setdefault(chat_id, set()).add(message_id)
+
+    @staticmethod
+    def _release_pending(pending: Counter, message_id: int):
+        pending[message_id] -= 1
+        if pending[message_id] <= 0:
+            del pending[message_id]
+
+    def _finish(self, chat_id: int, message_id: int, record: bool):
+        pending = self._pending.get(chat_id)
+        if pending and pending[message_id] > 0:
+            self._release_pending(pending, message_id)
+        done = self._done.setdefault(chat_id, set())
+        if record:
+            done.add(message_id)
+        blockers = list(pending or ()) + list(self._failed.get(chat_id) or ())
+        floor = min(blockers) if blockers else None
+        ready = [i for i in done if floor is None or i < floor]
+        if ready:
+            done.difference_update(ready)
+            self.mark(chat_id, max(ready))
+
+    def mark(self, chat_id: Optional[int], message_id: Optional[int]):
+        if not chat_id or not message_id:
+            return
+        if message_id > self.marks.get(chat_id, 0):
+            self.marks[chat_id] = message_id
+            self._dirty[chat_id] = message_id
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await asyncio.to_thread(_save_marks, dirty)
+        except Exception as e:
+            # 写回失败时保留待写，下次重试
+            for chat_id, mid in dirty.items():
+                if mid > self._dirty.get(chat_id, 0):
+                    self._dirty[chat_id] = mid
+            print(f"⚠️ 保存频道水位失败: {e}")
+
+    async def run(self, interval: float = 5.0):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+def _save_marks(marks: Dict[int, int]):
+    now = datetime.utcnow()
+    rows = [{'chat_id': cid, 'last_message_id': mid, 'updated_at': now} for cid, mid in marks.items()]
+    with Session(engine) as session:
+        stmt = pg_insert(ChannelWatermark).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChannelWatermark.chat_id],
+            set_={
+                'last_message_id': func.greatest(ChannelWatermark.last_message_id, stmt.excluded.last_message_id),
+                'updated_at': stmt.excluded.updated_at,
+            },
+        )
+        session.execute(stmt)
+        session.commit()
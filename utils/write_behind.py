@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from model import engine
+from utils.message_store import upsert_messages_batch
+from utils.metrics import STAGE_SECONDS, MESSAGES_WRITTEN, WRITE_FAILED
+
+
+class WriteBehindWriter:
+    """监控端异步写入队列：事件处理器只负责入队，后台任务按“条数或时间”攒批，
+    在线程中以单事务批量 upsert，避免数据库往返阻塞 Telethon 事件循环。
+    """
+
+    def __init__(self, maxsize: int = 10000, batch_size: int = 200, flush_interval: float = 0.5,
+                 on_written: Optional[Callable[[List[Any], List[Any]], None]] = None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # 每批处理完成后回调 on_written(已落库或丢弃的 source 列表, 写入失败的 source 列表)，用于推进频道水位
+        self.on_written = on_written
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._leftover: List[Tuple[dict, datetime.datetime, Any]] = []
+        # 运行指标
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.flushed_total = 0
+        self.inserted_total = 0
+        self.updated_total = 0
+        self.failed_total = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'queue_maxsize': self.queue.maxsize,
+            'last_batch_size': self.last_batch_size,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+            'max_flush_ms': round(self.max_flush_ms, 1),
+            'flushed_total': self.flushed_total,
+            'inserted_total': self.inserted_total,
+            'updated_total': self.updated_total,
+            'failed_total': self.failed_total,
+        }
+
+    async def put(self, parsed_data: dict, timestamp: datetime.datetime, source: Any = None):
+        """入队；队列满时等待（反压），不丢消息"""
+        await self.queue.put((parsed_data, timestamp, source))
+
+    async def put_dropped(self, source: Any):
+        """丢弃的消息也按入队顺序经过写入队列，与前面仍待写入的消息一起完成后才推进水位"""
+        await self.queue.put((None, None, source))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def close(self):
+        """停止后台任务并把队列中剩余的消息全部落库"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        if self._leftover:
+            await self._flush(self._leftover)
+            self._leftover = []
+        while not self.queue.empty():
+            await self._flush(self._drain_nowait(self.batch_size))
+
+    def _drain_nowait(self, limit: int) -> List[Tuple[dict, datetime.datetime, Any]]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 阻塞等待第一条，然后在 flush_interval 内尽量攒满一批
+            batch = [await self.queue.get()]
+            try:
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    batch.extend(self._drain_nowait(self.batch_size - len(batch)))
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # 攒批途中被关闭：已出队的消息交给 close() 落库
+                self._leftover = batch
+                raise
+            # 写入过程不受取消影响，close() 会等待其完成
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+
+    async def _flush(self, batch: List[Tuple[dict, datetime.datetime, Any]]):
+        if not batch:
+            return
+        started = time.perf_counter()
+        dropped = [item for item in batch if item[0] is None]
+        batch = [item for item in batch if item[0] is not None]
+        failed = []
+        try:
+            results = await asyncio.to_thread(_write_batch, [(p, ts) for p, ts, _ in batch]) if batch else []
+            written = batch
+        except Exception as e:
+            # 整批失败时逐条重试，避免单条坏数据拖垮整批
+            print(f"⚠️ 批量写入失败，改为逐条写入: {e}")
+            results = []
+            written = []
+            for item in batch:
+                try:
+                    results.extend(await asyncio.to_thread(_write_batch, [item[:2]]))
+                    written.append(item)
+                except Exception as ie:
+                    failed.append(item)
+                    self.failed_total += 1
+                    WRITE_FAILED.inc(item[0].get('channel') or '')
+                    print(f"❌ 写入失败，已丢弃 | 来源: {item[2]} | 频道: {item[0].get('channel', '')} | 标题: {item[0].get('title', '')} | {ie}")
+        elapsed = time.perf_counter() - started
+        elapsed_ms = elapsed * 1000
+        if batch:
+            STAGE_SECONDS.observe(elapsed, 'db_upsert')
+        for (parsed, _, _), result in zip(written, results):
+            MESSAGES_WRITTEN.inc(result, parsed.get('channel') or '')
+        if self.on_written is not None:
+            try:
+                # 写入失败的消息单独上报：水位不越过它们，重启后补抓会重新处理
+                done = [src for _, _, src in written + dropped if src is not None]
+                self.on_written(done, [src for _, _, src in failed if src is not None])
+            except Exception as e:
+                print(f"⚠️ 写入回调失败: {e}")
+        if not batch:
+            return
+        inserted = results.count('inserted')
+        updated = results.count('updated')
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.flushed_total += len(results)
+        self.inserted_total += inserted
+        self.updated_total += updated
+        print(f"💾 批量写入 {len(batch)} 条（新增 {inserted} / 覆盖更新 {updated}），耗时 {elapsed_ms:.0f}ms，队列积压 {self.queue_depth}")
+
+
+def _write_batch(batch: List[Tuple[dict, datetime.datetime]]) -> List[str]:
+    with Session(engine) as session:
+        try:
+            return upsert_messages_batch(session, batch)
+        except Exception:
+            session.rollback()
+            raise
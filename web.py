@@ -1,18 +1,33 @@
 import streamlit as st
 from sqlalchemy.orm import Session
-from model import Message, engine
+from model import Message, NetdiskDailyCount, TagDailyCount, engine
+from utils.counts import count_messages
+from utils.message_query import LIST_COLUMNS, apply_filters, list_rows, load_details, time_range_since
+from utils.netdisk import netdisk_names, ordered_links
+from utils.result_cache import page_cache
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from collections import Counter
-from sqlalchemy import or_, cast, String
+from sqlalchemy import func, tuple_
 from sqlalchemy.exc import OperationalError
+import hashlib as _hashlib
+import html
 import json
+import re
 import os
 import math
 
 # 统一在顶部定义分页大小，供后续函数默认参数使用
 PAGE_SIZE = 50
 
+# 游标分页状态：page_cursor 为上一页最后一条的 (timestamp, id)，cursor_stack 保存之前各页的起始游标供“上一页”回退
+def reset_pagination():
+    st.session_state['page_num'] = 1
+    st.session_state['page_cursor'] = None
+    st.session_state['cursor_stack'] = []
+
+if 'page_num' not in st.session_state:
+    reset_pagination()
+
 # 初始化session_state用于标签筛选
 if 'selected_tags' not in st.session_state:
     st.session_state['selected_tags'] = []
@@ -35,34 +50,28 @@ time_range = st.sidebar.selectbox(
     ["最近24小时", "最近7天", "最近30天", "全部"]
 )
 
-# 标签选择（标签云，显示数量，降序）
+# 标签选择（标签云，显示数量，降序）：读按天计数表，覆盖全部时间
 @st.cache_data(ttl=300)
 def get_tag_data():
-    try:
+    total = func.sum(TagDailyCount.count)
+    def _query():
         with Session(engine) as session:
-            cutoff = datetime.now() - timedelta(days=90)
-            all_tags = (
-                session.query(Message.tags)
-                .filter(Message.timestamp >= cutoff)
-                .limit(200000)
+            return (
+                session.query(TagDailyCount.tag, total)
+                .group_by(TagDailyCount.tag)
+                .having(total > 0)
+                .order_by(total.desc())
                 .all()
             )
+    try:
+        tag_items = _query()
     except OperationalError:
         engine.dispose()
         try:
-            with Session(engine) as session:
-                cutoff = datetime.now() - timedelta(days=90)
-                all_tags = (
-                    session.query(Message.tags)
-                    .filter(Message.timestamp >= cutoff)
-                    .limit(200000)
-                    .all()
-                )
+            tag_items = _query()
         except Exception:
-            all_tags = []
-    tag_list = [tag for tags in all_tags for tag in (tags[0] if tags[0] else [])]
-    tag_counter = Counter(tag_list)
-    tag_items = sorted(tag_counter.items(), key=lambda x: x[1], reverse=True)
+            tag_items = []
+    tag_items = [(tag, int(count)) for tag, count in tag_items]
     tag_options = [f"{tag} ({count})" for tag, count in tag_items]
     tag_map = {f"{tag} ({count})": tag for tag, count in tag_items}
     return tag_options, tag_map, {tag: count for tag, count in tag_items}
@@ -81,38 +90,30 @@ selected_tags = [tag_map[label] for label in selected_tag_labels]
 # 同步session_state
 st.session_state['selected_tags'] = selected_tags
 
-# 动态获取网盘类型（近90天，带计数），并允许多选
+# 动态获取网盘类型（近90天，带计数），并允许多选：读按天计数表
 @st.cache_data(ttl=300)
 def get_netdisk_data():
-    try:
+    total = func.sum(NetdiskDailyCount.count)
+    def _query():
         with Session(engine) as session:
-            cutoff = datetime.now() - timedelta(days=90)
-            rows = (
-                session.query(Message.links)
-                .filter(Message.timestamp >= cutoff)
-                .limit(200000)
+            cutoff = (datetime.now() - timedelta(days=90)).date()
+            return (
+                session.query(NetdiskDailyCount.netdisk, total)
+                .filter(NetdiskDailyCount.day >= cutoff)
+                .group_by(NetdiskDailyCount.netdisk)
+                .having(total > 0)
+                .order_by(total.desc())
                 .all()
             )
+    try:
+        items = _query()
     except OperationalError:
         engine.dispose()
         try:
-            with Session(engine) as session:
-                cutoff = datetime.now() - timedelta(days=90)
-                rows = (
-                    session.query(Message.links)
-                    .filter(Message.timestamp >= cutoff)
-                    .limit(200000)
-                    .all()
-                )
+            items = _query()
         except Exception:
-            rows = []
-    keys = []
-    for r in rows:
-        links = r[0] if r else None
-        if isinstance(links, dict):
-            keys.extend(list(links.keys()))
-    counter = Counter(keys)
-    items = sorted(counter.items(), key=lambda x: x[1], reverse=True)
+            items = []
+    items = [(k, int(v)) for k, v in items]
     options = [f"{k} ({v})" for k, v in items]
     key_map = {f"{k} ({v})": k for k, v in items}
     return options, key_map, {k: v for k, v in items}
@@ -145,172 +146,142 @@ col_sa, col_sb = st.sidebar.columns([1, 1])
 with col_sa:
     if st.button("搜索", key="do_search"):
         st.session_state['search_query'] = _search_input.strip()
-        st.session_state['page_num'] = 1
+        reset_pagination()
         st.rerun()
 with col_sb:
     if st.button("清空", key="clear_search"):
         st.session_state['search_query'] = ''
-        st.session_state['page_num'] = 1
+        reset_pagination()
         st.rerun()
 if st.session_state.get('search_query'):
     st.sidebar.caption(f"当前搜索：{st.session_state['search_query']}")
 
-# 在时间范围选择下方展示“按时间范围估算总页数/总条数”（忽略标签/网盘/关键词过滤，仅基于时间与白名单）
+# 快速渲染：整页输出为一个 HTML 块（<details> 折叠），替代逐条 st.expander，慢速客户端上明显更快
+html_mode = st.sidebar.toggle("快速渲染（单块 HTML）", key='html_mode')
+
+# 侧边栏展示总条数/总页数：标准时间范围读按天计数表（精确），组合筛选用规划器估算，结果小时再精确计数
 @st.cache_data(ttl=60)
-def estimate_total_pages_by_time_range(_time_range: str, page_size: int = PAGE_SIZE):
-    def _apply_time_filter(q):
-        if _time_range == "最近24小时":
-            return q.filter(Message.timestamp >= datetime.now() - timedelta(days=1))
-        elif _time_range == "最近7天":
-            return q.filter(Message.timestamp >= datetime.now() - timedelta(days=7))
-        elif _time_range == "最近30天":
-            return q.filter(Message.timestamp >= datetime.now() - timedelta(days=30))
-        return q
-    whitelist_like_local = or_(
-        cast(Message.links, String).ilike('%pan.baidu.com/s/%'),
-        cast(Message.links, String).ilike('%pan.quark.cn/s/%'),
-        cast(Message.links, String).ilike('%aliyundrive.com/s/%'),
-        cast(Message.links, String).ilike('%115.com/s/%'),
-        cast(Message.links, String).ilike('%pan.xunlei.com/s/%'),
-        cast(Message.links, String).ilike('%drive.uc.cn/s/%'),
-        cast(Message.links, String).ilike('%www.123pan.com/s/%'),
-        cast(Message.links, String).ilike('%www.123684.com/s/%'),
-        cast(Message.links, String).ilike('%cloud.189.cn/t/%'),
-        cast(Message.links, String).ilike('%caiyun.139.com/w/i/%'),
-    )
-    try:
+def get_total_count(_time_range: str, tags: tuple, netdisks: tuple, search: str, page_size: int = PAGE_SIZE):
+    def _count():
         with Session(engine) as session:
-            base = session.query(Message.id)
-            base = _apply_time_filter(base)
-            base = base.filter(Message.links.isnot(None)).filter(whitelist_like_local)
-            total_count = base.count()
+            since = time_range_since(_time_range)
+            query = apply_filters(session.query(Message.id), since, tags, netdisks, search)
+            return count_messages(session, query, since, tags, netdisks, search)
+    try:
+        total_count, exact = _count()
     except OperationalError:
         engine.dispose()
         try:
-            with Session(engine) as session:
-                base = session.query(Message.id)
-                base = _apply_time_filter(base)
-                base = base.filter(Message.links.isnot(None)).filter(whitelist_like_local)
-                total_count = base.count()
+            total_count, exact = _count()
         except Exception:
-            return None, None
+            return None, None, False
     pages = max(1, math.ceil(total_count / page_size)) if total_count else 1
-    return total_count, pages
+    return total_count, pages, exact
 
-_total_count, _total_pages = estimate_total_pages_by_time_range(time_range, PAGE_SIZE)
+_total_count, _total_pages, _total_exact = get_total_count(
+    time_range, tuple(selected_tags), tuple(selected_netdisks), st.session_state.get('search_query', '').strip(), PAGE_SIZE
+)
 if _total_count is not None:
-    st.sidebar.caption(f"按时间范围估算：共 {_total_count} 条，约 {_total_pages} 页")
+    _prefix = "共" if _total_exact else "约"
+    st.sidebar.caption(f"{_prefix} {_total_count} 条，{_prefix} {_total_pages} 页")
 else:
-    st.sidebar.caption("按时间范围估算总页数：暂不可用")
+    st.sidebar.caption("总页数：暂不可用")
 
-# 分页参数（移除重复定义，仅保留页码状态）
-if 'page_num' not in st.session_state:
-    st.session_state['page_num'] = 1
-page_num = st.session_state['page_num']
+# 筛选条件签名：同时作为跨会话结果缓存的键
+_filter_state = {
+    'time_range': time_range,
+    'selected_tags': sorted(st.session_state.get('selected_tags', [])),
+    'selected_netdisks': sorted(st.session_state.get('selected_netdisks', [])),
+    'search_query': st.session_state.get('search_query', ''),
+}
+_filter_sig = _hashlib.md5(json.dumps(_filter_state, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+_filter_changed = st.session_state.get('filter_sig') != _filter_sig
+if _filter_changed:
+    # 筛选条件变化：游标属于旧结果集，回到第一页
+    reset_pagination()
+    st.session_state['filter_sig'] = _filter_sig
 
-# 构建查询（服务端分页 + SQL端过滤）
-with Session(engine) as session:
-    query = session.query(Message)
-    # 应用时间范围过滤
-    if time_range == "最近24小时":
-        query = query.filter(Message.timestamp >= datetime.now() - timedelta(days=1))
-    elif time_range == "最近7天":
-        query = query.filter(Message.timestamp >= datetime.now() - timedelta(days=7))
-    elif time_range == "最近30天":
-        query = query.filter(Message.timestamp >= datetime.now() - timedelta(days=30))
-
-    # 仅展示包含白名单网盘链接的消息（SQL 端粗过滤 + JSON 串匹配）
-    whitelist_like = or_(
-        cast(Message.links, String).ilike('%pan.baidu.com/s/%'),
-        cast(Message.links, String).ilike('%pan.quark.cn/s/%'),
-        cast(Message.links, String).ilike('%aliyundrive.com/s/%'),
-        cast(Message.links, String).ilike('%115.com/s/%'),
-        cast(Message.links, String).ilike('%pan.xunlei.com/s/%'),
-        cast(Message.links, String).ilike('%drive.uc.cn/s/%'),
-        cast(Message.links, String).ilike('%www.123pan.com/s/%'),
-        cast(Message.links, String).ilike('%www.123684.com/s/%'),
-        cast(Message.links, String).ilike('%cloud.189.cn/t/%'),
-        cast(Message.links, String).ilike('%caiyun.139.com/w/i/%'),
-    )
-    query = query.filter(Message.links.isnot(None)).filter(whitelist_like)
-
-    # 应用标签过滤
-    if selected_tags:
-        filters = [Message.tags.any(tag) for tag in selected_tags]
-        query = query.filter(or_(*filters))
-    # 应用关键词模糊搜索（AND 组合多关键词，OR 匹配多个字段）
-    _q = st.session_state.get('search_query', '').strip()
-    if _q:
-        kws = [k for k in _q.split() if k]
-        for kw in kws:
-            pattern = f"%{kw}%"
-            query = query.filter(
-                or_(
-                    Message.title.ilike(pattern),
-                    Message.description.ilike(pattern),
-                    Message.channel.ilike(pattern),
-                    Message.source.ilike(pattern),
-                )
-            )
+# 分页参数：页码仅用于展示，实际定位依赖游标
+page_num = st.session_state['page_num']
+page_cursor = st.session_state.get('page_cursor')
+
+# 构建查询（服务端分页 + SQL端过滤）；结果按 (筛选签名, 游标) 进程内共享，有新写入时才重新查询
+def _load_page():
+    with Session(engine) as session:
+        query = apply_filters(
+            session.query(*LIST_COLUMNS),
+            time_range_since(time_range),
+            selected_tags,
+            selected_netdisks,
+            st.session_state.get('search_query', '').strip(),
+        )
+        # 基于 (timestamp, id) 游标的分页：深页与首页代价相同，监控端新写入不会让后续页错位；LIMIT+1 判断是否有下一页
+        if page_cursor is not None:
+            query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(*page_cursor))
+        return list_rows(query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(PAGE_SIZE + 1))
+
+# 相对时间范围（最近24小时等）的起点随时间推移，按分钟归入缓存键，避免长期命中过期窗口
+_time_bucket = datetime.now().strftime('%Y%m%d%H%M') if time_range_since(time_range) else ''
+def _load_top():
+    """当前筛选条件下最新一条的 (timestamp, id)，非第一页时作为增量轮询的起点"""
+    with Session(engine) as session:
+        query = apply_filters(
+            session.query(Message.timestamp, Message.id),
+            time_range_since(time_range),
+            selected_tags,
+            selected_netdisks,
+            st.session_state.get('search_query', '').strip(),
+        )
+        row = query.order_by(Message.timestamp.desc(), Message.id.desc()).first()
+        return tuple(row) if row else None
 
-    # 网盘类型：将筛选条件下推到 SQL（避免 Python 侧全量取数）
-    if selected_netdisks:
-        # 兼容不同来源的网盘类型名称，优先使用域名模式匹配
-        type_patterns = {
-            '夸克网盘': ['%pan.quark.cn/s/%'],
-            '百度网盘': ['%pan.baidu.com/s/%'],
-            '阿里云盘': ['%aliyundrive.com/s/%', '%www.aliyundrive.com/s/%', '%www.alipan.com/s/%', '%alipan.com/s/%'],
-            '迅雷网盘': ['%pan.xunlei.com/s/%'],
-            'UC网盘': ['%drive.uc.cn/s/%'],
-            '115网盘': ['%115.com/s/%'],
-            '123网盘': ['%www.123pan.com/s/%', '%www.123684.com/s/%'],
-            '天翼云盘': ['%cloud.189.cn/t/%'],
-            '移动云盘': ['%caiyun.139.com/w/i/%'],
-        }
-        nd_filters = []
-        for nd in selected_netdisks:
-            pats = type_patterns.get(nd, [])
-            if pats:
-                nd_filters.append(or_(*[cast(Message.links, String).ilike(p) for p in pats]))
-            # 额外增加对 JSON 文本包含中文键名的兜底匹配
-            nd_filters.append(cast(Message.links, String).ilike(f"%{nd}%"))
-        query = query.filter(or_(*nd_filters))
-
-    # 基于 LIMIT+1 的分页，避免昂贵的 count()
-    if page_num < 1:
-        page_num = 1
-        st.session_state['page_num'] = 1
-    start_idx = (page_num - 1) * PAGE_SIZE
+try:
+    # 整页加载时的写入水位：没有任何写入时增量轮询直接返回
+    _page_mark = page_cache.refresh_watermark(engine)
+    rows = page_cache.get((_filter_sig, _time_bucket, page_cursor), engine, _load_page)
+    # 增量轮询的起点取自页面查询本身（第一页的首行），而不是另读的 max(id)：两次读取之间提交的消息
+    # 不会既出现在页面里又被算作新消息。按 (timestamp, id) 比较，按链接覆盖更新（时间戳刷新）的消息也算新消息
+    if page_cursor is None:
+        _page_since = (rows[0].timestamp, rows[0].id) if rows else None
+    else:
+        _page_since = page_cache.get((_filter_sig, _time_bucket, 'top'), engine, _load_top)
+    _poll_enabled = True
+except OperationalError:
+    engine.dispose()
+    _page_mark, _page_since, _poll_enabled = None, None, False
+    rows = []
+has_next = len(rows) > PAGE_SIZE
+messages_page = rows[:PAGE_SIZE]
+
+def get_details(ids):
+    """实际展示的行的 description / links：一次按主键批量读取，同样进程内共享"""
+    ids = tuple(sorted(ids))
+    if not ids:
+        return {}
+
+    def _load():
+        with Session(engine) as session:
+            return load_details(session, ids)
     try:
-        rows = (
-            query.order_by(Message.timestamp.desc())
-            .offset(start_idx)
-            .limit(PAGE_SIZE + 1)
-            .all()
-        )
+        return page_cache.get(('details', ids), engine, _load)
     except OperationalError:
         engine.dispose()
-        rows = []
-    has_next = len(rows) > PAGE_SIZE
-    messages_page = rows[:PAGE_SIZE]
+        return {}
 
-# 显示消息列表（分页后）
-for msg in messages_page:
-    # 标题行保留网盘标签，用特殊符号区分
-    if msg.links:
-        netdisk_tags = " ".join([f"🔵[{name}]" for name in msg.links.keys()])
-    else:
-        netdisk_tags = ""
+def render_message(msg, details):
+    # 标题行保留网盘标签，用特殊符号区分（由 netdisk_types 得出，无需读取 links）
+    netdisk_tags = " ".join([f"🔵[{name}]" for name in netdisk_names(msg.netdisk_types)])
     # 数据库现在存储的是北京时间，直接使用即可
     local_ts = msg.timestamp
     expander_title = f"{msg.title} - 🕒{local_ts.strftime('%Y-%m-%d %H:%M:%S')}  {netdisk_tags}"
+    description, links = details.get(msg.id, (None, None))
     with st.expander(expander_title):
-        if msg.description:
-            st.markdown(msg.description)
-        if msg.links:
+        if description:
+            st.markdown(description)
+        if links:
             link_str = " ".join([
                 f"<a href='{link}' target='_blank'><span class='netdisk-tag'>{name}</span></a>"
-                for name, link in msg.links.items()
+                for name, link in ordered_links(links).items()
             ])
             st.markdown(link_str, unsafe_allow_html=True)
         # 条目标签标签区（仅展示，不可点击，保留样式）
@@ -320,18 +291,135 @@ for msg in messages_page:
                 tag_html += f"<span class='tag-btn'>#{tag}</span>"
             st.markdown(tag_html, unsafe_allow_html=True)
 
+_URL_RE = re.compile(r"https?://[^\s<>\"']+")
+
+def _safe_href(url) -> str:
+    url = str(url or '')
+    return html.escape(url, quote=True) if url.startswith(('http://', 'https://')) else '#'
+
+def _message_html(msg, details) -> str:
+    netdisk_tags = " ".join(f"🔵[{name}]" for name in netdisk_names(msg.netdisk_types))
+    summary = f"{html.escape(msg.title or '')} - 🕒{msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')}  {netdisk_tags}"
+    description, links = details.get(msg.id, (None, None))
+    parts = []
+    if description:
+        # 先转义再识别网址；换行转为 <br>，整块不含空行，避免被当作 Markdown 段落拆开
+        body = _URL_RE.sub(lambda m: f"<a href='{m.group(0)}' target='_blank'>{m.group(0)}</a>", html.escape(description))
+        parts.append(f"<div class='msg-desc'>{'<br>'.join(line for line in body.splitlines() if line.strip())}</div>")
+    if links:
+        parts.append("<div>" + " ".join(
+            f"<a href='{_safe_href(link)}' target='_blank'><span class='netdisk-tag'>{html.escape(name)}</span></a>"
+            for name, link in ordered_links(links).items()
+        ) + "</div>")
+    if msg.tags:
+        parts.append("<div>" + "".join(f"<span class='tag-btn'>#{html.escape(tag)}</span>" for tag in msg.tags) + "</div>")
+    return f"<details class='msg-item'><summary>{summary}</summary>{''.join(parts)}</details>"
+
+def get_rows_html(rows) -> str:
+    """整页 HTML：按结果集（id 序列）哈希进程内缓存，随写入水位一起失效"""
+    ids = [m.id for m in rows]
+    key = ('html', _hashlib.sha1(','.join(map(str, ids)).encode('ascii')).hexdigest())
+
+    def _build():
+        details = get_details(ids)
+        return "<div class='msg-list'>" + "".join(_message_html(m, details) for m in rows) + "</div>"
+    try:
+        return page_cache.get(key, engine, _build)
+    except OperationalError:
+        engine.dispose()
+        return _build()
+
+def render_rows(rows):
+    if not rows:
+        return
+    if html_mode:
+        st.markdown(get_rows_html(rows), unsafe_allow_html=True)
+        return
+    details = get_details(m.id for m in rows)
+    for msg in rows:
+        render_message(msg, details)
+
+REFRESH_CONFIG = "refresh_config.json"
+
+def get_refresh_interval(default: int = 60) -> int:
+    try:
+        if os.path.exists(REFRESH_CONFIG):
+            with open(REFRESH_CONFIG, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                val = int(data.get('interval_sec', default))
+                return max(10, min(3600, val))
+    except Exception:
+        pass
+    return default
+
+interval = get_refresh_interval()
+
+# 增量轮询：只在片段内定时查询比整页加载时最新一条更新的消息（同一筛选条件），不重跑整页、不占用睡眠线程；
+# 第一页把新消息插在列表顶部，其他页只提示数量
+@st.fragment(run_every=interval)
+def poll_new_messages():
+    if not _poll_enabled:
+        return
+    since = _page_since
+    try:
+        mark = page_cache.refresh_watermark(engine)
+        if mark == _page_mark:
+            return
+
+        def _load_new():
+            with Session(engine) as session:
+                query = apply_filters(
+                    session.query(*LIST_COLUMNS),
+                    time_range_since(time_range),
+                    selected_tags,
+                    selected_netdisks,
+                    st.session_state.get('search_query', '').strip(),
+                )
+                # 页面为空（筛选结果为空）时，之后出现的所有消息都是新消息
+                if since is not None:
+                    query = query.filter(tuple_(Message.timestamp, Message.id) > tuple_(*since))
+                return list_rows(
+                    query.order_by(Message.timestamp.desc(), Message.id.desc())
+                    .limit(PAGE_SIZE + 1)
+                )
+
+        new_rows = page_cache.get((_filter_sig, _time_bucket, 'new', since), engine, _load_new)
+    except OperationalError:
+        engine.dispose()
+        return
+    if not new_rows:
+        return
+    n = f"{PAGE_SIZE}+" if len(new_rows) > PAGE_SIZE else str(len(new_rows))
+    st.markdown(f"<span class='new-badge'>🆕 {n} 条新消息</span>", unsafe_allow_html=True)
+    if page_cursor is None:
+        render_rows(new_rows[:PAGE_SIZE])
+    elif st.button("回到第一页查看", key='goto_new'):
+        reset_pagination()
+        st.rerun(scope="app")
+
+st.caption(f"每{interval}秒检查一次新消息")
+poll_new_messages()
+
+# 显示消息列表（分页后）
+render_rows(messages_page)
+
 # 显示分页信息和跳转控件（按钮和页码信息同一行居中）
 col1, col2, col3 = st.columns([1,2,1])
 with col1:
     if st.button('上一页', disabled=page_num==1, key='prev_page'):
+        stack = st.session_state['cursor_stack']
+        st.session_state['page_cursor'] = stack.pop() if stack else None
         st.session_state['page_num'] = max(1, page_num-1)
         st.rerun()
 with col2:
     hint = "（已到最后一页）" if not has_next else ""
-    extra = f" / 约 {_total_pages} 页（按时间范围）" if _total_pages else ""
+    extra = f" / {'共' if _total_exact else '约'} {_total_pages} 页" if _total_pages else ""
     st.markdown(f"<div style='text-align:center;line-height:38px;'>当前第 {page_num} 页 {hint}{extra}</div>", unsafe_allow_html=True)
 with col3:
     if st.button('下一页', disabled=(not has_next), key='next_page'):
+        last = messages_page[-1]
+        st.session_state['cursor_stack'].append(page_cursor)
+        st.session_state['page_cursor'] = (last.timestamp, last.id)
         st.session_state['page_num'] = page_num + 1
         st.rerun()
 
@@ -344,63 +432,18 @@ if 'tag_click' in st.session_state and st.session_state['tag_click']:
         st.rerun()
     st.session_state['tag_click'] = None
 
-# 添加自动刷新与说明
-st.empty()
-
-# --- 以下保持不变：自动刷新与 CSS ---
+# --- CSS ---
 st.markdown("---")
 
-REFRESH_CONFIG = "refresh_config.json"
-
-def get_refresh_interval(default: int = 60) -> int:
-    try:
-        if os.path.exists(REFRESH_CONFIG):
-            with open(REFRESH_CONFIG, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                val = int(data.get('interval_sec', default))
-                return max(10, min(3600, val))
-    except Exception:
-        pass
-    return default
-
-interval = get_refresh_interval()
-st.markdown(f"页面每{interval}秒自动刷新一次")
-
-import hashlib as _hashlib
-
-_filter_state = {
-    'time_range': time_range,
-    'selected_tags': sorted(st.session_state.get('selected_tags', [])),
-    'selected_netdisks': sorted(st.session_state.get('selected_netdisks', [])),
-    'search_query': st.session_state.get('search_query', ''),
-}
-_filter_sig = _hashlib.md5(json.dumps(_filter_state, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
-_prev_filter_sig = st.session_state.get('filter_sig')
-if _prev_filter_sig != _filter_sig:
-    st.session_state['page_num'] = 1
-    st.session_state['filter_sig'] = _filter_sig
-else:
-    _ui_state = {
-        'time_range': time_range,
-        'selected_tags': sorted(st.session_state.get('selected_tags', [])),
-        'selected_netdisks': sorted(st.session_state.get('selected_netdisks', [])),
-        'page_num': st.session_state.get('page_num', 1),
-        'search_query': st.session_state.get('search_query', ''),
-    }
-    _ui_sig = _hashlib.md5(json.dumps(_ui_state, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
-    _prev_ui_sig = st.session_state.get('ui_sig')
-    if _prev_ui_sig != _ui_sig:
-        st.session_state['ui_sig'] = _ui_sig
-    else:
-        import time as _time
-        _time.sleep(interval)
-        st.rerun()
-
 st.markdown(
     """
     <style>
     .tag-btn { display:inline-block; margin: 2px 6px 2px 0; padding: 2px 8px; background:#f1f5f9; border-radius: 12px; color:#0f172a; font-size:12px; }
     .netdisk-tag { display:inline-block; margin: 2px 6px 2px 0; padding: 2px 8px; background:#ecfeff; border-radius: 12px; color:#155e75; font-size:12px; border:1px solid #a5f3fc; }
+    .msg-item { border:1px solid #e2e8f0; border-radius: 8px; margin: 0 0 8px 0; padding: 8px 12px; }
+    .msg-item summary { cursor:pointer; font-size:15px; }
+    .msg-item .msg-desc { margin: 8px 0; white-space: normal; word-break: break-word; }
+    .new-badge { display:inline-block; margin: 4px 0; padding: 2px 10px; background:#fef3c7; border-radius: 12px; color:#92400e; font-size:13px; font-weight:600; }
     </style>
     """,
     unsafe_allow_html=True,
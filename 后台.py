@@ -5,8 +5,8 @@ from datetime import datetime
 import json
 import os
 from config import settings
-import re
 from sqlalchemy.exc import OperationalError
+from utils.reload_signal import request_reload
 
 st.set_page_config(page_title="后台管理", page_icon="🔧", layout="wide")
 st.title("后台管理")
@@ -121,6 +121,56 @@ with col2:
         st.session_state['clear_string_session_input'] = True
         st.rerun()
 
+# 🧩 附加监听账号（多账号分片）：除上方主账号外的 StringSession，监控端按一致性哈希分配频道
+@st.cache_data(ttl=300)
+def get_extra_sessions():
+    try:
+        with Session(engine) as session:
+            rows = session.query(TelegramConfig).order_by(TelegramConfig.id).all()
+            return [(c.id, c.string_session or "", c.updated_at) for c in rows[1:]]
+    except OperationalError:
+        try:
+            engine.dispose()
+        except Exception:
+            pass
+        return []
+
+with st.expander("附加监听账号（多账号分片）", expanded=False):
+    st.caption("每个账号负责一部分频道，账号失效时其频道自动转交其他账号。增删账号后需重启监控进程生效。")
+    for cfg_id, ss, ss_updated in get_extra_sessions():
+        col1, col2 = st.columns([6, 2])
+        col1.write(f"账号 #{cfg_id}: {ss[:6]}...{ss[-6:]}" if len(ss) > 12 else f"账号 #{cfg_id}: {ss or '（空）'}")
+        if col2.button("删除", key=f"del_extra_ss_{cfg_id}"):
+            with Session(engine) as session:
+                obj = session.query(TelegramConfig).get(cfg_id)
+                if obj:
+                    session.delete(obj)
+                    session.commit()
+            try:
+                get_extra_sessions.clear()
+            except Exception:
+                pass
+            st.rerun()
+    with st.form("add_extra_ss_form"):
+        extra_ss = st.text_area("新增账号 StringSession", height=80)
+        if st.form_submit_button("添加账号"):
+            if not extra_ss.strip():
+                st.warning("StringSession 不能为空")
+            else:
+                with Session(engine) as session:
+                    # 尚无主账号配置时先占位，保证新增的是附加账号
+                    if session.query(TelegramConfig).first() is None:
+                        session.add(TelegramConfig(string_session=None))
+                        session.flush()
+                    session.add(TelegramConfig(string_session=extra_ss.strip()))
+                    session.commit()
+                try:
+                    get_extra_sessions.clear()
+                    get_telegram_cfg.clear()
+                except Exception:
+                    pass
+                st.success("已添加，重启监控进程后生效")
+
 st.markdown("---")
 
 # 🕒 首页自动刷新频率设置（秒）
@@ -219,8 +269,7 @@ for chan_id, chan_username in chans:
                 session.commit()
         # 触发监控端刷新
         try:
-            with open("channels_refresh.flag", "w") as f:
-                f.write("refresh")
+            request_reload("channels")
         except Exception as e:
             st.warning(f"触发刷新失败: {e}")
         try:
@@ -247,8 +296,7 @@ with st.form("add_chan_form"):
                     st.success("添加成功！")
                     # 触发监控端刷新
                     try:
-                        with open("channels_refresh.flag", "w") as f:
-                            f.write("refresh")
+                        request_reload("channels")
                     except Exception as e:
                         st.warning(f"触发刷新失败: {e}")
                     try:
@@ -320,8 +368,7 @@ with Session(engine) as session:
                     st.error(f"保存失败：数据库连接错误，请重试。详情：{e}")
                 # 更改后触发刷新
                 try:
-                    with open("rules_refresh.flag", "w") as f:
-                        f.write("refresh")
+                    request_reload("rules")
                 except Exception as e:
                     st.warning(f"触发规则刷新失败: {e}")
                 st.rerun()
@@ -331,8 +378,7 @@ with Session(engine) as session:
                 session.delete(existing)
                 session.commit()
                 try:
-                    with open("rules_refresh.flag", "w") as f:
-                        f.write("refresh")
+                    request_reload("rules")
                 except Exception as e:
                     st.warning(f"触发规则刷新失败: {e}")
                 st.success("已删除规则")
@@ -396,8 +442,7 @@ with Session(engine) as session:
                                 session.delete(r)
                                 session.commit()
                                 try:
-                                    with open("rules_refresh.flag", "w") as f:
-                                        f.write("refresh")
+                                    request_reload("rules")
                                 except Exception as e:
                                     st.warning(f"触发规则刷新失败: {e}")
                                 st.success("已删除该规则")
@@ -423,6 +468,53 @@ with Session(engine) as session:
                     st.session_state['rules_page_num'] = rules_page_num + 1
                     st.rerun()
 
+# 数据统计：读按天计数表（写入时增量维护），毫秒级返回
+st.header("数据统计")
+
+@st.cache_data(ttl=60)
+def get_rollup_stats(days: int):
+    from sqlalchemy import func
+    from datetime import timedelta
+    from model import NetdiskDailyCount, ChannelDailyCount
+    cutoff = (datetime.now() - timedelta(days=days)).date()
+    try:
+        with Session(engine) as session:
+            def _agg(model, key):
+                total = func.sum(model.count)
+                return [
+                    (k, int(v)) for k, v in session.query(key, total)
+                    .filter(model.day >= cutoff)
+                    .group_by(key)
+                    .having(total > 0)
+                    .order_by(total.desc())
+                    .all()
+                ]
+            return _agg(NetdiskDailyCount, NetdiskDailyCount.netdisk), _agg(ChannelDailyCount, ChannelDailyCount.channel)
+    except OperationalError:
+        try:
+            engine.dispose()
+        except Exception:
+            pass
+        return [], []
+
+stat_days = st.selectbox("统计范围", [1, 7, 30, 3650], index=1, format_func=lambda d: "全部" if d == 3650 else f"最近{d}天")
+nd_stats, chan_stats = get_rollup_stats(stat_days)
+col_nd, col_ch = st.columns(2)
+with col_nd:
+    st.subheader("按网盘类型")
+    if nd_stats:
+        st.table([{"网盘": k, "消息数": v} for k, v in nd_stats])
+    else:
+        st.caption("暂无数据")
+with col_ch:
+    st.subheader("按频道")
+    if chan_stats:
+        st.table([{"频道": k, "消息数": v} for k, v in chan_stats[:50]])
+    else:
+        st.caption("暂无数据")
+
+st.markdown("---")
+
 st.header("监控运行控制（无重启）")
 CONTROL_FILE = "monitor_control.json"
 
@@ -461,46 +553,9 @@ with colr:
 
 st.markdown("---")
 
-STRICT_NETDISK_PATTERNS = {
-    "百度网盘": r"https://pan\.baidu\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?",
-    "夸克网盘": r"https://pan\.quark\.cn/s/[A-Za-z0-9_-]+",
-    "阿里云盘": r"https://www\.aliyundrive\.com/s/[A-Za-z0-9_-]+",
-    "115网盘": r"https://115\.com/s/[A-Za-z0-9_-]+",
-    "迅雷网盘": r"https://pan\.xunlei\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?(?:#)?",
-    "UC网盘": r"https://drive\.uc\.cn/s/[A-Za-z0-9]+(?:\?public=1)?",
-    "123网盘": r"https://www\.123pan\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?|https://www\.123684\.com/s/[A-Za-z0-9_-]+(?:\?pwd=[A-Za-z0-9]+)?",
-    "天翼云盘": r"https://cloud\.189\.cn/t/[A-Za-z0-9]+",
-    "移动云盘": r"https://caiyun\.139\.com/w/i/[A-Za-z0-9]+",
-}
-
-_NOISE_LINES = re.compile(r"^(?:[\uD800-\uDBFF\uDC00-\uDFFF\U00010000-\U0010ffff\W]{0,3})\s*(?:来自|来 自|频道|频 道|群组|群 组|投稿|搜资源)\s*[:：].*$", re.IGNORECASE)
-_HANDLE = re.compile(r"@\w+")
-
-def extract_netdisk_links_strict(text: str) -> dict:
-    links = {}
-    for name, pattern in STRICT_NETDISK_PATTERNS.items():
-        m = re.findall(pattern, text or '')
-        if m:
-            links[name] = m[0] if isinstance(m, list) else m
-    return links
-
-def clean_channel_noise(text: str) -> str:
-    lines = [ln for ln in (text or '').split('\n')]
-    cleaned = []
-    for ln in lines:
-        lns = ln.strip()
-        if not lns:
-            continue
-        if _NOISE_LINES.match(lns):
-            continue
-        lns = _HANDLE.sub('', lns)
-        lns = re.sub(r"\s{2,}", " ", lns).strip()
-        if lns:
-            cleaned.append(lns)
-    return '\n'.join(cleaned)
-
+# 白名单提取与署名清洗与监控端共用同一实现（utils.netdisk）
 st.info("后台已启用网盘白名单与频道署名清洗兜底：非白名单网盘链接或仅含推广署名的内容不会被写入数据库。")
-# 若此文件存在创建消息的入口，请确保在写入前调用：
+# 若此文件存在创建消息的入口，请确保在写入前调用 utils.netdisk 中的：
 # text = clean_channel_noise(text)
 # links = extract_netdisk_links_strict(text)
 # if not links: st.warning("未检测到白名单网盘链接，已忽略写入")